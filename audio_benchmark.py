@@ -0,0 +1,196 @@
+"""
+语音链路基准测试 - 在 WAV 语料上评估 VAD 端点检测与语音识别后端
+用法:
+    python audio_benchmark.py vad <wav 目录>
+    python audio_benchmark.py stt <wav 目录> [后端名 ...]
+
+STT 基准要求每个 xxx.wav 旁有同名 xxx.txt 作为参考文本。
+"""
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "template-agent"))
+from vad import VoiceActivityDetector, Endpointer
+
+
+CHUNK_SAMPLES = 1024  # 与 speech_recognition.Microphone 默认 CHUNK 一致
+CALIBRATION_MS = 300
+
+
+def list_wavs(corpus_dir):
+    """列出目录下所有 WAV 文件"""
+    return sorted(
+        os.path.join(corpus_dir, name)
+        for name in os.listdir(corpus_dir)
+        if name.lower().endswith(".wav")
+    )
+
+
+def load_wav(path):
+    """读取 WAV，返回 (单声道 16 位 PCM 字节, 采样率)"""
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError("仅支持 16 位 WAV")
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    if channels > 1:
+        data = np.frombuffer(data, dtype=np.int16)[::channels].tobytes()
+    return data, rate
+
+
+def benchmark_vad_file(path, hangover_ms=500, frame_ms=30):
+    """模拟麦克风逐块输入，统计端点延迟、裁剪比例和处理耗时"""
+    pcm, rate = load_wav(path)
+    vad = VoiceActivityDetector(rate, frame_ms=frame_ms)
+    calibration_bytes = int(rate * CALIBRATION_MS / 1000) * 2
+    vad.calibrate(pcm[:calibration_bytes])
+
+    # 离线判定最后一个语音帧的位置，作为端点延迟的参照
+    speech = vad.classify(pcm)
+    speech_frames = np.flatnonzero(speech)
+    last_speech_ms = (speech_frames[-1] + 1) * frame_ms if len(speech_frames) else None
+
+    endpointer = Endpointer(vad, hangover_ms=hangover_ms)
+    chunk_bytes = CHUNK_SAMPLES * 2
+    consumed = 0
+    start = time.perf_counter()
+    for offset in range(calibration_bytes, len(pcm), chunk_bytes):
+        chunk = pcm[offset:offset + chunk_bytes]
+        consumed = offset + len(chunk)
+        if endpointer.feed(chunk):
+            break
+    elapsed = time.perf_counter() - start
+
+    utterance = endpointer.utterance()
+    audio_seconds = len(pcm) / 2 / rate
+    endpoint_ms = consumed / 2 / rate * 1000
+
+    return {
+        "file": os.path.basename(path),
+        "audio_seconds": audio_seconds,
+        "speech_detected": endpointer.started,
+        "endpoint_latency_ms": endpoint_ms - last_speech_ms if endpointer.done and last_speech_ms else None,
+        "bytes_in": len(pcm),
+        "bytes_out": len(utterance),
+        "realtime_factor": elapsed / audio_seconds if audio_seconds else 0.0
+    }
+
+
+def benchmark_vad(corpus_dir, hangover_ms=500):
+    """对目录下所有 WAV 运行 VAD 基准并打印汇总"""
+    files = list_wavs(corpus_dir)
+    if not files:
+        print(f"❌ 未找到 WAV 文件: {corpus_dir}")
+        return []
+
+    print("="*60)
+    print(f"VAD 基准测试 (hangover={hangover_ms}ms, {len(files)} 个文件)")
+    print("="*60)
+
+    results = []
+    for path in files:
+        r = benchmark_vad_file(path, hangover_ms=hangover_ms)
+        results.append(r)
+        latency = f"{r['endpoint_latency_ms']:.0f}ms" if r["endpoint_latency_ms"] is not None else "-"
+        print(f"{r['file']}: 时长 {r['audio_seconds']:.2f}s, 端点延迟 {latency}, "
+              f"字节 {r['bytes_in']} -> {r['bytes_out']}, RTF {r['realtime_factor']:.4f}")
+
+    latencies = [r["endpoint_latency_ms"] for r in results if r["endpoint_latency_ms"] is not None]
+    bytes_in = sum(r["bytes_in"] for r in results)
+    bytes_out = sum(r["bytes_out"] for r in results)
+    print(f"\n检出语音: {sum(r['speech_detected'] for r in results)}/{len(results)}")
+    if latencies:
+        print(f"端点延迟: 平均 {np.mean(latencies):.0f}ms, P95 {np.percentile(latencies, 95):.0f}ms")
+    print(f"送识别字节: {bytes_out}/{bytes_in} ({bytes_out / bytes_in * 100:.1f}%)")
+    print(f"平均 RTF: {np.mean([r['realtime_factor'] for r in results]):.4f}")
+    return results
+
+
+def char_error_rate(reference, hypothesis):
+    """字错误率（编辑距离 / 参考长度），忽略空白，适用于中英文"""
+    ref = "".join(reference.lower().split())
+    hyp = "".join(hypothesis.lower().split())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, rc in enumerate(ref, 1):
+        current = [i]
+        for j, hc in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (rc != hc)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark_stt(corpus_dir, backend_names=("google",), language="zh-CN"):
+    """比较各识别后端的延迟与准确率"""
+    import speech_recognition as sr
+    from stt_backends import create_stt_backend
+
+    files = [path for path in list_wavs(corpus_dir) if os.path.exists(os.path.splitext(path)[0] + ".txt")]
+    if not files:
+        print(f"❌ 未找到带参考文本的 WAV 文件: {corpus_dir}")
+        return {}
+
+    summary = {}
+    for name in backend_names:
+        print("="*60)
+        print(f"STT 基准测试: {name} ({len(files)} 个文件)")
+        print("="*60)
+
+        backend = create_stt_backend(
+            name,
+            model_path=os.getenv("VOSK_MODEL_PATH"),
+            model_dir=os.getenv("SPHINX_MODEL_DIR")
+        )
+        load_start = time.perf_counter()
+        backend.load(language)
+        load_seconds = time.perf_counter() - load_start
+
+        latencies = []
+        errors = []
+        failures = 0
+        for path in files:
+            pcm, rate = load_wav(path)
+            with open(os.path.splitext(path)[0] + ".txt", "r", encoding="utf-8") as f:
+                reference = f.read().strip()
+
+            start = time.perf_counter()
+            try:
+                text = backend.recognize(sr.AudioData(pcm, rate, 2), language=language)
+            except (sr.UnknownValueError, sr.RequestError) as e:
+                text = ""
+                failures += 1
+                print(f"{os.path.basename(path)}: 识别失败 {e}")
+            latency = time.perf_counter() - start
+
+            cer = char_error_rate(reference, text)
+            latencies.append(latency)
+            errors.append(cer)
+            print(f"{os.path.basename(path)}: {latency * 1000:.0f}ms, CER {cer:.2%}, 结果: {text}")
+
+        summary[name] = {
+            "load_seconds": load_seconds,
+            "mean_latency": float(np.mean(latencies)),
+            "p95_latency": float(np.percentile(latencies, 95)),
+            "mean_cer": float(np.mean(errors)),
+            "failures": failures
+        }
+        r = summary[name]
+        print(f"\n模型加载: {r['load_seconds']:.2f}s, 平均延迟: {r['mean_latency'] * 1000:.0f}ms, "
+              f"P95: {r['p95_latency'] * 1000:.0f}ms, 平均 CER: {r['mean_cer']:.2%}, 失败: {failures}\n")
+
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("vad", "stt"):
+        print(__doc__)
+    elif sys.argv[1] == "vad":
+        benchmark_vad(sys.argv[2])
+    else:
+        benchmark_stt(sys.argv[2], sys.argv[3:] or ["google"])
@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# 本地缓存根目录
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
 # 模型配置 - 使用智谱 AI GLM-4
 GLM_MODEL = "glm-4-flash"  # GLM-4 Flash 模型，速度快且性能好
 GLM_API_KEY = os.getenv("GLM_API_KEY")
@@ -14,3 +17,11 @@ GLM_API_KEY = os.getenv("GLM_API_KEY")
 MAX_ITERATIONS = 10
 TEMPERATURE = 0.7
 MAX_TOKENS = 4096
+
+# 搜索缓存配置
+SEARCH_CACHE_TTL = 3600  # 搜索结果缓存有效期（秒）
+SEARCH_CACHE_MAX_ENTRIES = 256  # 内存中最多缓存的查询数
+SEARCH_CACHE_DB = None  # 持久化缓存的 SQLite 路径，如 os.path.join(CACHE_DIR, "search.db")；None 表示仅内存
+SEARCH_MAX_CONCURRENCY = 3  # 同时发往 DuckDuckGo 的请求上限，过高容易被限流
+MULTI_SEARCH_SNIPPET_CHARS = 300  # multi_search 每条摘要的最大字符数
+MULTI_SEARCH_MAX_WORKERS = 8  # multi_search 的并发线程上限（命中缓存的查询不占用搜索名额，可多于 SEARCH_MAX_CONCURRENCY）
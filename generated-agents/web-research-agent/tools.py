@@ -1,7 +1,25 @@
 """
 标准工具定义 - 遵循 GLM-4 Tool Calling 协议
 """
+import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from ddgs import DDGS
+from config import (
+    SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_DB,
+    SEARCH_MAX_CONCURRENCY, MULTI_SEARCH_SNIPPET_CHARS, MULTI_SEARCH_MAX_WORKERS
+)
+from cache import TTLCache
+
+# 搜索客户端复用 + 结果缓存（多轮调研中经常重复或微调查询）
+_ddgs = None
+_search_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL, SEARCH_CACHE_DB)
+_search_slots = threading.BoundedSemaphore(SEARCH_MAX_CONCURRENCY)  # 同时发往搜索后端的请求上限
+
+# 多查询结果合并参数
+_RRF_K = 60
+_TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "spm"}
 
 def get_tool_definitions():
     """返回符合 GLM-4 Tool Calling 格式的工具定义"""
@@ -28,6 +46,34 @@ def get_tool_definitions():
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "multi_search",
+                "description": "一次并发搜索多个相关查询，合并去重后返回排序好的结果。需要从多个角度调研同一主题时优先使用",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "queries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "搜索查询关键词列表（建议 2-5 个）"
+                        },
+                        "num_results": {
+                            "type": "integer",
+                            "description": "每个查询返回的结果数量",
+                            "default": 5
+                        },
+                        "max_total": {
+                            "type": "integer",
+                            "description": "合并后最多返回的结果数量",
+                            "default": 15
+                        }
+                    },
+                    "required": ["queries"]
+                }
+            }
+        },
         {
             "type": "function",
             "function": {
@@ -73,6 +119,12 @@ def execute_tool(tool_name, arguments):
     """执行工具调用"""
     if tool_name == "web_search":
         return web_search(arguments.get("query"), arguments.get("num_results", 5))
+    elif tool_name == "multi_search":
+        return multi_search(
+            arguments.get("queries"),
+            arguments.get("num_results", 5),
+            arguments.get("max_total", 15)
+        )
     elif tool_name == "read_file":
         return read_file(arguments.get("file_path"))
     elif tool_name == "write_file":
@@ -81,11 +133,32 @@ def execute_tool(tool_name, arguments):
         return {"error": f"未知工具: {tool_name}"}
 
 
+def _get_search_client():
+    """复用 DuckDuckGo 客户端，避免每次搜索都重建连接"""
+    global _ddgs
+    if _ddgs is None:
+        _ddgs = DDGS()
+    return _ddgs
+
+
+def normalize_query(query):
+    """规范化查询：统一全半角与大小写、合并空白（标点与词序有意义，保持不变）"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
 def web_search(query, num_results=5):
-    """真实网络搜索 - 使用 DuckDuckGo"""
+    """真实网络搜索 - 使用 DuckDuckGo，相同（或仅大小写、全半角、空白不同）的查询命中缓存"""
+    global _ddgs
+    if not isinstance(query, str) or not query.strip():
+        return {"success": False, "error": "query 必须是非空字符串"}
+    cache_key = f"{normalize_query(query)}|{num_results}"
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "query": query, "cached": True}
+    
     try:
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=num_results))
+        with _search_slots:
+            results = list(_get_search_client().text(query, max_results=num_results))
         
         # 调试：打印原始结果
         print(f"[DEBUG] 搜索到 {len(results)} 条结果")
@@ -104,17 +177,98 @@ def web_search(query, num_results=5):
                 "url": r.get("href", "")
             })
         
-        return {
+        result = {
             "success": True,
             "query": query,
             "count": len(formatted_results),
             "results": formatted_results
         }
+        _search_cache.set(cache_key, result)
+        return {**result, "cached": False}
     except Exception as e:
+        # 客户端可能处于异常状态（如被限流），下次重新创建
+        _ddgs = None
         print(f"[ERROR] 搜索失败: {str(e)}")
         return {"success": False, "error": f"搜索出错: {str(e)}"}
 
 
+def normalize_url(url):
+    """规范化 URL 用于去重：忽略协议大小写、www 前缀、片段、跟踪参数与末尾斜杠"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    params = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return urlunsplit(("", host, path, urlencode(params), "")).lstrip("/")
+
+
+def multi_search(queries, num_results=5, max_total=15):
+    """多查询并发搜索 - 合并结果，按 URL 去重，按倒数排名融合（RRF）排序"""
+    if isinstance(queries, str):
+        queries = [queries]
+    queries = [q.strip() for q in queries or [] if isinstance(q, str) and q.strip()]
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        return {"success": False, "error": "queries 不能为空"}
+    
+    # 并发执行；实际发往后端的请求数由 _search_slots 限制
+    with ThreadPoolExecutor(max_workers=min(len(queries), MULTI_SEARCH_MAX_WORKERS)) as pool:
+        outcomes = list(pool.map(lambda q: web_search(q, num_results), queries))
+    
+    merged = {}
+    failed = []
+    cached_queries = 0
+    for query, outcome in zip(queries, outcomes):
+        if not outcome.get("success"):
+            failed.append({"query": query, "error": outcome.get("error")})
+            continue
+        cached_queries += bool(outcome.get("cached"))
+        for rank, r in enumerate(outcome["results"], 1):
+            key = normalize_url(r["url"]) if r["url"] else f"{query}#{rank}"
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {**r, "score": 0.0, "matched_queries": []}
+            elif query in entry["matched_queries"]:
+                # 同一查询内重复出现的 URL 只按最靠前的排名计分
+                continue
+            elif len(r["snippet"]) > len(entry["snippet"]):
+                entry["snippet"] = r["snippet"]
+            entry["score"] += 1.0 / (_RRF_K + rank)
+            entry["matched_queries"].append(query)
+    
+    if not merged:
+        return {
+            "success": False,
+            "error": "所有查询均未找到结果，请尝试其他关键词",
+            "failed": failed
+        }
+    
+    ranked = sorted(merged.values(), key=lambda e: e["score"], reverse=True)[:max_total]
+    for entry in ranked:
+        entry["score"] = round(entry["score"], 4)
+        if len(entry["snippet"]) > MULTI_SEARCH_SNIPPET_CHARS:
+            entry["snippet"] = entry["snippet"][:MULTI_SEARCH_SNIPPET_CHARS] + "..."
+    
+    return {
+        "success": True,
+        "queries": queries,
+        "count": len(ranked),
+        "total_unique": len(merged),
+        "cached_queries": cached_queries,
+        "failed": failed,
+        "results": ranked
+    }
+
+
+def get_search_cache_stats():
+    """返回搜索缓存命中率统计"""
+    return _search_cache.stats()
+
+
 def read_file(file_path):
     """读取文件"""
     try:
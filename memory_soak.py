@@ -0,0 +1,115 @@
+"""
+长会话内存浸泡测试 - 用模拟的 LLM 客户端驱动同一个 Agent 跑数千轮对话（每轮含一次读文件工具调用），
+预热后用 tracemalloc 定期采样，检查内存是否保持平稳
+用法:
+    python memory_soak.py [轮数] [允许增长的 KB 数]
+"""
+import gc
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, "template-agent")
+import agent as agent_module
+from token_ledger import TokenLedger
+from session_store import SessionStore
+from tracing import tracer
+
+
+DEFAULT_TURNS = 2000
+DEFAULT_TOLERANCE_KB = 2048
+WARMUP_RATIO = 0.2  # 前 20% 的轮次用于让历史上限、结果存储、缓存达到稳态
+SAMPLES = 10
+
+
+class FakeCompletions:
+    """交替返回读文件的工具调用与最终回答"""
+
+    def __init__(self, files):
+        self.files = files
+        self.calls = 0
+
+    def create(self, messages, **kwargs):
+        self.calls += 1
+        if messages[-1]["role"] == "user":
+            path = self.files[self.calls % len(self.files)]
+            tool_call = SimpleNamespace(
+                id=f"call_{self.calls}",
+                type="function",
+                function=SimpleNamespace(name="read_file", arguments=json.dumps({"file_path": path}))
+            )
+            message = SimpleNamespace(content="", tool_calls=[tool_call])
+            finish_reason = "tool_calls"
+        else:
+            message = SimpleNamespace(content=f"第 {self.calls} 次回答：" + "文件内容摘要。" * 200, tool_calls=None)
+            finish_reason = "stop"
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=200)
+        return SimpleNamespace(choices=[SimpleNamespace(finish_reason=finish_reason, message=message)], usage=usage)
+
+
+def make_files(directory, count=20, paragraphs=400):
+    """生成若干个较大的文本文件，让工具结果触发压缩与完整结果存储"""
+    files = []
+    for i in range(count):
+        path = os.path.join(directory, f"doc_{i}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for j in range(paragraphs):
+                f.write(f"第 {i} 号文档第 {j} 段：关于内存占用与长会话稳定性的说明文字。\n")
+        files.append(path)
+    return files
+
+
+def soak(turns=DEFAULT_TURNS, tolerance_kb=DEFAULT_TOLERANCE_KB):
+    """运行浸泡测试，返回是否通过"""
+    tracer.configure(level="warning")
+    agent_module._ledger = TokenLedger(None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        agent_module.HISTORY_SPILL_DIR = os.path.join(directory, "history")
+        agent_module._session_store = SessionStore(os.path.join(directory, "sessions"))
+        files = make_files(directory)
+        agent = agent_module.Agent()
+        agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(files)))
+
+        tracemalloc.start()
+        warmup = max(1, int(turns * WARMUP_RATIO))
+        interval = max(1, (turns - warmup) // SAMPLES)
+        baseline = None
+        samples = []
+        start = time.perf_counter()
+        for turn in range(1, turns + 1):
+            agent.run(f"第 {turn} 个问题：请读取文件并总结内存占用")
+            if turn == warmup or (turn > warmup and (turn - warmup) % interval == 0):
+                gc.collect()
+                current, _ = tracemalloc.get_traced_memory()
+                if baseline is None:
+                    baseline = current
+                samples.append((turn, current))
+                usage = agent.memory_usage()
+                print(f"第 {turn:>5} 轮: 内存 {current / 1024:>9.0f} KB (+{(current - baseline) / 1024:>7.0f} KB), "
+                      f"历史 {usage['history_messages']} 条 / {usage['history_bytes'] / 1024:.0f} KB, "
+                      f"结果存储 {usage['result_store_bytes'] / 1024:.0f} KB, 已写入磁盘 {usage['spilled_messages']} 条")
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        agent_module.get_tool_executor().shutdown()
+        agent_module._session_store.close()
+
+    growth = samples[-1][1] - baseline
+    passed = growth <= tolerance_kb * 1024
+    print(f"\n{turns} 轮，耗时 {elapsed:.1f} 秒（{turns / elapsed:.0f} 轮/秒），峰值 {peak / 1024:.0f} KB")
+    print(f"预热后增长 {growth / 1024:.0f} KB，允许 {tolerance_kb} KB: {'通过' if passed else '未通过'}")
+    return passed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(__doc__)
+        sys.exit(0)
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_TURNS
+    tolerance_kb = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_TOLERANCE_KB
+    sys.exit(0 if soak(turns, tolerance_kb) else 1)
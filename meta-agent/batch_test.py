@@ -2,11 +2,15 @@
 批量测试 Meta-Agent (使用 GLM-4)
 """
 from meta_agent import MetaAgent
+from meta_config import PROFILE_DIR, PROFILE_INTERVAL
+from profiling import add_profile_arguments, profiler_from_args
 import time
+import argparse
+import contextlib
 
 
-def batch_test():
-    """批量测试不同类型的 Agent 创建"""
+def batch_test(profiler=None):
+    """批量测试不同类型的 Agent 创建（传入 profiler 时逐个剖析）"""
     test_cases = [
         {
             "name": "web-research-agent",
@@ -54,7 +58,8 @@ Agent 名称：code-review-agent"""
         
         meta_agent = MetaAgent()
         try:
-            result = meta_agent.create_agent(test_case['requirement'])
+            with profiler.turn(test_case['name']) if profiler else contextlib.nullcontext():
+                result = meta_agent.create_agent(test_case['requirement'])
             success = True
             error = None
         except Exception as e:
@@ -87,9 +92,13 @@ Agent 名称：code-review-agent"""
     success_count = sum(1 for r in results if r['success'])
     total_count = len(results)
     print(f"\n成功率: {success_count}/{total_count} ({success_count/total_count*100:.1f}%)")
+    if profiler is not None:
+        print(f"\n{profiler.summary()}")
     
     return results
 
 
 if __name__ == "__main__":
-    batch_test()
+    parser = argparse.ArgumentParser(description="批量测试 Meta-Agent")
+    add_profile_arguments(parser, PROFILE_DIR, PROFILE_INTERVAL)
+    batch_test(profiler_from_args(parser.parse_args()))
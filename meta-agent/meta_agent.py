@@ -2,9 +2,44 @@
 Meta-Agent - 能够创建其他 Agent 的 Agent (使用 GLM-4)
 """
 import json
+import time
+import uuid
+import argparse
+import contextlib
 from zhipuai import ZhipuAI
-from meta_config import GLM_API_KEY, META_MODEL
+from meta_config import (
+    GLM_API_KEY, META_MODEL, LOOP_GUARD_ENABLED, LOOP_MAX_REPEATS,
+    BUILD_TIMEOUT_SECONDS, LLM_TIMEOUT_SECONDS, TRACE_FILE, TRACE_LEVEL, TRACE_SAMPLE_RATE,
+    METRICS_PORT, METRICS_FILE, MAX_TOKENS, TOKEN_LEDGER_DB, BUILD_TOKEN_QUOTA,
+    PROFILE_DIR, PROFILE_INTERVAL
+)
 from meta_tools import get_meta_tool_definitions, execute_meta_tool
+# 以下共用模块位于 template-agent 目录，导入 meta_config 时已加入导入路径
+from loop_guard import LoopGuard, repeated_content
+from deadline import Deadline, DeadlineExceeded, call_with_deadline
+from tracing import tracer, lazy_json
+from metrics import registry
+from token_ledger import TokenLedger, QuotaExceeded, estimate_tokens
+from profiling import add_profile_arguments, profiler_from_args
+
+tracer.configure(TRACE_FILE, TRACE_LEVEL, TRACE_SAMPLE_RATE)
+
+_LLM_LATENCY = registry.histogram("meta_agent_llm_latency_seconds", "LLM 请求耗时（秒）")
+_LLM_TOKENS = registry.counter("meta_agent_llm_tokens_total", "LLM 消耗的 token 数", ["kind"])
+_TOOL_LATENCY = registry.histogram("meta_agent_tool_latency_seconds", "工具调用耗时（秒）", ["tool"])
+_TOOL_CALLS = registry.counter("meta_agent_tool_calls_total", "工具调用次数，status 为 ok/error/repeated", ["tool", "status"])
+_BUILDS = registry.counter("meta_agent_builds_total", "创建次数，status 为 ok/interrupted/quota_exceeded/max_iterations", ["status"])
+_BUILD_ITERATIONS = registry.histogram("meta_agent_build_iterations", "每次创建的迭代次数", buckets=(1, 2, 3, 5, 8, 10, 12, 15))
+_HISTORY_TOKENS = registry.histogram(
+    "meta_agent_history_tokens", "每次创建结束时对话历史的估算 token 数",
+    buckets=(1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+
+# 所有创建共享的 token 账本，按创建（会话）、需求汇总用量
+ledger = TokenLedger(TOKEN_LEDGER_DB)
+
+# 会写入生成目录的工具：不在超时后继续后台执行，也不复用重复调用的结果
+_FILE_WRITING_TOOLS = {"create_agent_project", "modify_agent_file"}
 
 
 class MetaAgent:
@@ -63,9 +98,19 @@ def tool2(...):
 """
         self.conversation_history = []
         self.tools = get_meta_tool_definitions()
+        self.loop_guard = LoopGuard(LOOP_MAX_REPEATS, mutating_tools=_FILE_WRITING_TOOLS) if LOOP_GUARD_ENABLED else None
+        self.deadline = None  # 本次创建的截止时间
+        self._completed_steps = []  # 本次创建中已成功的工具调用，超时时汇报进度
+        self.session_id = None  # 本次创建的 token 记账 ID
+        self.requirement = None
         
-    def create_agent(self, user_requirement):
-        """根据用户需求创建 Agent"""
+    def cancel(self, reason="已取消"):
+        """从其他线程取消正在进行的创建"""
+        if self.deadline:
+            self.deadline.token.cancel(reason)
+    
+    def create_agent(self, user_requirement, timeout=None, cancel_token=None):
+        """根据用户需求创建 Agent（timeout 默认 BUILD_TIMEOUT_SECONDS，到期时返回已完成的步骤）"""
         print(f"\n{'='*60}")
         print(f"开始创建 Agent")
         print(f"需求: {user_requirement}")
@@ -77,99 +122,251 @@ def tool2(...):
             "content": f"请根据以下需求创建一个新的 Agent：\n\n{user_requirement}"
         })
         
+        if self.loop_guard:
+            self.loop_guard.reset()
+        self.deadline = Deadline(BUILD_TIMEOUT_SECONDS if timeout is None else timeout, cancel_token)
+        self._completed_steps = []
+        self._iterations = 0
+        self._build_status = "ok"
+        self.session_id = uuid.uuid4().hex
+        self.requirement = user_requirement.strip()
+        
+        with tracer.span("build", requirement_chars=len(user_requirement), session_id=self.session_id) as span:
+            try:
+                response = self._run_loop()
+            except (DeadlineExceeded, QuotaExceeded) as e:
+                span.status = "interrupted"
+                span.set(reason=str(e))
+                response = self._partial_response(str(e))
+                self._build_status = "quota_exceeded" if isinstance(e, QuotaExceeded) else "interrupted"
+            span.set(tokens=ledger.session_total(self.session_id))
+            span.set(steps=len(self._completed_steps), elapsed_s=round(self.deadline.elapsed(), 3))
+            self._record_build_metrics()
+            return response
+    
+    def _record_build_metrics(self):
+        """记录本次创建的迭代次数、状态与历史大小，按配置写出指标文件"""
+        _BUILDS.inc(status=self._build_status)
+        _BUILD_ITERATIONS.observe(self._iterations)
+        _HISTORY_TOKENS.observe(sum(estimate_tokens(m.get("content") or "") for m in self.conversation_history))
+        if METRICS_FILE:
+            registry.dump(METRICS_FILE)
+    
+    def _run_loop(self):
+        """迭代调用 LLM 与工具直到模型给出最终说明"""
         iteration = 0
         max_iterations = 15
         
         while iteration < max_iterations:
             iteration += 1
-            print(f"\n--- 迭代 {iteration} ---")
-            
-            # 调用 LLM
-            response = self._call_llm()
-            
-            # 检查是否需要调用工具
-            if response.choices[0].finish_reason == "tool_calls":
-                tool_calls = response.choices[0].message.tool_calls
-                
-                # 添加助手消息到历史
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response.choices[0].message.content or ""
-                }
-                
-                # 添加工具调用信息
-                if tool_calls:
-                    assistant_message["tool_calls"] = [
-                        {
-                            "id": tc.id,
-                            "type": tc.type,
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in tool_calls
-                    ]
+            self._iterations = iteration
+            with tracer.span("iteration", index=iteration):
+                tracer.info("\n--- 迭代 %d ---", iteration)
+                self.deadline.check()
                 
-                self.conversation_history.append(assistant_message)
+                # 调用 LLM（检测到循环后不再提供工具，让模型直接总结）
+                response = self._call_llm(use_tools=not (self.loop_guard and self.loop_guard.stopped))
                 
-                # 执行工具调用
-                for tool_call in tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
+                # 检查是否需要调用工具
+                if response.choices[0].finish_reason == "tool_calls":
+                    tool_calls = response.choices[0].message.tool_calls
                     
-                    print(f"🔧 调用工具: {tool_name}")
-                    print(f"   参数: {json.dumps(tool_args, ensure_ascii=False, indent=2)}")
+                    # 添加助手消息到历史
+                    assistant_message = {
+                        "role": "assistant",
+                        "content": response.choices[0].message.content or ""
+                    }
                     
-                    # 执行工具
-                    tool_result = execute_meta_tool(tool_name, tool_args)
+                    # 添加工具调用信息
+                    if tool_calls:
+                        assistant_message["tool_calls"] = [
+                            {
+                                "id": tc.id,
+                                "type": tc.type,
+                                "function": {
+                                    "name": tc.function.name,
+                                    "arguments": tc.function.arguments
+                                }
+                            }
+                            for tc in tool_calls
+                        ]
+                    
+                    self.conversation_history.append(assistant_message)
                     
-                    # 打印结果（简化版）
-                    if tool_result.get("success"):
-                        print(f"   ✅ 成功")
-                    else:
-                        print(f"   ❌ 失败: {tool_result.get('error')}")
+                    # 执行工具调用
+                    for index, tool_call in enumerate(tool_calls):
+                        with tracer.span("tool", tool=tool_call.function.name) as tool_span:
+                            started_at = time.perf_counter()
+                            tool_name = tool_call.function.name
+                            tool_args = json.loads(tool_call.function.arguments)
+                            
+                            tracer.info("🔧 调用工具: %s", tool_name)
+                            tracer.debug("   参数: %s", lazy_json(tool_args, indent=2))
+                            tool_span.set(args_chars=len(tool_call.function.arguments))
+                            
+                            # 与之前相同的调用直接复用上次结果，并提示模型不要重复
+                            previous, hint = self.loop_guard.check(tool_name, tool_args) if self.loop_guard else (None, None)
+                            if previous is not None:
+                                tracer.warning("   🔁 重复调用，复用上次结果")
+                                tool_span.set(repeated=True)
+                                content = repeated_content(previous, hint)
+                                _TOOL_CALLS.inc(tool=tool_name, status="repeated")
+                            else:
+                                # 执行工具：只读工具在剩余时间内执行；写文件的工具在当前线程执行完，
+                                # 避免超时返回后仍在后台写文件，截止时间在步骤之间检查
+                                try:
+                                    if tool_name in _FILE_WRITING_TOOLS:
+                                        self.deadline.check()
+                                        tool_result = execute_meta_tool(tool_name, tool_args)
+                                    else:
+                                        tool_result = call_with_deadline(self.deadline, execute_meta_tool, tool_name, tool_args)
+                                except DeadlineExceeded as e:
+                                    self._cancel_tool_calls(tool_calls[index:], str(e))
+                                    raise
+                                
+                                # 打印结果（简化版）
+                                if tool_result.get("success"):
+                                    tracer.info("   ✅ 成功")
+                                    self._completed_steps.append(self._describe_step(tool_name, tool_args))
+                                else:
+                                    tracer.warning("   ❌ 失败: %s", tool_result.get("error"))
+                                
+                                content = json.dumps(tool_result, ensure_ascii=False)
+                                tool_span.set(result_chars=len(content), success=bool(tool_result.get("success")))
+                                _TOOL_CALLS.inc(tool=tool_name, status="ok" if tool_result.get("success") else "error")
+                                _TOOL_LATENCY.observe(time.perf_counter() - started_at, tool=tool_name)
+                                if self.loop_guard:
+                                    self.loop_guard.record(tool_name, tool_args, content)
+                            
+                            # 添加工具结果到历史
+                            self.conversation_history.append({
+                                "role": "tool",
+                                "tool_call_id": tool_call.id,
+                                "content": content
+                            })
                     
-                    # 添加工具结果到历史
+                    if self.loop_guard and self.loop_guard.should_stop and not self.loop_guard.stopped:
+                        self.loop_guard.stop(iteration)
+                        tracer.warning("\n⚠️ 检测到重复的工具调用，在第 %d 次迭代提前结束", iteration)
+                        
+                else:
+                    # 没有工具调用，返回最终响应
+                    final_response = response.choices[0].message.content
                     self.conversation_history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps(tool_result, ensure_ascii=False)
+                        "role": "assistant",
+                        "content": final_response
                     })
                     
-            else:
-                # 没有工具调用，返回最终响应
-                final_response = response.choices[0].message.content
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": final_response
-                })
-                
-                print(f"\n{'='*60}")
-                print(f"Agent 创建完成！")
-                print(f"{'='*60}")
-                print(f"\n{final_response}")
-                
-                return final_response
+                    print(f"\n{'='*60}")
+                    print(f"Agent 创建完成！")
+                    print(f"{'='*60}")
+                    print(f"\n{final_response}")
+                    if self.loop_guard and self.loop_guard.strikes:
+                        tracer.info("\n循环检测: %s", self.loop_guard.stats())
+                    
+                    return final_response
                 
+        self._build_status = "max_iterations"
         return "达到最大迭代次数，Agent 可能未完全创建"
     
-    def _call_llm(self):
-        """调用 GLM-4 API"""
+    def _cancel_tool_calls(self, tool_calls, reason):
+        """把未执行完的工具调用记为已取消，保持对话历史完整"""
+        for tool_call in tool_calls:
+            self.conversation_history.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": json.dumps({"success": False, "error": f"已取消: {reason}"}, ensure_ascii=False)
+            })
+    
+    def _describe_step(self, tool_name, tool_args):
+        """把一次成功的工具调用描述为进度条目"""
+        if tool_name == "create_agent_project":
+            return f"创建项目 {tool_args.get('agent_name')}"
+        if tool_name == "modify_agent_file":
+            return f"修改 {tool_args.get('agent_name')}/{tool_args.get('file_name')}"
+        if tool_name == "read_template_file":
+            return f"读取范例 {tool_args.get('file_name')}"
+        return tool_name
+    
+    def _partial_response(self, reason):
+        """超时或取消时汇报已完成的步骤"""
+        lines = [f"Agent 创建未完成（{reason}，已用 {self.deadline.elapsed():.1f} 秒）"]
+        if self._completed_steps:
+            lines.append("已完成的步骤：")
+            lines.extend(f"- {step}" for step in self._completed_steps)
+        else:
+            lines.append("尚未完成任何步骤")
+        partial = "\n".join(lines)
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": partial
+        })
+        
+        print(f"\n{'='*60}")
+        print(partial)
+        print(f"{'='*60}")
+        return partial
+    
+    def _call_llm(self, use_tools=True):
+        """调用 GLM-4 API（use_tools 为 False 时不提供工具，强制模型直接回答）"""
         messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+        options = {"tools": self.tools} if use_tools else {}
+        # 本次创建的 token 配额用完时不再请求；否则生成长度不超过剩余配额
+        session_id = self.session_id or "default"
+        ledger.check(session_id, BUILD_TOKEN_QUOTA)
+        remaining = ledger.remaining(session_id, BUILD_TOKEN_QUOTA)
+        options["max_tokens"] = MAX_TOKENS if remaining is None else max(1, min(MAX_TOKENS, remaining))
+        # 请求超时不超过剩余时间
+        deadline = self.deadline or Deadline()
+        timeout = deadline.timeout(LLM_TIMEOUT_SECONDS)
+        if timeout is not None:
+            options["timeout"] = max(1.0, timeout)
         
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=self.tools,
-            temperature=0.7
-        )
+        with tracer.span("llm", model=self.model, use_tools=use_tools, messages=len(messages)) as span:
+            started_at = time.perf_counter()
+            response = call_with_deadline(
+                deadline,
+                self.client.chat.completions.create,
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                **options
+            )
+            _LLM_LATENCY.observe(time.perf_counter() - started_at)
+            prompt_tokens, completion_tokens, estimated = self._usage(response, messages, use_tools)
+            span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, tokens_estimated=estimated)
+            _LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+            _LLM_TOKENS.inc(completion_tokens, kind="completion")
+            ledger.record(session_id, "meta-agent", prompt_tokens, completion_tokens,
+                          model=self.model, requirement=self.requirement, estimated=estimated)
+            span.set(finish_reason=response.choices[0].finish_reason)
         
         return response
+    
+    def _usage(self, response, messages, use_tools):
+        """返回 (prompt_tokens, completion_tokens, 是否为估算)；响应未携带用量时按文本长度估算"""
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            return usage.prompt_tokens, usage.completion_tokens or 0, False
+        
+        prompt_text = json.dumps(messages, ensure_ascii=False)
+        if use_tools:
+            prompt_text += json.dumps(self.tools, ensure_ascii=False)
+        message = response.choices[0].message
+        completion_text = (message.content or "") + "".join(
+            tc.function.arguments or "" for tc in message.tool_calls or []
+        )
+        return estimate_tokens(prompt_text), estimate_tokens(completion_text), True
 
 
 def main():
-    """主函数 - 演示 Meta-Agent 使用"""
+    """主函数 - 演示 Meta-Agent 使用（--profile 时剖析本次创建）"""
+    parser = argparse.ArgumentParser(description="Meta-Agent")
+    add_profile_arguments(parser, PROFILE_DIR, PROFILE_INTERVAL)
+    profiler = profiler_from_args(parser.parse_args())
+    if METRICS_PORT:
+        registry.serve(METRICS_PORT)
+        print(f"指标地址: http://127.0.0.1:{METRICS_PORT}/metrics")
     meta_agent = MetaAgent()
     
     # 示例需求
@@ -186,11 +383,14 @@ Agent 名称：web-research-agent
 """
     
     # 创建 Agent
-    result = meta_agent.create_agent(requirement)
+    with profiler.turn("web-research-agent") if profiler else contextlib.nullcontext():
+        result = meta_agent.create_agent(requirement)
     
     print("\n" + "="*60)
     print("实验完成！")
     print("="*60)
+    if profiler is not None:
+        print(profiler.summary())
 
 
 if __name__ == "__main__":
@@ -2,14 +2,49 @@
 Meta-Agent 配置 - 使用 GLM-4 模型
 """
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# 与范例 Agent 共用的模块（deadline、loop_guard、tracing、metrics、token_ledger、profiling）只在范例目录维护一份，
+# 生成的 Agent 复制范例目录时一并带走；Meta-Agent 通过把范例目录加入导入路径使用它们
+SHARED_MODULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template-agent")
+if SHARED_MODULES_PATH not in sys.path:
+    sys.path.append(SHARED_MODULES_PATH)
+
 # 使用 GLM-4 模型进行代码生成
 META_MODEL = "glm-4-flash"  # 使用 GLM-4 Flash 进行快速生成
 GLM_API_KEY = os.getenv("GLM_API_KEY")
 
+# 单次 LLM 回复的最大 token 数（生成的代码文件可能较长）
+MAX_TOKENS = 4096
+
+# 循环检测：相同参数的重复/循环工具调用复用上次结果，超过次数后让模型直接总结
+LOOP_GUARD_ENABLED = True
+LOOP_MAX_REPEATS = 2
+
+# 时限：一次创建的总时间，以及单次 LLM 请求的超时上限（秒）
+BUILD_TIMEOUT_SECONDS = 600
+LLM_TIMEOUT_SECONDS = 120
+
+# 追踪与日志：级别（debug 时打印完整工具参数）、span 导出的 JSONL 路径（留空不导出）、采样比例
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "info")
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+# 运行指标：Prometheus 文本格式的本地 HTTP 端口（/metrics）与每次创建后写出的文件，留空不启用
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+METRICS_FILE = os.getenv("METRICS_FILE")
+
+# 性能剖析（--profile 时生效）：每次创建的折叠栈 / cProfile 文件与汇总的输出目录、采样间隔（秒）
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "profiles")
+PROFILE_INTERVAL = 0.005
+
+# Token 用量：每次 LLM 调用记录到 SQLite（python ../template-agent/token_ledger.py <路径> 查看报表）；单次创建的 token 配额，留空不限
+TOKEN_LEDGER_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "token_ledger.db")
+BUILD_TOKEN_QUOTA = int(os.getenv("BUILD_TOKEN_QUOTA", "0")) or None
+
 # 范例 Agent 路径
 TEMPLATE_AGENT_PATH = "../template-agent"
 
@@ -135,10 +135,11 @@ def create_agent_project(agent_name, description):
         # 创建 Agent 目录
         agent_dir = os.path.join(OUTPUT_DIR, agent_name)
         
-        # 复制范例代码
+        # 复制范例代码（不复制范例运行时留下的会话日志、用量数据库与缓存）
         if os.path.exists(agent_dir):
             shutil.rmtree(agent_dir)
-        shutil.copytree(TEMPLATE_AGENT_PATH, agent_dir)
+        shutil.copytree(TEMPLATE_AGENT_PATH, agent_dir,
+                        ignore=shutil.ignore_patterns(".cache", "__pycache__"))
         
         # 创建 README
         readme_content = f"""# {agent_name}
@@ -157,6 +158,9 @@ copy .env.example .env
 
 # 运行 Agent
 python agent.py
+
+# 或以多会话 HTTP 服务运行（SSE 流式输出）
+python server.py --port 8000
 ```
 
 ## 配置说明
@@ -1,175 +1,742 @@
 """
 标准 Agent 实现 - 使用 GLM-4 API
 """
+import os
 import json
+import time
+import argparse
+import contextlib
+import uuid
+import threading
+from types import SimpleNamespace
 from zhipuai import ZhipuAI
-from config import GLM_API_KEY, GLM_MODEL, MAX_ITERATIONS, TEMPERATURE
+from config import (
+    AGENT_NAME, GLM_API_KEY, GLM_MODEL, MAX_ITERATIONS, TEMPERATURE, MAX_TOKENS, VOICE_STREAMING,
+    COMPRESS_TOOL_RESULTS, TOOL_RESULT_TOKEN_BUDGET, RESULT_STORE_MAX, RESULT_STORE_MAX_BYTES, RESULT_PAGE_MAX_CHARS,
+    TOOL_MEMO_ENABLED, TOOL_MEMO_MAX_ENTRIES, LOOP_GUARD_ENABLED, LOOP_MAX_REPEATS,
+    TURN_TIMEOUT_SECONDS, LLM_TIMEOUT_SECONDS,
+    TOOL_IO_WORKERS, TOOL_PROCESS_WORKERS, TOOL_PROCESS_TOOLS, TOOL_TIMEOUTS,
+    TOOL_DEFAULT_TIMEOUT, TOOL_MAX_RESULT_CHARS,
+    TRACE_FILE, TRACE_LEVEL, TRACE_SAMPLE_RATE, METRICS_PORT, METRICS_FILE,
+    TOKEN_LEDGER_DB, SESSION_TOKEN_QUOTA, PROFILE_DIR, PROFILE_INTERVAL,
+    MEMORY_TRACING, HISTORY_MAX_MESSAGES, HISTORY_MAX_BYTES, HISTORY_SPILL_DIR,
+    SESSION_STORE_DIR, SESSION_SNAPSHOT_EVERY, SESSION_FSYNC
+)
+import tools
 from tools import get_tool_definitions, execute_tool
+from memo import ToolMemo
+from loop_guard import LoopGuard, repeated_content
+from deadline import Deadline, DeadlineExceeded, call_with_deadline, iterate_with_deadline
+from tool_executor import ToolExecutor
+from tracing import tracer, lazy_json
+from metrics import registry
+from token_ledger import TokenLedger, QuotaExceeded, estimate_tokens
+from profiling import add_profile_arguments, profiler_from_args
+from memory import deep_sizeof, start_tracing, traced_memory, top_allocations, spill_history
+from session_store import SessionStore
+from tts_stream import StreamingSpeaker
+from compress import ResultCompressor, GET_FULL_RESULT_TOOL
+
+tracer.configure(TRACE_FILE, TRACE_LEVEL, TRACE_SAMPLE_RATE)
+
+# meta-agent 改写 tools.py 时只保证 get_tool_definitions / execute_tool 存在，
+# 语音合成缺失时不做流式朗读，没有复用策略时不启用工具结果复用
+text_to_speech = getattr(tools, "text_to_speech", None)
+get_memo_policies = getattr(tools, "get_memo_policies", dict)
+
+_LLM_LATENCY = registry.histogram("agent_llm_latency_seconds", "LLM 请求耗时（秒）", ["stream"])
+_LLM_TOKENS = registry.counter("agent_llm_tokens_total", "LLM 消耗的 token 数", ["kind"])
+_TOOL_LATENCY = registry.histogram("agent_tool_latency_seconds", "工具调用耗时（秒），含排队时间", ["tool"])
+_TOOL_CALLS = registry.counter("agent_tool_calls_total", "工具调用次数，status 为 ok/error/timeout/repeated", ["tool", "status"])
+_MEMO_LOOKUPS = registry.counter("agent_tool_memo_lookups_total", "会话内工具结果复用的查找次数", ["result"])
+_TURNS = registry.counter("agent_turns_total", "对话轮数，status 为 ok/interrupted/quota_exceeded/max_iterations", ["status"])
+_TURN_ITERATIONS = registry.histogram("agent_turn_iterations", "每轮对话的迭代次数", buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20))
+_HISTORY_TOKENS = registry.histogram(
+    "agent_history_tokens", "每轮结束时对话历史的估算 token 数",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+)
+_HISTORY_BYTES = registry.histogram(
+    "agent_history_bytes", "每轮结束时内存中对话历史占用的字节数",
+    buckets=tuple(2 ** n * 1024 for n in range(6, 15, 2))
+)
+_SPILLED_MESSAGES = registry.counter("agent_history_spilled_messages_total", "超出上限后写入磁盘的历史消息数")
+
+_executor = None  # 所有 Agent 实例共享的工具执行器
+_ledger = None  # 所有 Agent 实例共享的 token 账本
+_session_store = None  # 所有 Agent 实例共享的会话存储
+_client = None  # 所有 Agent 实例共享的 LLM 客户端（复用连接池）
+_init_lock = threading.Lock()  # 多个会话在不同线程同时首次使用时，共享对象只创建一次
+
+SYSTEM_PROMPT = """你是一个有用的 AI 助手，可以搜索网络和操作文件。
+
+语音交互规则：
+1. 当用户说"打开语音"、"开启语音"、"语音对话"时，你必须立即调用 speech_to_text 工具来监听用户的语音输入
+2. speech_to_text 工具会识别用户的语音并转换为文字，识别的文字会作为用户的新消息
+3. 收到语音识别的文字后，你需要：
+   - 理解用户说的内容并生成合适的回复
+   - 调用 text_to_speech 工具朗读你的回复（不是朗读用户说的话）
+   - 朗读完成后，立即再次调用 speech_to_text 继续监听下一句话
+4. 在语音对话模式下，形成循环：监听 → 回复 → 朗读 → 再次监听
+5. 如果用户说"关闭语音"、"退出语音"、"停止语音"，则不要再调用 speech_to_text，退出语音模式
+6. 重要：语音模式下每次回复后都要自动继续监听，保持对话连续性！"""
+
+
+def get_llm_client():
+    """创建（首次调用时）并返回共享的 LLM 客户端"""
+    global _client
+    with _init_lock:
+        if _client is None:
+            _client = ZhipuAI(api_key=GLM_API_KEY)
+    return _client
+
+
+def get_tool_executor(io_workers=None):
+    """创建（首次调用时）并返回共享的工具执行器；io_workers 只在首次创建时生效，默认 TOOL_IO_WORKERS"""
+    global _executor
+    with _init_lock:
+        if _executor is None:
+            _executor = ToolExecutor(
+                execute_tool,
+                io_workers=io_workers or TOOL_IO_WORKERS,
+                process_workers=TOOL_PROCESS_WORKERS,
+                process_tools=TOOL_PROCESS_TOOLS,
+                timeouts=TOOL_TIMEOUTS,
+                default_timeout=TOOL_DEFAULT_TIMEOUT,
+                max_result_chars=TOOL_MAX_RESULT_CHARS
+            )
+    return _executor
+
+
+def get_token_ledger():
+    """创建（首次调用时）并返回共享的 token 账本"""
+    global _ledger
+    with _init_lock:
+        if _ledger is None:
+            _ledger = TokenLedger(TOKEN_LEDGER_DB)
+    return _ledger
+
+
+def get_session_store():
+    """创建（首次调用时）并返回共享的会话存储；未配置 SESSION_STORE_DIR 时返回 None"""
+    global _session_store
+    with _init_lock:
+        if _session_store is None and SESSION_STORE_DIR:
+            _session_store = SessionStore(SESSION_STORE_DIR, SESSION_SNAPSHOT_EVERY, SESSION_FSYNC)
+    return _session_store
+
+
+def _collect_runtime_metrics():
+    """抓取时读取各缓存与执行器的统计"""
+    # 改写后的 tools.py 可能没有统计函数；语音合成缓存主要在工具子进程中使用，主进程内的统计不完整，不导出
+    get_search_stats = getattr(tools, "get_search_cache_stats", None)
+    caches = {"search": get_search_stats()} if get_search_stats else {}
+    caches = {name: stats for name, stats in caches.items() if stats.get("enabled", True)}
+    families = [
+        ("agent_cache_hits_total", "counter", "缓存命中次数",
+         [({"cache": name}, stats["hits"] + stats.get("disk_hits", 0)) for name, stats in caches.items()]),
+        ("agent_cache_misses_total", "counter", "缓存未命中次数",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("agent_cache_hit_ratio", "gauge", "缓存命中率",
+         [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()])
+    ]
+    if _executor is not None:
+        pools = _executor.stats()
+        families += [
+            ("agent_executor_utilization", "gauge", "工具执行池利用率",
+             [({"pool": pool}, s["utilization"]) for pool, s in pools.items()]),
+            ("agent_executor_in_flight", "gauge", "正在执行的工具调用数",
+             [({"pool": pool}, s["in_flight"]) for pool, s in pools.items()]),
+            ("agent_executor_timeouts_total", "counter", "工具执行超时次数",
+             [({"pool": pool}, s["timeouts"]) for pool, s in pools.items()]),
+            ("agent_executor_crashes_total", "counter", "工作进程崩溃次数",
+             [({"pool": pool}, s["crashes"]) for pool, s in pools.items()])
+        ]
+    return families
+
+
+registry.register_collector(_collect_runtime_metrics)
 
 
 class Agent:
-    def __init__(self, system_prompt="你是一个有用的 AI 助手。"):
-        self.client = ZhipuAI(api_key=GLM_API_KEY)
+    def __init__(self, system_prompt="你是一个有用的 AI 助手。", session_id=None, name=AGENT_NAME):
+        self.client = get_llm_client()
         self.model = GLM_MODEL
         self.system_prompt = system_prompt
-        self.conversation_history = []
+        self._history = []
+        # 传入已有的 session_id 时，首次访问对话历史才从会话存储中恢复（快照 + 日志尾部）
+        self._resume_pending = session_id is not None
         self.tools = get_tool_definitions()
         self.voice_mode = False  # 语音模式标志
+        self.current_query = ""  # 当前轮的用户问题，用于工具结果压缩时的相关度打分
+        self.compressor = self._new_compressor()
+        if self.compressor:
+            self.tools = self.tools + [GET_FULL_RESULT_TOOL]
+        memo_policies = get_memo_policies() if TOOL_MEMO_ENABLED else None
+        self.memo = ToolMemo(memo_policies, TOOL_MEMO_MAX_ENTRIES) if memo_policies else None
+        # 语音工具用相同参数反复调用是正常的对话循环，不做检测
+        self.loop_guard = LoopGuard(
+            LOOP_MAX_REPEATS, {"speech_to_text", "text_to_speech"}, mutating_tools={"write_file"}
+        ) if LOOP_GUARD_ENABLED else None
+        self.deadline = None  # 当前轮的截止时间
+        self._completed_tools = []  # 当前轮已完成的 (工具名, 结果)，超时时用于生成部分结果
+        self.name = name
+        self.session_id = session_id or uuid.uuid4().hex  # token 用量按会话记账与限额
+        self.spilled_messages = 0  # 本会话已写入磁盘的历史消息数
+        self._next_voice_input = None  # 语音模式下识别到的下一句话，由 run() 接着处理
+        self.on_delta = None  # 设置后 LLM 流式输出，每个文本分片回调一次（HTTP 服务用来推送 SSE）
         
+    @property
+    def conversation_history(self):
+        if self._resume_pending:
+            self._resume_pending = False
+            self._resume()
+        return self._history
+    
+    @conversation_history.setter
+    def conversation_history(self, messages):
+        self._resume_pending = False
+        self._history = messages
+    
+    def _resume(self):
+        """从会话存储恢复历史；上次在工具执行中途中断时，为没有结果的工具调用补上取消结果"""
+        store = get_session_store()
+        messages, meta = store.load(self.session_id) if store else (None, None)
+        if messages is None:
+            return
+        self._history = messages
+        self.spilled_messages = meta.get("spilled_messages", 0)
+        
+        last_calls = None
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index]["role"] == "assistant":
+                if messages[index].get("tool_calls"):
+                    last_calls = (index, messages[index]["tool_calls"])
+                break
+        if last_calls:
+            index, tool_calls = last_calls
+            answered = {m.get("tool_call_id") for m in messages[index + 1:] if m["role"] == "tool"}
+            self._cancel_tool_calls(
+                [SimpleNamespace(id=tc["id"]) for tc in tool_calls if tc["id"] not in answered],
+                "会话中断"
+            )
+        tracer.info("[会话] 已恢复 %s：%d 条消息", self.session_id, len(self._history))
+    
+    def _append_message(self, message):
+        """追加一条消息到对话历史，并写入会话存储"""
+        self.conversation_history.append(message)
+        store = get_session_store()
+        if store:
+            store.append(self.session_id, message)
+    
     def reset_conversation(self):
-        """重置对话历史"""
+        """重置对话历史（开始新的会话，token 配额重新计算；旧会话仍保留在会话存储中）"""
+        if _ledger is not None:
+            _ledger.forget(self.session_id)
         self.conversation_history = []
+        self.session_id = uuid.uuid4().hex
+        self.spilled_messages = 0
+        self.voice_mode = False
+        self.current_query = ""
+        self._next_voice_input = None
+        self.compressor = self._new_compressor()
+        if self.memo:
+            self.memo.clear()
+    
+    def resume_session(self, session_id):
+        """切换到已保存的会话，首次访问对话历史时从会话存储恢复"""
+        self.reset_conversation()
+        self.session_id = session_id
+        self._resume_pending = True
+    
+    def _new_compressor(self):
+        """创建工具结果压缩器（未启用时返回 None）"""
+        if not COMPRESS_TOOL_RESULTS:
+            return None
+        return ResultCompressor(TOOL_RESULT_TOKEN_BUDGET, RESULT_STORE_MAX, RESULT_STORE_MAX_BYTES, RESULT_PAGE_MAX_CHARS)
+        
+    def cancel(self, reason="已取消"):
+        """从其他线程取消正在进行的一轮对话"""
+        if self.deadline:
+            self.deadline.token.cancel(reason)
+    
+    def run(self, user_message, timeout=None, cancel_token=None):
+        """运行 Agent 主循环
         
-    def run(self, user_message):
-        """运行 Agent 主循环"""
+        Args:
+            timeout: 本轮总时限（秒），默认 TURN_TIMEOUT_SECONDS；到期时返回已得到的部分结果
+            cancel_token: 可选的 CancelToken，用于从外部取消本轮
+        """
+        while True:
+            response = self._run_turn(user_message, timeout, cancel_token)
+            # 语音模式下识别到的下一句话在这里接着处理（循环而不是递归，长时间语音对话不会累积栈帧）
+            user_message, self._next_voice_input = self._next_voice_input, None
+            if user_message is None:
+                return response
+    
+    def _run_turn(self, user_message, timeout, cancel_token):
+        """处理一轮对话"""
         # 检测关闭语音命令
         if self.voice_mode and any(keyword in user_message for keyword in ["关闭语音", "退出语音", "停止语音"]):
             self.voice_mode = False
-            print("[语音模式] 已关闭")
+            tracer.info("[语音模式] 已关闭")
         
         # 添加用户消息到历史
-        self.conversation_history.append({
+        self.current_query = user_message
+        self._append_message({
             "role": "user",
             "content": user_message
         })
+        if self.loop_guard:
+            self.loop_guard.reset()
+        self.deadline = Deadline(TURN_TIMEOUT_SECONDS if timeout is None else timeout, cancel_token)
+        self._completed_tools = []
+        self._iterations = 0
+        self._turn_status = "ok"
+        turn_start = len(self.conversation_history)
         
+        with tracer.span("turn", query_chars=len(user_message), voice_mode=self.voice_mode) as span:
+            try:
+                response = self._run_loop()
+            except (DeadlineExceeded, QuotaExceeded) as e:
+                span.status = "interrupted"
+                span.set(reason=str(e))
+                response = self._partial_response(str(e), turn_start)
+                self._turn_status = "quota_exceeded" if isinstance(e, QuotaExceeded) else "interrupted"
+            span.set(response_chars=len(response or ""), elapsed_s=round(self.deadline.elapsed(), 3))
+            if self.loop_guard:
+                span.set(loop_guard=self.loop_guard.stats())
+            self._enforce_history_limits()
+            store = get_session_store()
+            if store:
+                store.maybe_snapshot(self.session_id, self.conversation_history,
+                                     {"spilled_messages": self.spilled_messages})
+            if MEMORY_TRACING:
+                span.set(memory=self.memory_usage())
+            self._record_turn_metrics()
+            return response
+    
+    def _enforce_history_limits(self):
+        """对话历史超过上限时把最早的若干轮写入磁盘"""
+        spilled = spill_history(
+            self.conversation_history,
+            os.path.join(HISTORY_SPILL_DIR, f"{self.session_id}.jsonl"),
+            HISTORY_MAX_MESSAGES,
+            HISTORY_MAX_BYTES
+        )
+        if spilled:
+            self.spilled_messages += spilled
+            _SPILLED_MESSAGES.inc(spilled)
+            tracer.debug("[内存] %d 条历史消息已写入磁盘", spilled)
+            store = get_session_store()
+            if store:
+                store.record_spill(self.session_id, spilled)
+    
+    def memory_usage(self):
+        """本会话各部分占用的内存（字节）；启用 MEMORY_TRACING 时附带 tracemalloc 统计"""
+        usage = {
+            "history_messages": len(self.conversation_history),
+            "history_bytes": deep_sizeof(self.conversation_history),
+            "tool_result_bytes": deep_sizeof([m for m in self.conversation_history if m["role"] == "tool"]),
+            "result_store_bytes": self.compressor.stored_bytes if self.compressor else 0,
+            "memo_bytes": deep_sizeof(self.memo) if self.memo else 0,
+            "loop_guard_bytes": deep_sizeof(self.loop_guard) if self.loop_guard else 0,
+            "spilled_messages": self.spilled_messages
+        }
+        traced = traced_memory()
+        if traced:
+            usage.update(traced)
+        return usage
+    
+    def _record_turn_metrics(self):
+        """记录本轮的迭代次数、状态与历史大小，按配置写出指标文件"""
+        _TURNS.inc(status=self._turn_status)
+        _TURN_ITERATIONS.observe(self._iterations)
+        _HISTORY_TOKENS.observe(sum(estimate_tokens(m.get("content") or "") for m in self.conversation_history))
+        _HISTORY_BYTES.observe(deep_sizeof(self.conversation_history))
+        if METRICS_FILE:
+            registry.dump(METRICS_FILE)
+    
+    def _run_loop(self):
+        """迭代调用 LLM 与工具直到得到最终回复"""
         iteration = 0
         while iteration < MAX_ITERATIONS:
             iteration += 1
-            print(f"\n--- 迭代 {iteration} ---")
-            
-            # 调用 LLM
-            response = self._call_llm()
-            
-            # 检查是否需要调用工具
-            if response.choices[0].finish_reason == "tool_calls":
-                tool_calls = response.choices[0].message.tool_calls
+            self._iterations = iteration
+            with tracer.span("iteration", index=iteration):
+                tracer.info("\n--- 迭代 %d ---", iteration)
+                self.deadline.check()
                 
-                # 添加助手消息到历史
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response.choices[0].message.content or ""
-                }
+                # 调用 LLM（语音模式下流式输出，逐句朗读）；检测到循环后不再提供工具，让模型直接回答
+                speaker = None
+                if self.voice_mode and VOICE_STREAMING and text_to_speech:
+                    speaker = StreamingSpeaker(text_to_speech)
+                use_tools = not (self.loop_guard and self.loop_guard.stopped)
+                try:
+                    response = self._call_llm(on_delta=speaker.feed if speaker else self.on_delta, use_tools=use_tools)
+                except DeadlineExceeded:
+                    if speaker:
+                        speaker.cancel()
+                    raise
                 
-                # 添加工具调用信息
-                if tool_calls:
-                    assistant_message["tool_calls"] = [
-                        {
-                            "id": tc.id,
-                            "type": tc.type,
-                            "function": {
-                                "name": tc.function.name,
-                                "arguments": tc.function.arguments
-                            }
-                        }
-                        for tc in tool_calls
-                    ]
-                
-                self.conversation_history.append(assistant_message)
-                
-                # 执行工具调用
-                for tool_call in tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
+                # 检查是否需要调用工具
+                if response.choices[0].finish_reason == "tool_calls":
+                    if speaker:
+                        speaker.finish()
+                    tool_calls = response.choices[0].message.tool_calls
                     
-                    print(f"调用工具: {tool_name}")
-                    print(f"参数: {tool_args}")
+                    # 添加助手消息到历史
+                    assistant_message = {
+                        "role": "assistant",
+                        "content": response.choices[0].message.content or ""
+                    }
                     
-                    # 执行工具
-                    tool_result = execute_tool(tool_name, tool_args)
+                    # 添加工具调用信息
+                    if tool_calls:
+                        assistant_message["tool_calls"] = [
+                            {
+                                "id": tc.id,
+                                "type": tc.type,
+                                "function": {
+                                    "name": tc.function.name,
+                                    "arguments": tc.function.arguments
+                                }
+                            }
+                            for tc in tool_calls
+                        ]
                     
-                    # 添加工具结果到历史
-                    self.conversation_history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps(tool_result, ensure_ascii=False)
-                    })
+                    self._append_message(assistant_message)
                     
-                    # 检测语音模式切换并处理识别的文字
-                    if tool_name == "speech_to_text" and tool_result.get("success"):
-                        self.voice_mode = True
-                        print("[语音模式] 已开启")
-                        recognized_text = tool_result.get("text", "")
-                        if recognized_text:
-                            print(f"[语音输入] {recognized_text}")
-                            # 将识别的文字作为新的用户消息添加到历史
-                            self.conversation_history.append({
-                                "role": "user",
-                                "content": recognized_text
+                    # 执行工具调用
+                    for index, tool_call in enumerate(tool_calls):
+                        with tracer.span("tool", tool=tool_call.function.name) as tool_span:
+                            started_at = time.perf_counter()
+                            tool_name = tool_call.function.name
+                            tool_args = json.loads(tool_call.function.arguments)
+                            
+                            tracer.info("调用工具: %s", tool_name)
+                            tracer.debug("参数: %s", lazy_json(tool_args))
+                            tool_span.set(args_chars=len(tool_call.function.arguments))
+                            
+                            # 与之前相同的调用直接复用上次结果，并提示模型不要重复
+                            previous, hint = self.loop_guard.check(tool_name, tool_args) if self.loop_guard else (None, None)
+                            if previous is not None:
+                                tracer.warning("[循环检测] %s", hint)
+                                tool_span.set(repeated=True)
+                                tool_result = {}
+                                content = repeated_content(previous, hint)
+                            # 执行工具（get_full_result 由 Agent 自身从压缩结果存储中取回）
+                            elif tool_name == "get_full_result" and self.compressor:
+                                tool_result = self.compressor.get_full_result(
+                                    tool_args.get("ref"),
+                                    tool_args.get("offset"),
+                                    tool_args.get("limit")
+                                )
+                                content = json.dumps(tool_result, ensure_ascii=False)
+                            else:
+                                try:
+                                    tool_result = self._execute_tool(tool_name, tool_args)
+                                except DeadlineExceeded as e:
+                                    # 为尚未得到结果的工具调用补上取消结果，保持对话历史完整
+                                    self._cancel_tool_calls(tool_calls[index:], str(e))
+                                    raise
+                                if self.compressor:
+                                    content = self.compressor.compress(tool_result, self.current_query)
+                                else:
+                                    content = json.dumps(tool_result, ensure_ascii=False)
+                                self._completed_tools.append((tool_name, content))
+                            if self.loop_guard and previous is None:
+                                self.loop_guard.record(tool_name, tool_args, content)
+                            tool_span.set(result_chars=len(content), success="error" not in tool_result and bool(tool_result.get("success", True)))
+                            self._record_tool_metrics(tool_name, tool_result, previous is not None, started_at)
+                            
+                            # 添加工具结果到历史
+                            self._append_message({
+                                "role": "tool",
+                                "tool_call_id": tool_call.id,
+                                "content": content
                             })
+                        
+                        # 检测语音模式切换并处理识别的文字
+                        if tool_name == "speech_to_text" and tool_result.get("success"):
+                            self.voice_mode = True
+                            tracer.info("[语音模式] 已开启")
+                            recognized_text = tool_result.get("text", "")
+                            if recognized_text:
+                                print(f"[语音输入] {recognized_text}")
+                                # 将识别的文字作为新的用户消息添加到历史
+                                self.current_query = recognized_text
+                                self._append_message({
+                                    "role": "user",
+                                    "content": recognized_text
+                                })
                     
-            else:
-                # 没有工具调用，返回最终响应
-                final_response = response.choices[0].message.content
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": final_response
-                })
-                
-                # 语音模式：朗读回复并继续监听
-                if self.voice_mode:
-                    print(f"\nAgent: {final_response}")
-                    
-                    # 朗读回复
-                    tts_result = execute_tool("text_to_speech", {"text": final_response})
+                    if self.loop_guard and self.loop_guard.should_stop and not self.loop_guard.stopped:
+                        self.loop_guard.stop(iteration)
+                        tracer.warning("[循环检测] 模型反复调用相同工具，在第 %d 次迭代提前结束", iteration)
+                        
+                else:
+                    # 没有工具调用，返回最终响应
+                    final_response = response.choices[0].message.content
+                    self._append_message({
+                        "role": "assistant",
+                        "content": final_response
+                    })
+                    if self.loop_guard and self.loop_guard.strikes:
+                        tracer.info("[循环检测] %s", self.loop_guard.stats())
                     
-                    if tts_result.get("success"):
-                        # 朗读成功后，继续监听下一句话
-                        print("\n[语音模式] 继续监听...")
-                        stt_result = execute_tool("speech_to_text", {"language": "zh-CN", "timeout": 5})
+                    # 语音模式：朗读回复并继续监听
+                    if self.voice_mode:
+                        print(f"\nAgent: {final_response}")
+                        
+                        # 朗读回复（流式模式下已边生成边朗读，只需等待播放结束）
+                        if speaker:
+                            tts_result = speaker.finish()
+                            tracer.info("[TTS] 首句播放延迟: %s秒", tts_result.get("first_audio_latency"))
+                        else:
+                            tts_result = get_tool_executor().run("text_to_speech", {"text": final_response})
                         
-                        if stt_result.get("success"):
-                            recognized_text = stt_result.get("text", "")
-                            print(f"[语音输入] {recognized_text}")
+                        if tts_result.get("success"):
+                            # 朗读成功后，继续监听下一句话
+                            tracer.info("\n[语音模式] 继续监听...")
+                            stt_result = get_tool_executor().run("speech_to_text", {"language": "zh-CN", "timeout": 5})
                             
-                            # 检测关闭语音命令
-                            if any(keyword in recognized_text for keyword in ["关闭语音", "退出语音", "停止语音"]):
-                                self.voice_mode = False
-                                print("[语音模式] 已关闭")
+                            if stt_result.get("success"):
+                                recognized_text = stt_result.get("text", "")
+                                print(f"[语音输入] {recognized_text}")
+                                
+                                # 检测关闭语音命令
+                                if any(keyword in recognized_text for keyword in ["关闭语音", "退出语音", "停止语音"]):
+                                    self.voice_mode = False
+                                    tracer.info("[语音模式] 已关闭")
+                                    return final_response
+                                
+                                # 由 run() 接着处理新的语音输入
+                                self._next_voice_input = recognized_text
                                 return final_response
-                            
-                            # 递归处理新的语音输入
-                            return self.run(recognized_text)
-                        else:
-                            # STT 失败，退出语音模式
-                            print(f"[语音模式] 监听失败: {stt_result.get('error')}")
-                            self.voice_mode = False
-                
-                return final_response
+                            else:
+                                # STT 失败，退出语音模式
+                                tracer.warning("[语音模式] 监听失败: %s", stt_result.get("error"))
+                                self.voice_mode = False
+                    
+                    return final_response
                 
+        self._turn_status = "max_iterations"
         return "达到最大迭代次数"
     
-    def _call_llm(self):
-        """调用 GLM-4 API"""
+    def _execute_tool(self, tool_name, tool_args):
+        """在本轮剩余时间内执行工具；只读工具的重复调用复用本会话内的结果"""
+        if tool_name == "speech_to_text" and self.deadline.remaining() is not None:
+            # 监听时间不超过本轮剩余时间
+            tool_args = {**tool_args, "timeout": max(1, int(self.deadline.timeout(tool_args.get("timeout", 5))))}
+        
+        def execute(name, arguments):
+            return get_tool_executor().run(name, arguments, self.deadline)
+        
+        if not self.memo:
+            return execute(tool_name, tool_args)
+        if tool_name == "write_file":
+            files = tool_args.get("files") or [tool_args]
+            self.memo.invalidate_paths([f.get("file_path") for f in files if isinstance(f, dict)])
+        tool_result, hit = self.memo.call(tool_name, tool_args, execute)
+        if tool_name in self.memo.policies:
+            _MEMO_LOOKUPS.inc(result="hit" if hit else "miss")
+        if hit:
+            tracer.debug("[缓存] 复用本会话内 %s 的结果", tool_name)
+            span = tracer.current()
+            if span is not None:
+                span.set(memo_hit=True)
+        return tool_result
+    
+    def _record_tool_metrics(self, tool_name, tool_result, repeated, started_at):
+        if repeated:
+            status = "repeated"
+        elif tool_result.get("timeout"):
+            status = "timeout"
+        elif "error" in tool_result or not tool_result.get("success", True):
+            status = "error"
+        else:
+            status = "ok"
+        _TOOL_CALLS.inc(tool=tool_name, status=status)
+        _TOOL_LATENCY.observe(time.perf_counter() - started_at, tool=tool_name)
+    
+    def _cancel_tool_calls(self, tool_calls, reason):
+        """把未执行完的工具调用记为已取消"""
+        for tool_call in tool_calls:
+            self._append_message({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": json.dumps({"success": False, "error": f"已取消: {reason}"}, ensure_ascii=False)
+            })
+    
+    def _partial_response(self, reason, turn_start):
+        """超时或取消时，用本轮已得到的内容组成回复"""
+        tracer.warning("[中断] %s，已用 %.1f 秒", reason, self.deadline.elapsed())
+        parts = [f"抱歉，本次请求未能完成（{reason}）。"]
+        if self._completed_tools:
+            parts.append(f"已完成的步骤：{'、'.join(name for name, _ in self._completed_tools)}。")
+        
+        # 优先使用模型本轮已给出的文字，其次是最近一次工具结果
+        drafts = [m["content"] for m in self.conversation_history[turn_start:]
+                  if m["role"] == "assistant" and m.get("content")]
+        if drafts:
+            parts.append(f"目前的进展：{drafts[-1]}")
+        elif self._completed_tools:
+            parts.append(f"最近得到的结果：{self._completed_tools[-1][1][:500]}")
+        
+        partial = "\n\n".join(parts)
+        self._append_message({
+            "role": "assistant",
+            "content": partial
+        })
+        return partial
+    
+    def _call_llm(self, on_delta=None, use_tools=True):
+        """调用 GLM-4 API
+        
+        Args:
+            on_delta: 可选的增量文本回调；提供时以流式方式调用并逐段回调
+            use_tools: 为 False 时不提供工具，强制模型直接回答
+        """
         messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+        options = {"tools": self.tools} if use_tools else {}
+        
+        # 会话配额用完时不再请求；否则生成长度不超过剩余配额
+        ledger = get_token_ledger()
+        ledger.check(self.session_id, SESSION_TOKEN_QUOTA)
+        remaining = ledger.remaining(self.session_id, SESSION_TOKEN_QUOTA)
+        options["max_tokens"] = MAX_TOKENS if remaining is None else max(1, min(MAX_TOKENS, remaining))
+        
+        # 请求超时不超过本轮剩余时间
+        deadline = self.deadline or Deadline()
+        timeout = deadline.timeout(LLM_TIMEOUT_SECONDS)
+        if timeout is not None:
+            options["timeout"] = max(1.0, timeout)
+        
+        with tracer.span("llm", model=self.model, stream=on_delta is not None, use_tools=use_tools,
+                         messages=len(messages)) as span:
+            started_at = time.perf_counter()
+            if on_delta is None:
+                response = call_with_deadline(
+                    deadline,
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    **options
+                )
+            else:
+                # 建立连接与等待每个分片都受本轮截止时间约束
+                stream = iterate_with_deadline(
+                    deadline,
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    stream=True,
+                    **options
+                )
+                try:
+                    response = self._collect_stream(stream, on_delta)
+                finally:
+                    stream.close()
+            _LLM_LATENCY.observe(time.perf_counter() - started_at, stream=str(on_delta is not None).lower())
+            
+            prompt_tokens, completion_tokens, estimated = self._usage(response, messages, use_tools)
+            span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, tokens_estimated=estimated)
+            _LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+            _LLM_TOKENS.inc(completion_tokens, kind="completion")
+            ledger.record(self.session_id, self.name, prompt_tokens, completion_tokens,
+                          model=self.model, estimated=estimated)
+            span.set(finish_reason=response.choices[0].finish_reason,
+                     content_chars=len(response.choices[0].message.content or ""))
+            return response
+    
+    def _usage(self, response, messages, use_tools):
+        """返回 (prompt_tokens, completion_tokens, 是否为估算)；响应未携带用量时按文本长度估算"""
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            return usage.prompt_tokens, usage.completion_tokens or 0, False
         
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=self.tools,
-            temperature=TEMPERATURE
+        prompt_text = json.dumps(messages, ensure_ascii=False)
+        if use_tools:
+            prompt_text += json.dumps(self.tools, ensure_ascii=False)
+        message = response.choices[0].message
+        completion_text = (message.content or "") + "".join(
+            tc.function.arguments or "" for tc in message.tool_calls or []
         )
+        return estimate_tokens(prompt_text), estimate_tokens(completion_text), True
+    
+    def _collect_stream(self, stream, on_delta):
+        """消费流式响应，拼装成与非流式响应结构一致的对象"""
+        content_parts = []
+        tool_calls = {}
+        finish_reason = None
+        usage = None
+        
+        for chunk in stream:
+            # 用量信息随最后一个分片返回
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            
+            if delta.content:
+                content_parts.append(delta.content)
+                on_delta(delta.content)
+            
+            # 工具调用可能分多个分片到达，按 index 拼接参数
+            for tc in delta.tool_calls or []:
+                index = getattr(tc, "index", None)
+                if index is None:
+                    index = len(tool_calls)
+                entry = tool_calls.setdefault(index, {"id": None, "type": "function", "name": "", "arguments": ""})
+                if tc.id:
+                    entry["id"] = tc.id
+                if tc.type:
+                    entry["type"] = tc.type
+                if tc.function:
+                    entry["name"] += tc.function.name or ""
+                    entry["arguments"] += tc.function.arguments or ""
+            
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
         
-        return response
+        message = SimpleNamespace(
+            content="".join(content_parts),
+            tool_calls=[
+                SimpleNamespace(
+                    id=entry["id"],
+                    type=entry["type"],
+                    function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"] or "{}")
+                )
+                for _, entry in sorted(tool_calls.items())
+            ] or None
+        )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason=finish_reason, message=message)],
+            usage=usage
+        )
 
 
 def main():
-    """测试 Agent"""
-    agent = Agent(system_prompt="""你是一个有用的 AI 助手，可以搜索网络和操作文件。
-
-语音交互规则：
-1. 当用户说"打开语音"、"开启语音"、"语音对话"时，你必须立即调用 speech_to_text 工具来监听用户的语音输入
-2. speech_to_text 工具会识别用户的语音并转换为文字，识别的文字会作为用户的新消息
-3. 收到语音识别的文字后，你需要：
-   - 理解用户说的内容并生成合适的回复
-   - 调用 text_to_speech 工具朗读你的回复（不是朗读用户说的话）
-   - 朗读完成后，立即再次调用 speech_to_text 继续监听下一句话
-4. 在语音对话模式下，形成循环：监听 → 回复 → 朗读 → 再次监听
-5. 如果用户说"关闭语音"、"退出语音"、"停止语音"，则不要再调用 speech_to_text，退出语音模式
-6. 重要：语音模式下每次回复后都要自动继续监听，保持对话连续性！""")
+    """测试 Agent（--profile 时剖析每一轮，退出时打印汇总）"""
+    parser = argparse.ArgumentParser(description="Template Agent")
+    parser.add_argument("--session", help="恢复已保存的会话（会话 ID）")
+    add_profile_arguments(parser, PROFILE_DIR, PROFILE_INTERVAL)
+    args = parser.parse_args()
+    profiler = profiler_from_args(args)
+    if MEMORY_TRACING:
+        start_tracing()
+    
+    agent = Agent(system_prompt=SYSTEM_PROMPT, session_id=args.session)
     
     print("=== Template Agent ===")
+    print(f"会话 ID: {agent.session_id}（下次可用 --session {agent.session_id} 恢复）")
     print("输入 '退出' 或 'quit' 结束对话\n")
+    if METRICS_PORT:
+        registry.serve(METRICS_PORT)
+        print(f"指标地址: http://127.0.0.1:{METRICS_PORT}/metrics\n")
     
     while True:
         # 获取用户输入
@@ -178,6 +745,14 @@ def main():
         # 检查是否退出
         if user_input.lower() in ['退出', 'quit', 'exit', 'q']:
             print("再见！")
+            if _executor is not None:
+                print(f"[执行器] {_executor.stats()}")
+            if profiler is not None:
+                print(profiler.summary())
+            if MEMORY_TRACING:
+                print(f"[内存] {agent.memory_usage()}")
+                for allocation in top_allocations():
+                    print(f"  {allocation['bytes']:>10}  {allocation['location']}")
             break
             
         # 检查空输入
@@ -186,7 +761,8 @@ def main():
             continue
         
         # 运行 Agent
-        response = agent.run(user_input)
+        with profiler.turn("turn") if profiler else contextlib.nullcontext():
+            response = agent.run(user_input)
         print(f"\nAgent: {response}\n")
 
 
@@ -0,0 +1,205 @@
+"""
+Agent 实例池 - 预先创建若干个可直接使用的 Agent，请求借出、用完归还（归还时清空历史），
+免去每个请求构造 LLM 客户端、工具定义等的开销；后台按近期借出峰值自动扩缩，并统计借出等待时间
+"""
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from tracing import tracer
+from metrics import registry
+
+
+_CHECKOUT_WAIT = registry.histogram(
+    "agent_pool_checkout_wait_seconds", "借出 Agent 的等待时间（秒），含现场创建", ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+_CHECKOUTS = registry.counter(
+    "agent_pool_checkouts_total", "借出次数，result 为 hit（有空闲实例）/miss（现场创建）/wait（等待归还）/timeout",
+    ["pool", "result"]
+)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolExhausted(Exception):
+    """在超时时间内没有可借出的 Agent，或池已关闭"""
+
+
+class AgentPool:
+    """同一类 Agent 的实例池；factory() 创建一个新 Agent"""
+
+    def __init__(self, factory, name="default", min_size=2, max_size=32, resize_interval=30):
+        """
+        Args:
+            min_size: 至少保持的实例数（含借出的）
+            max_size: 实例总数上限，全部借出时新的借出请求等待归还
+            resize_interval: 自动扩缩的间隔（秒），None 表示不自动扩缩
+        """
+        self.factory = factory
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target = min_size  # 期望的实例总数
+        self.size = 0  # 现有实例数（含借出与正在创建的）
+        self.in_use = 0
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._peak_in_use = 0  # 上次扩缩以来的借出峰值（现场创建的实例借出时已计入）
+        self._closed = False
+        self._warm(min_size)
+        if resize_interval:
+            threading.Thread(target=self._resize_loop, args=(resize_interval,), daemon=True,
+                             name=f"agent-pool-{name}").start()
+
+    def checkout(self, timeout=None):
+        """借出一个 Agent；没有空闲实例时在上限内现场创建，否则等待归还，超时或池已关闭时抛出 PoolExhausted"""
+        started_at = time.monotonic()
+        result = "hit"
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolExhausted(f"Agent 池 {self.name} 已关闭")
+                if self._idle:
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    result = "miss"
+                    break
+                result = "wait"
+                remaining = None if timeout is None else timeout - (time.monotonic() - started_at)
+                if remaining is not None and remaining <= 0:
+                    _CHECKOUTS.inc(pool=self.name, result="timeout")
+                    raise PoolExhausted(f"Agent 池 {self.name} 已满（{self.max_size}）")
+                self._cond.wait(remaining)
+            agent = self._idle.pop() if result != "miss" else None
+            self.in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self.in_use)
+
+        if agent is None:
+            try:
+                agent = self.factory()
+            except Exception:
+                with self._cond:
+                    self.size -= 1
+                    self.in_use -= 1
+                    self._cond.notify()
+                raise
+        _CHECKOUTS.inc(pool=self.name, result=result)
+        _CHECKOUT_WAIT.observe(time.monotonic() - started_at, pool=self.name)
+        return agent
+
+    def checkin(self, agent):
+        """归还 Agent：清空历史后放回池中；超出期望数量或重置失败时直接丢弃"""
+        try:
+            agent.reset_conversation()
+            reusable = True
+        except Exception as e:
+            tracer.warning("[Agent 池] 重置失败，丢弃实例: %s", e)
+            reusable = False
+        with self._cond:
+            self.in_use -= 1
+            if reusable and not self._closed and self.size <= self.target:
+                self._idle.append(agent)
+            else:
+                self.size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def agent(self, timeout=None):
+        """借出一个 Agent，with 语句结束时归还"""
+        agent = self.checkout(timeout)
+        try:
+            yield agent
+        finally:
+            self.checkin(agent)
+
+    def resize(self):
+        """按上次扩缩以来的借出峰值（加 25% 余量）调整期望数量，并补足或回收空闲实例"""
+        with self._cond:
+            peak, self._peak_in_use = self._peak_in_use, self.in_use
+            wanted = peak + max(1, peak // 4)
+            self.target = max(self.min_size, min(self.max_size, wanted))
+            # 回收多余的空闲实例
+            while self._idle and self.size > self.target:
+                self._idle.popleft()
+                self.size -= 1
+            missing = self.target - self.size
+        if missing > 0:
+            self._warm(missing)
+        return self.target
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "target": self.target,
+                "max_size": self.max_size
+            }
+
+    def close(self):
+        """关闭并从全局池表中移除，之后 get_pool 同名时会创建新池；借出中的实例归还时直接丢弃"""
+        with self._cond:
+            self._closed = True
+            self.size -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        with _pools_lock:
+            if _pools.get(self.name) is self:
+                del _pools[self.name]
+
+    def _warm(self, count):
+        """在后台线程创建 count 个实例放入空闲队列"""
+        with self._cond:
+            count = min(count, self.max_size - self.size)
+            if count <= 0:
+                return
+            self.size += count
+
+        def build():
+            for _ in range(count):
+                try:
+                    agent = self.factory()
+                except Exception as e:
+                    tracer.error("[Agent 池] 预创建失败: %s", e)
+                    agent = None
+                with self._cond:
+                    if agent is None or self._closed:
+                        self.size -= 1
+                    else:
+                        self._idle.append(agent)
+                    self._cond.notify()
+
+        threading.Thread(target=build, daemon=True, name=f"agent-pool-{self.name}-warm").start()
+
+    def _resize_loop(self, interval):
+        while not self._closed:
+            time.sleep(interval)
+            if not self._closed:
+                self.resize()
+
+
+def get_pool(name, factory, **options):
+    """按名称取得（首次调用时创建）Agent 池，每种 Agent 一个池"""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = AgentPool(factory, name, **options)
+        return pool
+
+
+def _collect_pool_metrics():
+    with _pools_lock:
+        pools = {name: pool.stats() for name, pool in _pools.items()}
+    return [
+        (f"agent_pool_{field}", "gauge", doc, [({"pool": name}, s[field]) for name, s in pools.items()])
+        for field, doc in (("size", "池中实例总数（含借出）"), ("idle", "空闲实例数"),
+                           ("in_use", "借出中的实例数"), ("target", "自动扩缩的期望实例数"))
+    ]
+
+
+registry.register_collector(_collect_pool_metrics)
@@ -0,0 +1,300 @@
+"""
+代码分析 - 多进程解析 Python 文件的 AST，按内容哈希缓存，输出精简的结构化事实
+（函数、圈复杂度、过长函数、未使用的导入、缺少错误处理的调用）
+"""
+import os
+import ast
+import json
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+# 规则变化时递增，使旧缓存失效
+ANALYZER_VERSION = 2
+
+# 容易抛异常、通常需要 try 保护的调用
+RISKY_CALLS = {
+    "open", "json.load", "json.loads",
+    "requests.get", "requests.post", "requests.request", "urlopen", "urllib.request.urlopen",
+    "subprocess.run", "subprocess.check_output", "subprocess.check_call",
+    "os.remove", "os.rename", "shutil.rmtree", "shutil.copytree"
+}
+
+_BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.IfExp, ast.Assert, ast.comprehension)
+_FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+_SKIP_DIRS = {".git", "__pycache__", "venv", ".venv", ".tox", "node_modules", ".cache", "build", "dist"}
+
+
+def _call_name(node):
+    """把调用目标还原为点分名称，如 requests.get"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return None
+
+
+def _own_nodes(func):
+    """遍历函数体内节点，不进入嵌套的函数/类"""
+    stack = list(func.body)
+    while stack:
+        node = stack.pop()
+        yield node
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, _FUNCTION_NODES + (ast.ClassDef, ast.Lambda)):
+                stack.append(child)
+
+
+def _complexity(func):
+    """McCabe 圈复杂度：1 + 分支数 + 布尔运算分支数"""
+    score = 1
+    for node in _own_nodes(func):
+        if isinstance(node, _BRANCH_NODES):
+            score += 1
+            if isinstance(node, ast.comprehension):
+                score += len(node.ifs)
+        elif isinstance(node, ast.BoolOp):
+            score += len(node.values) - 1
+        elif hasattr(ast, "match_case") and isinstance(node, ast.match_case):
+            score += 1
+    return score
+
+
+class _RiskVisitor(ast.NodeVisitor):
+    """找出不在 try 块内的高风险调用以及吞掉异常的 except"""
+
+    def __init__(self):
+        self.try_depth = 0
+        self.unguarded = []
+        self.swallowed = []
+
+    def visit_Try(self, node):
+        self.try_depth += 1
+        for child in node.body:
+            self.visit(child)
+        self.try_depth -= 1
+        for handler in node.handlers:
+            if handler.type is None or (
+                len(handler.body) == 1 and isinstance(handler.body[0], ast.Pass)
+            ):
+                self.swallowed.append(handler.lineno)
+            self.visit(handler)
+        for child in node.orelse + node.finalbody:
+            self.visit(child)
+
+    visit_TryStar = visit_Try
+
+    def visit_Call(self, node):
+        name = _call_name(node.func)
+        if name in RISKY_CALLS and not self.try_depth:
+            self.unguarded.append({"line": node.lineno, "call": name})
+        self.generic_visit(node)
+
+
+def _unused_imports(tree):
+    """导入了但从未引用的名称"""
+    imported = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imported[alias.asname or alias.name.split(".")[0]] = node.lineno
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name != "*":
+                    imported[alias.asname or alias.name] = node.lineno
+
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            used.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            used.add(node.value)  # __all__ 及字符串形式的类型注解
+    return [{"name": name, "line": line} for name, line in sorted(imported.items(), key=lambda kv: kv[1])
+            if name not in used]
+
+
+def analyze_source(source, long_function_lines=50, complex_threshold=10):
+    """分析一段 Python 源码，返回结构化事实"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return {"syntax_error": f"第 {e.lineno} 行: {e.msg}"}
+
+    functions = []
+    for node in ast.walk(tree):
+        if isinstance(node, _FUNCTION_NODES):
+            length = (node.end_lineno or node.lineno) - node.lineno + 1
+            functions.append({
+                "name": node.name,
+                "line": node.lineno,
+                "length": length,
+                "complexity": _complexity(node),
+                "has_docstring": ast.get_docstring(node) is not None
+            })
+    functions.sort(key=lambda f: f["line"])
+
+    risk = _RiskVisitor()
+    risk.visit(tree)
+
+    return {
+        "lines": len(source.splitlines()),
+        "classes": sum(isinstance(n, ast.ClassDef) for n in ast.walk(tree)),
+        "functions": functions,
+        # 以 functions 中的下标引用，不同类中的同名方法不会互相覆盖
+        "long_functions": [i for i, f in enumerate(functions) if f["length"] > long_function_lines],
+        "complex_functions": [i for i, f in enumerate(functions) if f["complexity"] > complex_threshold],
+        "unused_imports": _unused_imports(tree),
+        "unguarded_calls": risk.unguarded,
+        "swallowed_exceptions": risk.swallowed
+    }
+
+
+def _analyze_worker(args):
+    """进程池任务：分析单个文件的源码"""
+    source, long_function_lines, complex_threshold = args
+    return analyze_source(source, long_function_lines, complex_threshold)
+
+
+class CodeAnalyzer:
+    """并行分析目录下的 Python 文件；结果按文件内容哈希缓存在内存与磁盘"""
+
+    def __init__(self, cache_dir=None, max_workers=None, long_function_lines=50, complex_threshold=10,
+                 parallel_threshold=8):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.long_function_lines = long_function_lines
+        self.complex_threshold = complex_threshold
+        self.parallel_threshold = parallel_threshold  # 待分析文件少于此数时在当前进程完成，省去进程启动开销
+        self._memory = {}
+        self._pool = None
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def analyze(self, path):
+        """分析文件或目录，返回 {相对路径: 事实} 及缓存统计"""
+        root = os.path.abspath(path)
+        files = [root] if os.path.isfile(root) else list(self._walk(root))
+        base = os.path.dirname(root) if os.path.isfile(root) else root
+
+        results = {}
+        pending = []
+        for file_path in files:
+            try:
+                with open(file_path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            rel = os.path.relpath(file_path, base)
+            digest = self._key(data)
+            facts = self._load(digest)
+            if facts is not None:
+                results[rel] = facts
+            else:
+                pending.append((rel, digest, data.decode("utf-8", errors="replace")))
+
+        if pending:
+            tasks = [(source, self.long_function_lines, self.complex_threshold) for _, _, source in pending]
+            if len(pending) < self.parallel_threshold:
+                outputs = map(_analyze_worker, tasks)
+            else:
+                outputs = self._get_pool().map(_analyze_worker, tasks, chunksize=4)
+            for (rel, digest, _), facts in zip(pending, outputs):
+                self._save(digest, facts)
+                results[rel] = facts
+
+        return results, {"files": len(results), "cached": len(results) - len(pending), "analyzed": len(pending)}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _walk(self, root):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+            for name in sorted(filenames):
+                if name.endswith(".py"):
+                    yield os.path.join(dirpath, name)
+
+    def _key(self, data):
+        settings = f"{ANALYZER_VERSION}:{self.long_function_lines}:{self.complex_threshold}:".encode("ascii")
+        return hashlib.sha1(settings + data).hexdigest()
+
+    def _load(self, digest):
+        facts = self._memory.get(digest)
+        if facts is not None or not self.cache_dir:
+            return facts
+        try:
+            with open(os.path.join(self.cache_dir, f"{digest}.json"), "r", encoding="utf-8") as f:
+                facts = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._memory[digest] = facts
+        return facts
+
+    def _save(self, digest, facts):
+        self._memory[digest] = facts
+        if not self.cache_dir:
+            return
+        path = os.path.join(self.cache_dir, f"{digest}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(facts, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def summarize(results, max_issues=50, include_functions=False):
+    """把逐文件事实汇总为适合放入提示词的精简报告"""
+    issues = []
+    totals = {"files": len(results), "lines": 0, "functions": 0, "syntax_errors": 0}
+    for rel, facts in sorted(results.items()):
+        if "syntax_error" in facts:
+            totals["syntax_errors"] += 1
+            issues.append({"file": rel, "type": "syntax_error", "detail": facts["syntax_error"]})
+            continue
+        totals["lines"] += facts["lines"]
+        totals["functions"] += len(facts["functions"])
+        for index in facts["complex_functions"]:
+            f = facts["functions"][index]
+            issues.append({"file": rel, "line": f["line"], "type": "high_complexity",
+                           "detail": f"{f['name']} 圈复杂度 {f['complexity']}"})
+        for index in facts["long_functions"]:
+            f = facts["functions"][index]
+            issues.append({"file": rel, "line": f["line"], "type": "long_function",
+                           "detail": f"{f['name']} 共 {f['length']} 行"})
+        for item in facts["unused_imports"]:
+            issues.append({"file": rel, "line": item["line"], "type": "unused_import", "detail": item["name"]})
+        for item in facts["unguarded_calls"]:
+            issues.append({"file": rel, "line": item["line"], "type": "missing_error_handling",
+                           "detail": f"{item['call']}() 未在 try 中调用"})
+        for line in facts["swallowed_exceptions"]:
+            issues.append({"file": rel, "line": line, "type": "swallowed_exception", "detail": "裸 except 或 except: pass"})
+
+    counts = {}
+    for issue in issues:
+        counts[issue["type"]] = counts.get(issue["type"], 0) + 1
+
+    summary = {
+        "totals": totals,
+        "issue_counts": counts,
+        "issues": issues[:max_issues],
+        "truncated": len(issues) > max_issues
+    }
+    if include_functions:
+        # 每个函数压缩为 "名称(行号, 行数, 复杂度)"
+        summary["functions"] = {
+            rel: [f"{f['name']}(L{f['line']}, {f['length']}行, c{f['complexity']})" for f in facts["functions"]]
+            for rel, facts in sorted(results.items()) if facts.get("functions")
+        }
+    return summary
@@ -0,0 +1,212 @@
+"""
+工具结果压缩 - 超出预算的工具输出按与当前问题的相关度（BM25）抽取关键段落，
+完整结果保存在本地，模型可通过 get_full_result 按引用取回
+"""
+import re
+import sys
+import json
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from token_ledger import estimate_tokens
+
+
+# 英文/数字按词，中文按单字 + 相邻二元组切分
+_WORD = re.compile(r"[a-z0-9_]+")
+_CJK = re.compile(r"[一-鿿]+")
+# 段落切分：换行、中文句末标点，或英文句末标点后的空白
+_PASSAGE_SPLIT = re.compile(r"(?<=[。！？])|(?<=[.!?])\s+|\n+")
+# 超出剩余预算的段落至少还能保留这么多 token 时截断保留，否则跳过
+_MIN_TRUNCATED_TOKENS = 100
+
+# 短于此长度的字符串字段原样保留（文件名、查询词等元信息）
+_SHORT_FIELD_CHARS = 200
+
+# 模型取回完整结果的工具定义
+GET_FULL_RESULT_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_full_result",
+        "description": "取回被压缩的工具结果的完整内容（按字符分页）。仅当压缩后的摘录不足以回答问题时使用",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "ref": {
+                    "type": "string",
+                    "description": "压缩结果中的 ref 引用编号"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "起始字符位置",
+                    "default": 0
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "返回的最大字符数（超过单页上限时按上限返回）",
+                    "default": 4000
+                }
+            },
+            "required": ["ref"]
+        }
+    }
+}
+
+
+def tokenize(text):
+    """中英文混合分词"""
+    text = text.lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def truncate_to_tokens(text, max_tokens):
+    """按估算的 token 数截断文本（按比例截取后逐步收缩）"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    end = max(1, len(text) * max_tokens // estimate_tokens(text))
+    while end > 1 and estimate_tokens(text[:end]) + 1 > max_tokens:
+        end = end * 9 // 10
+    return text[:end] + "…"
+
+
+def bm25_scores(passages, query, k1=1.5, b=0.75):
+    """对段落列表按查询计算 BM25 分数（只在查询词上构建词频矩阵）"""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not passages:
+        return np.zeros(len(passages))
+
+    counts = [Counter(tokenize(p)) for p in passages]
+    tf = np.array([[c[t] for t in terms] for c in counts], dtype=np.float64)
+    lengths = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+    avg_length = lengths.mean() or 1.0
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(passages) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _split_passages(result):
+    """把工具结果拆成 (保留的元信息, 可压缩的段落列表)"""
+    meta = {}
+    passages = []
+    for key, value in result.items():
+        if isinstance(value, str) and len(value) > _SHORT_FIELD_CHARS:
+            passages.extend(p.strip() for p in _PASSAGE_SPLIT.split(value) if p and p.strip())
+        elif isinstance(value, list) and value and len(json.dumps(value, ensure_ascii=False)) > _SHORT_FIELD_CHARS:
+            # 列表（如搜索结果）每一项作为一个段落
+            passages.extend(
+                item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+                for item in value
+            )
+        else:
+            meta[key] = value
+    return meta, passages
+
+
+class ResultCompressor:
+    """压缩超预算的工具结果，并按引用保存完整内容"""
+
+    def __init__(self, token_budget=1500, max_stored=50, max_stored_bytes=None, max_page_chars=8000):
+        self.token_budget = token_budget
+        self.max_stored = max_stored
+        self.max_stored_bytes = max_stored_bytes  # 完整结果占用的内存上限，None 表示只按条数限制
+        self.max_page_chars = max_page_chars  # get_full_result 单页的字符数上限，不能借此绕过压缩预算
+        self._store = OrderedDict()  # ref -> 完整结果 JSON
+        self.stored_bytes = 0
+        self._next_ref = 1
+
+    def compress(self, result, query):
+        """返回写入对话历史的字符串；未超预算时即原始 JSON"""
+        content = json.dumps(result, ensure_ascii=False)
+        original_tokens = estimate_tokens(content)
+        if original_tokens <= self.token_budget or not isinstance(result, dict):
+            return content
+
+        meta, passages = _split_passages(result)
+        if not passages:
+            return content
+
+        scores = bm25_scores(passages, query)
+        # 有相关段落时只保留相关段落和开头一段；完全不相关时退化为保留开头
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates):
+            candidates = np.union1d([0], candidates)
+        else:
+            candidates = np.arange(len(passages))
+        # 同分时优先靠前的段落（标题、开头通常信息量大）
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        budget = self.token_budget - estimate_tokens(json.dumps(meta, ensure_ascii=False)) - 50
+
+        kept = []
+        used = 0
+        for index in order:
+            cost = estimate_tokens(passages[index])
+            if used + cost > budget:
+                # 单个段落超出剩余预算（如没有标点的长文本）时截断保留，而不是整段丢弃
+                if budget - used < _MIN_TRUNCATED_TOKENS:
+                    continue
+                passages[index] = truncate_to_tokens(passages[index], budget - used)
+                cost = estimate_tokens(passages[index])
+            kept.append(index)
+            used += cost
+
+        ref = self._save(content)
+        excerpt = []
+        last = -1
+        for index in sorted(kept):
+            if index != last + 1:
+                excerpt.append("[...]")
+            excerpt.append(passages[index])
+            last = index
+        if last != len(passages) - 1:
+            excerpt.append("[...]")
+
+        return json.dumps({
+            **meta,
+            "compressed": True,
+            "ref": ref,
+            "original_tokens": original_tokens,
+            "kept_passages": len(kept),
+            "total_passages": len(passages),
+            "excerpt": "\n".join(excerpt),
+            "note": "结果过长，已按与问题的相关度保留部分段落；如需完整内容请调用 get_full_result"
+        }, ensure_ascii=False)
+
+    def get_full_result(self, ref, offset=0, limit=4000):
+        """按引用分页取回完整结果；limit 缺省或为空时取 4000，且不超过 max_page_chars"""
+        content = self._store.get(ref) if isinstance(ref, str) else None
+        if content is None:
+            return {"success": False, "error": f"未找到引用: {ref}"}
+        try:
+            offset = max(0, int(offset or 0))
+            limit = min(max(1, int(limit or 4000)), self.max_page_chars)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "offset 与 limit 必须是整数"}
+        chunk = content[offset:offset + limit]
+        return {
+            "success": True,
+            "ref": ref,
+            "offset": offset,
+            "content": chunk,
+            "total_chars": len(content),
+            "has_more": offset + len(chunk) < len(content)
+        }
+
+    def _save(self, content):
+        ref = f"r{self._next_ref}"
+        self._next_ref += 1
+        self._store[ref] = content
+        self.stored_bytes += sys.getsizeof(content)
+        # 最新的结果总是保留，即使它本身超过字节上限
+        while len(self._store) > 1 and (
+            len(self._store) > self.max_stored
+            or (self.max_stored_bytes and self.stored_bytes > self.max_stored_bytes)
+        ):
+            _, evicted = self._store.popitem(last=False)
+            self.stored_bytes -= sys.getsizeof(evicted)
+        return ref
@@ -6,6 +6,12 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# 本地缓存根目录
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Agent 名称（用于 token 用量统计）
+AGENT_NAME = "template-agent"
+
 # 模型配置 - 使用智谱 AI GLM-4
 GLM_MODEL = "glm-4-flash"  # GLM-4 Flash 模型，速度快且性能好
 GLM_API_KEY = os.getenv("GLM_API_KEY")
@@ -14,3 +20,135 @@ GLM_API_KEY = os.getenv("GLM_API_KEY")
 MAX_ITERATIONS = 10
 TEMPERATURE = 0.7
 MAX_TOKENS = 4096
+TURN_TIMEOUT_SECONDS = 120  # 单轮对话（含所有 LLM 调用与工具执行）的总时限，None 表示不限时
+LLM_TIMEOUT_SECONDS = 60  # 单次 LLM 请求的超时上限
+
+# 工具执行器配置
+TOOL_IO_WORKERS = 8  # 执行 I/O 型工具（搜索、抓取、文件）的线程数；HTTP 服务按 SERVER_MAX_CONCURRENT_TURNS 扩大
+TOOL_PROCESS_WORKERS = 2  # 执行 CPU 密集或依赖原生音频库的工具的子进程数
+TOOL_PROCESS_TOOLS = ["analyze_code", "csv_stats", "speech_to_text", "text_to_speech"]  # 在子进程中执行，崩溃不影响主进程
+TOOL_TIMEOUTS = {  # 各工具的执行超时（秒）
+    "web_search": 20,
+    "multi_search": 40,
+    "fetch_url": 30,
+    "fetch_urls": 60,
+    "speech_to_text": 30,
+    "text_to_speech": 60,
+    "analyze_code": 120,
+    "csv_stats": 120
+}
+TOOL_DEFAULT_TIMEOUT = 60  # 未单独配置的工具的超时（秒）
+TOOL_MAX_RESULT_CHARS = 200000  # 工具结果序列化后的最大字符数，超出部分截断
+
+# 追踪与日志配置
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "info")  # 日志与 span 的最低级别: debug / info / warning / error
+TRACE_FILE = os.getenv("TRACE_FILE")  # span 导出的 JSONL 路径，如 os.path.join(CACHE_DIR, "traces.jsonl")；留空不导出
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))  # 导出 span 的采样比例（按整轮对话采样）
+
+# 运行指标配置
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None  # 在此本地端口以 Prometheus 文本格式暴露 /metrics，留空不启动
+METRICS_FILE = os.getenv("METRICS_FILE")  # 每轮对话结束后把指标写入此文件，留空不写
+
+# 性能剖析配置（agent.py --profile 时生效）
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")  # 每轮的折叠栈 / cProfile 文件与汇总的输出目录
+PROFILE_INTERVAL = 0.005  # 采样间隔（秒）
+
+# 内存配置
+MEMORY_TRACING = os.getenv("MEMORY_TRACING", "").lower() in ("1", "true", "yes")  # 用 tracemalloc 统计内存（有额外开销）
+HISTORY_MAX_MESSAGES = 200  # 内存中保留的对话历史消息数上限，超出时最早的若干轮写入磁盘，None 表示不限
+HISTORY_MAX_BYTES = 4 * 1024 * 1024  # 内存中对话历史的字节数上限，None 表示不限
+HISTORY_SPILL_DIR = os.path.join(CACHE_DIR, "history")  # 移出内存的历史按会话写入 <会话ID>.jsonl
+
+# 会话存储配置
+SESSION_STORE_DIR = os.path.join(CACHE_DIR, "sessions")  # 每条消息追加写入 <会话ID>.log.jsonl 并定期写快照，None 表示不持久化
+SESSION_SNAPSHOT_EVERY = 50  # 距上次快照追加多少条日志后，在轮次结束时写新快照
+SESSION_FSYNC = False  # 每条日志写入后 fsync（更耐断电，但更慢）
+
+# HTTP 服务配置（python server.py）
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_MAX_SESSIONS = 1000  # 内存中最多保留的会话数，超出时移出最久未用的空闲会话
+SERVER_MAX_CONCURRENT_TURNS = 64  # 同时执行的对话轮数，其余排队
+SERVER_SESSION_IDLE_SECONDS = 900  # 会话空闲多久后移出内存（之后可从会话存储恢复）
+SERVER_SESSION_QUEUE = 2  # 单个会话正在处理时最多再排队的消息数，超出返回 429
+SERVER_STREAM_BUFFER = 256  # 单个 SSE 流最多缓冲的未发送分片数，满时暂停读取 LLM 输出
+SERVER_STREAM_STALL_SECONDS = 30  # 缓冲满后等待客户端读取的最长时间，超时取消本轮
+SERVER_MAX_BODY_BYTES = 1024 * 1024  # 请求体大小上限
+SERVER_EXCLUDED_TOOLS = ["speech_to_text", "text_to_speech"]  # 服务端没有麦克风与扬声器，不提供语音工具
+SERVER_POOL_MIN_SIZE = 4  # 预先创建的 Agent 实例数，新会话与无状态请求直接借用
+SERVER_POOL_RESIZE_INTERVAL = 30  # 按近期借出峰值自动扩缩 Agent 池的间隔（秒）
+SERVER_POOL_CHECKOUT_TIMEOUT = 10  # 无状态请求等待空闲 Agent 的最长时间（秒）
+
+# Token 用量配置
+TOKEN_LEDGER_DB = os.path.join(CACHE_DIR, "token_ledger.db")  # 每次 LLM 调用的用量记录（SQLite），None 表示仅内存
+SESSION_TOKEN_QUOTA = int(os.getenv("SESSION_TOKEN_QUOTA", "0")) or None  # 单个会话的 token 配额，用完后提前结束；留空不限
+
+# 工具结果压缩配置
+COMPRESS_TOOL_RESULTS = True  # 工具结果超出预算时只保留与问题最相关的段落
+TOOL_RESULT_TOKEN_BUDGET = 1500  # 单个工具结果写入对话历史的 token 预算
+RESULT_STORE_MAX = 50  # 本地保留的完整结果数量（供 get_full_result 取回）
+RESULT_STORE_MAX_BYTES = 16 * 1024 * 1024  # 完整结果占用的内存上限，超出时淘汰最早的结果
+RESULT_PAGE_MAX_CHARS = 8000  # get_full_result 单次取回的字符数上限
+
+# 工具调用记忆化配置
+TOOL_MEMO_ENABLED = True  # 同一会话内重复的只读工具调用直接复用上次结果
+TOOL_MEMO_MAX_ENTRIES = 128  # 每个会话最多记住的工具结果数
+TOOL_MEMO_SEARCH_TTL = 300  # 搜索/抓取类结果在会话内的复用时间（秒）；文件类结果随文件变化失效
+
+# 循环检测配置
+LOOP_GUARD_ENABLED = True  # 检测相同参数的重复/循环工具调用，复用上次结果并提示模型
+LOOP_MAX_REPEATS = 2  # 超过此重复次数后不再提供工具，让模型直接回答
+
+# 语音配置
+VOICE_STREAMING = True  # 语音模式下流式生成并逐句朗读，缩短首句出声时间
+VAD_ENABLED = True  # 使用帧级 VAD 判定说话结束，代替固定超时 + 能量阈值
+VAD_FRAME_MS = 30  # VAD 帧长（毫秒）
+VAD_HANGOVER_MS = 500  # 检测到静音后再等待多久判定说话结束（毫秒）
+VAD_MAX_PHRASE_SECONDS = 10  # 单句最长录音时间（秒）
+STT_BACKEND = os.getenv("STT_BACKEND", "google")  # 语音识别后端: google(在线) / vosk / sphinx(离线)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH")  # Vosk 模型目录，如 vosk-model-small-cn-0.22
+SPHINX_MODEL_DIR = os.getenv("SPHINX_MODEL_DIR")  # PocketSphinx 模型根目录，按语言分子目录（如 zh-CN/）；留空使用 speech_recognition 自带的 en-US 模型
+TTS_VOICE = os.getenv("TTS_VOICE")  # TTS 音色 ID，留空使用系统默认
+TTS_CACHE_ENABLED = True  # 缓存合成好的短语音频，重复短语免去重新合成
+TTS_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 内存层缓存上限（字节）
+TTS_CACHE_DIR = os.path.join(CACHE_DIR, "tts")  # 磁盘层缓存目录
+TTS_CACHE_MAX_TEXT_CHARS = 200  # 超过此长度的文本不缓存，直接朗读
+
+# 搜索缓存配置
+SEARCH_CACHE_TTL = 3600  # 搜索结果缓存有效期（秒）
+SEARCH_CACHE_MAX_ENTRIES = 256  # 内存中最多缓存的查询数
+SEARCH_CACHE_DB = None  # 持久化缓存的 SQLite 路径，如 os.path.join(CACHE_DIR, "search.db")；None 表示仅内存
+SEARCH_MAX_CONCURRENCY = 3  # 同时发往 DuckDuckGo 的请求上限，过高容易被限流
+MULTI_SEARCH_SNIPPET_CHARS = 300  # multi_search 每条摘要的最大字符数
+MULTI_SEARCH_MAX_WORKERS = 8  # multi_search 的并发线程上限（命中缓存的查询不占用搜索名额，可多于 SEARCH_MAX_CONCURRENCY）
+
+# 网页抓取配置
+FETCH_CACHE_DIR = os.path.join(CACHE_DIR, "http")  # 网页缓存目录，None 表示不缓存
+FETCH_CACHE_FRESH_SECONDS = 600  # 缓存在此时间内直接使用，超过后用 ETag/Last-Modified 重新验证
+FETCH_PER_HOST_LIMIT = 2  # 同一主机的最大并发请求数
+FETCH_MAX_WORKERS = 8  # 并发抓取线程数（也是连接池大小）
+FETCH_TIMEOUT = 15  # 单次请求超时（秒）
+FETCH_MAX_DOWNLOAD_BYTES = 2 * 1024 * 1024  # 单个网页最多下载的字节数
+
+# 文件读取配置
+READ_FILE_MAX_BYTES = 256 * 1024  # 不指定范围时整体读取的文件大小上限，也是按字节读取的默认长度
+READ_FILE_DEFAULT_LINES = 200  # 大文件未指定范围时默认返回的行数
+READ_FILE_MAX_LINES = 2000  # 按行读取（含 head/tail、grep 匹配行）单次返回的行数上限
+READ_FILE_MAX_MATCHES = 100  # grep 默认最多返回的匹配行数
+FILE_INDEX_CACHE_MAX = 16  # 缓存行偏移索引的文件数
+
+# 文件检索配置
+SEARCH_FILES_ROOT = os.getenv("SEARCH_FILES_ROOT", ".")  # search_files 默认检索的根目录
+SEARCH_FILES_EXTENSIONS = None  # 只索引这些扩展名，如 [".py", ".md"]；None 表示所有文本文件
+SEARCH_FILES_MAX_BYTES = 1024 * 1024  # 超过此大小的文件不建索引
+SEARCH_INDEX_DIR = os.path.join(CACHE_DIR, "search_index")  # 索引持久化目录，None 表示仅内存
+
+# 代码分析配置
+CODE_ANALYSIS_CACHE_DIR = os.path.join(CACHE_DIR, "code_analysis")  # 按内容哈希缓存分析结果
+CODE_ANALYSIS_WORKERS = None  # 解析进程数，None 表示 CPU 核数
+LONG_FUNCTION_LINES = 50  # 超过此行数视为过长函数
+COMPLEXITY_THRESHOLD = 10  # 圈复杂度超过此值视为过于复杂
+
+# CSV 分析配置
+CSV_CACHE_DIR = os.path.join(CACHE_DIR, "csv")  # 解析后的列式数据（memmap）缓存目录
+CSV_OPEN_TABLES_MAX = 8  # 同时保持打开（memmap）的已解析文件数，超出时关闭最久未用的
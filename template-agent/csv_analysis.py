@@ -0,0 +1,392 @@
+"""
+CSV 统计分析 - 分块流式解析为列式存储（按文件哈希缓存为 memmap），NumPy 向量化计算聚合
+"""
+import os
+import csv
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+CHUNK_ROWS = 50000  # 解析时每批处理的行数
+BLOCK_ROWS = 1000000  # 统计时每批读取的行数，控制峰值内存
+QUANTILE_SAMPLE = 1000000  # 超过此行数时分位数基于等距抽样近似计算
+MAX_VOCAB = 50000  # 文本列最多记录的不同取值数，之后出现的新取值归入"其他"，保证内存与 meta.json 有界
+OTHER_LABEL = "<其他>"
+_MISSING = {"", "na", "n/a", "nan", "null", "none", "-"}
+
+
+def _file_digest(path):
+    """流式计算文件内容哈希"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _detect_encoding(path):
+    """优先 UTF-8（含 BOM），失败则按 GB18030 读取"""
+    with open(path, "rb") as f:
+        sample = f.read(1024 * 1024)
+    try:
+        sample.decode("utf-8-sig")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # 采样恰好截断在多字节字符中间时仍视为 UTF-8
+        return "utf-8-sig" if e.start >= len(sample) - 4 else "gb18030"
+
+
+def _encode_text(values, vocab):
+    """把字符串列表编码为 int32：缺失为 -1；词表已满后出现的新取值编码为 MAX_VOCAB（即"其他"）"""
+    out = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        v = v.strip()
+        if v.lower() in _MISSING:
+            out[i] = -1
+            continue
+        code = vocab.get(v)
+        if code is None:
+            code = MAX_VOCAB
+            if len(vocab) < MAX_VOCAB:
+                code = vocab[v] = len(vocab)
+        out[i] = code
+    return out
+
+
+def _to_float(values):
+    """把字符串列表转换为 float64 数组，无法解析的记为 NaN，并返回可解析比例"""
+    out = np.full(len(values), np.nan)
+    parsed = present = 0
+    for i, v in enumerate(values):
+        v = v.strip()
+        if v.lower() in _MISSING:
+            continue
+        present += 1
+        try:
+            out[i] = float(v.replace(",", ""))
+            parsed += 1
+        except ValueError:
+            pass
+    return out, (parsed / present if present else 1.0)
+
+
+class CSVTable:
+    """解析后的列式数据：数值列为 float64 memmap，文本列为 int32 编码 memmap + 词表"""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.columns = [c["name"] for c in self.meta["columns"]]
+        self._info = {c["name"]: c for c in self.meta["columns"]}
+        self._files = {c["name"]: os.path.join(directory, f"col{i}.bin") for i, c in enumerate(self.meta["columns"])}
+        self._data = {}  # 列名 -> memmap，首次使用时打开
+
+    def close(self):
+        """释放已打开的 memmap（其他线程仍持有的映射在其用完后随引用计数关闭，之后再用会重新打开）"""
+        self._data = {}
+
+    def _column(self, name):
+        data = self._data.get(name)
+        if data is None:
+            col = self._info[name]
+            dtype = np.float64 if col["type"] == "numeric" else np.int32
+            if self.rows:
+                data = np.memmap(self._files[name], dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                data = np.zeros(0, dtype=dtype)
+            self._data[name] = data
+        return data
+
+    def column_type(self, name):
+        return self._info[name]["type"]
+
+    def vocab(self, name):
+        return self._info[name].get("vocab", [])
+
+    def blocks(self, name):
+        """按块迭代某列"""
+        data = self._column(name)
+        for start in range(0, self.rows, BLOCK_ROWS):
+            yield data[start:start + BLOCK_ROWS]
+
+    def describe_numeric(self, name):
+        """数值列：count/mean/std/min/max（分块合并）与分位数"""
+        # 分块计算 (count, mean, M2) 后按 Chan 等人的公式合并，避免 E[x²] - E[x]² 在大数值上的抵消误差
+        count = 0
+        mean = 0.0
+        m2 = 0.0
+        low, high = np.inf, -np.inf
+        for block in self.blocks(name):
+            valid = block[~np.isnan(block)]
+            if not len(valid):
+                continue
+            block_count = len(valid)
+            block_mean = float(valid.mean())
+            block_m2 = float(np.square(valid - block_mean).sum())
+            delta = block_mean - mean
+            merged = count + block_count
+            mean += delta * block_count / merged
+            m2 += block_m2 + delta * delta * count * block_count / merged
+            count = merged
+            low = min(low, float(valid.min()))
+            high = max(high, float(valid.max()))
+
+        result = {"type": "numeric", "count": count, "missing": self.rows - count}
+        if not count:
+            return result
+        variance = m2 / max(1, count - 1)
+
+        data = self._column(name)
+        sample = data if self.rows <= QUANTILE_SAMPLE else data[::int(np.ceil(self.rows / QUANTILE_SAMPLE))]
+        sample = np.asarray(sample)
+        q = np.nanpercentile(sample, [25, 50, 75])
+        result.update({
+            "mean": mean,
+            "std": float(np.sqrt(variance)),
+            "min": low,
+            "25%": float(q[0]),
+            "50%": float(q[1]),
+            "75%": float(q[2]),
+            "max": high,
+            "quantiles_approx": self.rows > QUANTILE_SAMPLE
+        })
+        return result
+
+    def value_counts(self, name):
+        """文本列：各取值出现次数（按编码 bincount）"""
+        vocab = self.vocab(name)
+        counts = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for block in self.blocks(name):
+            # 编码 -1 表示缺失，平移到 0 号桶
+            counts += np.bincount(block + 1, minlength=len(counts))
+        return counts[1:], int(counts[0])
+
+    def describe_text(self, name, top=5):
+        counts, missing = self.value_counts(name)
+        order = np.argsort(-counts)[:top]
+        vocab = self.vocab(name)
+        overflow = self._info[name].get("vocab_overflow", False)
+        result = {
+            "type": "text",
+            "count": int(counts.sum()),
+            "missing": missing,
+            "unique": int((counts > 0).sum()),
+            "top": [{"value": vocab[i], "count": int(counts[i])} for i in order if counts[i]]
+        }
+        if overflow:
+            # 超出词表上限的取值合并计入"其他"，unique 为下限
+            result["unique_approx"] = True
+        return result
+
+    def group_by(self, by, column=None, agg="mean"):
+        """分组聚合：count/sum/mean/min/max"""
+        sums, counts, mins, maxs = {}, {}, {}, {}
+        by_blocks = self.blocks(by)
+        value_blocks = self.blocks(column) if column else None
+        for keys in by_blocks:
+            values = next(value_blocks) if value_blocks else None
+            keys = np.asarray(keys)
+            if self.column_type(by) == "numeric":
+                mask = ~np.isnan(keys)
+            else:
+                mask = keys >= 0
+            if values is not None:
+                values = np.asarray(values)
+                mask &= ~np.isnan(values)
+                values = values[mask]
+            uniques, inverse = np.unique(keys[mask], return_inverse=True)
+
+            block_counts = np.bincount(inverse, minlength=len(uniques))
+            block_sums = np.bincount(inverse, weights=values, minlength=len(uniques)) if values is not None else None
+            if values is not None and agg in ("min", "max"):
+                order = np.argsort(inverse, kind="stable")
+                boundaries = np.r_[0, np.cumsum(block_counts)[:-1]]
+                block_mins = np.minimum.reduceat(values[order], boundaries) if len(values) else []
+                block_maxs = np.maximum.reduceat(values[order], boundaries) if len(values) else []
+            for i, key in enumerate(uniques.tolist()):
+                counts[key] = counts.get(key, 0) + int(block_counts[i])
+                if block_sums is not None:
+                    sums[key] = sums.get(key, 0.0) + float(block_sums[i])
+                if values is not None and agg in ("min", "max"):
+                    mins[key] = min(mins.get(key, np.inf), float(block_mins[i]))
+                    maxs[key] = max(maxs.get(key, -np.inf), float(block_maxs[i]))
+
+        vocab = self.vocab(by)
+        groups = []
+        for key, count in counts.items():
+            label = vocab[key] if self.column_type(by) == "text" else key
+            if agg == "count" or column is None:
+                value = count
+            elif agg == "sum":
+                value = sums[key]
+            elif agg == "mean":
+                value = sums[key] / count if count else None
+            elif agg == "min":
+                value = mins[key]
+            elif agg == "max":
+                value = maxs[key]
+            else:
+                raise ValueError(f"不支持的聚合方式: {agg}")
+            groups.append({"group": label, "count": count, agg: value})
+        return groups
+
+    def top_k(self, name, k=10, ascending=False):
+        """数值列取最大/最小的 k 个值及行号；文本列取出现最多的 k 个取值"""
+        if self.column_type(name) == "text":
+            return self.describe_text(name, top=k)["top"]
+
+        candidates = []
+        for block_index, block in enumerate(self.blocks(name)):
+            block = np.asarray(block)
+            valid = np.flatnonzero(~np.isnan(block))
+            if not len(valid):
+                continue
+            scores = block[valid] if ascending else -block[valid]
+            take = min(k, len(valid))
+            best = valid[np.argpartition(scores, take - 1)[:take]]
+            candidates.extend((float(block[i]), block_index * BLOCK_ROWS + int(i)) for i in best)
+        candidates.sort(key=lambda c: c[0], reverse=not ascending)
+        # 行号从 1 开始，不含表头
+        return [{"row": row + 1, "value": value} for value, row in candidates[:k]]
+
+
+class CSVStore:
+    """把 CSV 解析为列式缓存；同一文件内容只解析一次"""
+
+    def __init__(self, cache_dir, max_tables=8, max_digests=1024):
+        """
+        Args:
+            max_tables: 保持打开的 CSVTable 数，超出时关闭最久未用的（磁盘上的解析结果保留）
+            max_digests: 记住的 (路径, mtime, 大小) -> 内容哈希 条目数
+        """
+        self.cache_dir = cache_dir
+        self.max_tables = max_tables
+        self.max_digests = max_digests
+        self._digests = OrderedDict()  # (路径, mtime, 大小) -> 内容哈希，避免重复计算哈希
+        self._tables = OrderedDict()  # 内容哈希 -> CSVTable，按最近使用排序
+        self._loading = {}  # 内容哈希 -> 锁，同一文件只由一个线程解析，不同文件互不阻塞
+        self._lock = threading.Lock()  # 只保护上面几个字典，不在持有时做 I/O
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, path):
+        """返回 (CSVTable, 是否命中缓存)"""
+        stat = os.stat(path)
+        signature = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(signature)
+            if digest is not None:
+                self._digests.move_to_end(signature)
+        if digest is None:
+            digest = _file_digest(path)
+            with self._lock:
+                self._digests[signature] = digest
+                while len(self._digests) > self.max_digests:
+                    self._digests.popitem(last=False)
+
+        with self._lock:
+            table = self._cached_table(digest)
+            if table is not None:
+                return table, True
+            loading = self._loading.setdefault(digest, threading.Lock())
+
+        with loading:
+            with self._lock:
+                table = self._cached_table(digest)
+            if table is not None:
+                return table, True
+            try:
+                directory = os.path.join(self.cache_dir, digest)
+                cached = os.path.exists(os.path.join(directory, "meta.json"))
+                if not cached:
+                    self._parse(path, directory)
+                table = CSVTable(directory)
+                with self._lock:
+                    self._tables[digest] = table
+                    while len(self._tables) > self.max_tables:
+                        _, evicted = self._tables.popitem(last=False)
+                        evicted.close()
+            finally:
+                with self._lock:
+                    self._loading.pop(digest, None)
+            return table, cached
+
+    def _cached_table(self, digest):
+        """取已打开的表并标记为最近使用（需持有 self._lock）"""
+        table = self._tables.get(digest)
+        if table is not None:
+            self._tables.move_to_end(digest)
+        return table
+
+    def _parse(self, path, directory):
+        """分块流式解析，每列追加写入二进制文件"""
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        encoding = _detect_encoding(path)
+
+        with open(path, "r", encoding=encoding, newline="") as f:
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            header = next(reader, [])
+            names = [h.strip() or f"column_{i}" for i, h in enumerate(header)]
+
+            columns = None
+            outputs = []
+            rows = 0
+            try:
+                while True:
+                    chunk = [row for _, row in zip(range(CHUNK_ROWS), reader)]
+                    if not chunk:
+                        break
+                    width = len(names)
+                    values = [[row[i] if i < len(row) else "" for row in chunk] for i in range(width)]
+
+                    if columns is None:
+                        # 用第一批数据推断列类型：九成以上可解析为数字即为数值列
+                        columns = []
+                        for name, col in zip(names, values):
+                            _, ratio = _to_float(col)
+                            columns.append({"name": name, "type": "numeric" if ratio >= 0.9 else "text"})
+                        outputs = [open(os.path.join(tmp_dir, f"col{i}.bin"), "wb") for i in range(width)]
+                        vocabs = [{} for _ in range(width)]
+
+                    for i, col in enumerate(values):
+                        if columns[i]["type"] == "numeric":
+                            array, _ = _to_float(col)
+                        else:
+                            array = _encode_text(col, vocabs[i])
+                        outputs[i].write(array.tobytes())
+                    rows += len(chunk)
+            finally:
+                for out in outputs:
+                    out.close()
+
+        columns = columns or [{"name": name, "type": "text"} for name in names]
+        for i, col in enumerate(columns):
+            if col["type"] == "text":
+                col["vocab"] = list(vocabs[i]) if rows else []
+                if len(col["vocab"]) >= MAX_VOCAB:
+                    # 编码 MAX_VOCAB 对应"其他"（词表满后是否真的出现过由计数决定）
+                    col["vocab"].append(OTHER_LABEL)
+                    col["vocab_overflow"] = True
+            path_i = os.path.join(tmp_dir, f"col{i}.bin")
+            if not os.path.exists(path_i):
+                open(path_i, "wb").close()
+
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"source": os.path.abspath(path), "rows": rows, "columns": columns}, f, ensure_ascii=False)
+        if os.path.exists(directory):
+            # 其他进程已先完成解析
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, directory)
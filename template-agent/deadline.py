@@ -0,0 +1,141 @@
+"""
+截止时间与协作式取消 - 为一轮对话设定总时限，LLM 调用与工具执行在时限内进行，到期或被取消时尽快返回
+"""
+import time
+import queue
+import threading
+
+
+class DeadlineExceeded(Exception):
+    """到达截止时间或被取消"""
+
+
+class CancelToken:
+    """可跨线程设置的取消标志"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="已取消"):
+        self.reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class Deadline:
+    """截止时间（seconds 为 None 表示不限时）+ 取消标志"""
+
+    def __init__(self, seconds=None, token=None):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds if seconds else None
+        self.token = token or CancelToken()
+
+    def remaining(self):
+        """剩余秒数；不限时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self):
+        remaining = self.remaining()
+        return self.token.cancelled or (remaining is not None and remaining <= 0)
+
+    def check(self):
+        """已取消或到期时抛出 DeadlineExceeded"""
+        if self.token.cancelled:
+            raise DeadlineExceeded(self.token.reason)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"超过时限 {self.seconds} 秒")
+
+    def timeout(self, cap=None):
+        """给下游调用的超时时间：剩余时间与 cap 中较小者"""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(remaining, cap)
+
+
+def call_with_deadline(deadline, fn, *args, **kwargs):
+    """在后台线程执行 fn，到期或被取消时立即抛出 DeadlineExceeded
+
+    Python 无法强行终止线程，超时的调用会在后台继续运行直到自行结束（线程为 daemon，不阻止退出），
+    因此下游调用仍应设置自己的超时。
+    """
+    if deadline is None:
+        return fn(*args, **kwargs)
+    deadline.check()
+
+    outcome = {}
+    done = threading.Event()
+
+    def target():
+        try:
+            outcome["result"] = fn(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=target, daemon=True, name="deadline-call").start()
+    while not done.wait(deadline.timeout(0.1)):
+        deadline.check()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def iterate_with_deadline(deadline, fn, *args, **kwargs):
+    """在后台线程调用 fn 并逐项迭代其返回的可迭代对象（如流式响应），调用方在当前线程逐项取出；
+    建立连接与等待每一项时都受截止时间约束，到期或被取消时立即抛出 DeadlineExceeded。
+    放弃迭代后，后台线程在下一项到达时关闭该可迭代对象并退出。
+    """
+    if deadline is None:
+        yield from fn(*args, **kwargs)
+        return
+    deadline.check()
+
+    items = queue.Queue()
+    abandoned = threading.Event()
+
+    def produce():
+        iterable = None
+        try:
+            iterable = fn(*args, **kwargs)
+            for item in iterable:
+                if abandoned.is_set():
+                    break
+                items.put(("item", item))
+            items.put(("end", None))
+        except BaseException as e:
+            items.put(("error", e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if abandoned.is_set() and close:
+                close()
+
+    threading.Thread(target=produce, daemon=True, name="deadline-stream").start()
+    try:
+        while True:
+            deadline.check()
+            try:
+                kind, value = items.get(timeout=deadline.timeout(0.1))
+            except queue.Empty:
+                continue
+            if kind == "item":
+                yield value
+            elif kind == "end":
+                return
+            else:
+                raise value
+    finally:
+        abandoned.set()
@@ -0,0 +1,274 @@
+"""
+文件倒排索引 - 词 → (文件, 行号) 倒排表，按 mtime/内容哈希增量更新，支持关键词与正则检索
+"""
+import os
+import re
+import math
+import bisect
+import time
+import pickle
+import hashlib
+import threading
+from collections import defaultdict
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python 3.10 及以下
+    import sre_parse
+
+from compress import tokenize
+
+
+_EDGE_WORDS = (re.compile(r"^[a-z0-9_]+"), re.compile(r"[a-z0-9_]+$"))
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, "POSSESSIVE_REPEAT", None)} - {None}
+
+DEFAULT_EXCLUDE_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".cache", "venv", ".venv", ".tox"}
+
+
+class FileIndex:
+    """目录级倒排索引"""
+
+    def __init__(self, root, extensions=None, exclude_dirs=None, max_file_bytes=1024 * 1024,
+                 state_path=None, refresh_interval=2.0):
+        self.root = os.path.abspath(root)
+        self.extensions = {e.lower() for e in extensions} if extensions else None
+        self.exclude_dirs = exclude_dirs or DEFAULT_EXCLUDE_DIRS
+        self.max_file_bytes = max_file_bytes
+        self.state_path = state_path
+        self.refresh_interval = refresh_interval
+        self._files = {}  # 相对路径 -> {"mtime", "size", "hash", "tokens": {词: [行号]}}，二进制文件另有 "binary"
+        self._postings = defaultdict(dict)  # 词 -> {相对路径: [行号]}
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+        self._load_state()
+
+    def refresh(self, force=False):
+        """增量更新索引：mtime/大小未变的文件跳过，内容哈希未变的文件只更新元信息"""
+        with self._lock:
+            if not force and time.time() - self._last_refresh < self.refresh_interval:
+                return {"added": 0, "updated": 0, "removed": 0}
+
+            added = updated = dropped = 0
+            seen = set()
+            for path in self._walk():
+                rel = os.path.relpath(path, self.root)
+                seen.add(rel)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = self._files.get(rel)
+                if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                    continue
+                if stat.st_size > self.max_file_bytes:
+                    if entry:
+                        self._remove(rel)
+                        dropped += 1
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+
+                digest = hashlib.sha1(data).hexdigest()
+                if entry and entry["hash"] == digest:
+                    entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+                    continue
+                if entry:
+                    self._remove(rel)
+                    updated += 1
+                else:
+                    added += 1
+                if b"\0" in data[:8192]:
+                    # 二进制文件不建索引，只记录元信息，未改动时下次直接跳过
+                    self._files[rel] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest,
+                                        "tokens": {}, "binary": True}
+                    continue
+                self._add(rel, data.decode("utf-8", errors="replace"), stat, digest)
+
+            removed = [rel for rel in self._files if rel not in seen]
+            for rel in removed:
+                self._remove(rel)
+
+            self._last_refresh = time.time()
+            if added or updated or removed or dropped:
+                self._save_state()
+            return {"added": added, "updated": updated, "removed": len(removed) + dropped}
+
+    def search(self, query, max_results=10, max_lines=5):
+        """关键词检索：按 TF-IDF 给文件打分，返回每个文件中命中最多查询词的行"""
+        with self._lock:
+            terms = list(dict.fromkeys(tokenize(query)))
+            total_files = self._text_files() or 1
+            scores = defaultdict(float)
+            line_hits = defaultdict(lambda: defaultdict(int))
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + total_files / len(postings))
+                for rel, lines in postings.items():
+                    scores[rel] += (1 + math.log(len(lines))) * idf
+                    for line in lines:
+                        line_hits[rel][line] += 1
+
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:max_results]
+            results = []
+            for rel, score in ranked:
+                best = sorted(line_hits[rel].items(), key=lambda kv: (-kv[1], kv[0]))[:max_lines]
+                results.append({
+                    "file": rel,
+                    "score": round(score, 3),
+                    "matches": self._snippets(rel, sorted(line for line, _ in best))
+                })
+            return results
+
+    def search_regex(self, pattern, max_results=10, max_lines=5, ignore_case=False):
+        """正则检索：先用倒排索引按模式中必然出现的字面词筛出候选文件，再逐个匹配，返回命中行数最多的文件"""
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        regex = re.compile(pattern, flags)
+        terms = _required_terms(pattern, flags)
+        with self._lock:
+            files = None
+            for term in terms:
+                postings = self._postings.get(term, {})
+                files = set(postings) if files is None else files & postings.keys()
+                if not files:
+                    break
+            if files is None:
+                files = [rel for rel, entry in self._files.items() if not entry.get("binary")]
+
+        results = []
+        for rel in files:
+            try:
+                with open(os.path.join(self.root, rel), "r", encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError:
+                continue
+            positions = [m.start() for m in regex.finditer(text)]
+            if positions:
+                newlines = [m.start() for m in re.finditer("\n", text)]
+                lines = sorted({bisect.bisect_left(newlines, pos) + 1 for pos in positions})
+                all_lines = text.split("\n")
+                results.append({
+                    "file": rel,
+                    "score": len(lines),
+                    "matches": [{"line": n, "text": all_lines[n - 1].strip()[:200]} for n in lines[:max_lines] if n <= len(all_lines)]
+                })
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:max_results]
+
+    def stats(self):
+        with self._lock:
+            return {"root": self.root, "files": self._text_files(), "terms": len(self._postings)}
+
+    def _text_files(self):
+        return sum(1 for entry in self._files.values() if not entry.get("binary"))
+
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in self.exclude_dirs]
+            for name in filenames:
+                if self.extensions and os.path.splitext(name)[1].lower() not in self.extensions:
+                    continue
+                yield os.path.join(dirpath, name)
+
+    def _add(self, rel, text, stat, digest):
+        tokens = defaultdict(list)
+        # 只按 \n 分行，与 read_file 的行偏移一致
+        for number, line in enumerate(text.split("\n"), 1):
+            for term in set(tokenize(line)):
+                tokens[term].append(number)
+        tokens = dict(tokens)
+        self._files[rel] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "tokens": tokens}
+        for term, lines in tokens.items():
+            self._postings[term][rel] = lines
+
+    def _remove(self, rel):
+        entry = self._files.pop(rel, None)
+        if not entry:
+            return
+        for term in entry["tokens"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(rel, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _snippets(self, rel, line_numbers):
+        """读取命中行内容（只读取排名靠前的文件）"""
+        try:
+            with open(os.path.join(self.root, rel), "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().split("\n")
+        except OSError:
+            return []
+        return [{"line": n, "text": lines[n - 1].strip()[:200]} for n in line_numbers if n <= len(lines)]
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if state.get("root") != self.root:
+            return
+        self._files = state["files"]
+        for rel, entry in self._files.items():
+            for term, lines in entry["tokens"].items():
+                self._postings[term][rel] = lines
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"root": self.root, "files": self._files}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.state_path)
+
+
+def _required_terms(pattern, flags=0):
+    """解析正则，返回任何匹配都必然包含的索引词（无法确定时返回空集合，即不筛选）"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return set()
+    terms = set()
+    _collect_terms(parsed, terms)
+    return terms
+
+
+def _collect_terms(items, terms):
+    """遍历必然匹配的顺序结构，把连续字面字符中的词加入 terms；分支、可选重复等处断开"""
+    run = []
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op == sre_parse.AT and av != sre_parse.AT_NON_BOUNDARY:
+            # \b、^、$ 等位置两侧必然不是词字符，相当于字面串中的分隔符
+            run.append(" ")
+            continue
+        _add_literal_terms("".join(run), terms)
+        run = []
+        if op == sre_parse.SUBPATTERN:
+            _collect_terms(av[-1], terms)
+        elif op in _REPEATS and av[0] >= 1:
+            _collect_terms(av[2], terms)
+        elif op == getattr(sre_parse, "ATOMIC_GROUP", None):
+            _collect_terms(av, terms)
+    _add_literal_terms("".join(run), terms)
+
+
+def _add_literal_terms(run, terms):
+    # 字面串两端的词可能只是文件中更长的词的一部分，不能用于筛选
+    run = run.lower()
+    found = set(tokenize(run))
+    for edge in _EDGE_WORDS:
+        match = edge.search(run)
+        if match:
+            found.discard(match.group())
+    terms.update(found)
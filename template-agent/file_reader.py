@@ -0,0 +1,134 @@
+"""
+大文件读取 - 基于 mmap 的按行/按字节随机访问，行偏移索引按 (路径, mtime, 大小) 缓存
+"""
+import os
+import re
+import mmap
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+_SCAN_BLOCK = 64 * 1024 * 1024  # 建索引时每次扫描的字节数，控制临时内存
+
+
+def _build_line_index(mm, size):
+    """扫描换行符，返回每一行起始字节偏移的数组"""
+    starts = [np.zeros(1, dtype=np.int64)]
+    view = np.frombuffer(mm, dtype=np.uint8)
+    for block_start in range(0, size, _SCAN_BLOCK):
+        block = view[block_start:block_start + _SCAN_BLOCK]
+        newlines = np.flatnonzero(block == 10) + block_start + 1
+        starts.append(newlines.astype(np.int64))
+    del view
+    offsets = np.concatenate(starts)
+    # 文件以换行结尾时，最后一个"行首"即文件末尾，不算一行
+    if offsets[-1] == size and len(offsets) > 1:
+        offsets = offsets[:-1]
+    return offsets
+
+
+class MappedFile:
+    """内存映射的只读文件，附带行偏移索引；用 with 语句在读完后关闭映射"""
+
+    def __init__(self, path, cached_index=None):
+        """
+        Args:
+            cached_index: 之前建好的 (签名, 行偏移数组)，签名与当前文件一致时直接复用
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        stat = os.fstat(self._file.fileno())
+        self.size = stat.st_size
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if cached_index is not None and cached_index[0] == self.signature:
+            self.line_starts = cached_index[1]
+        else:
+            self.line_starts = _build_line_index(self.mm, self.size) if self.size else np.zeros(0, dtype=np.int64)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def total_lines(self):
+        return len(self.line_starts)
+
+    def line_end(self, line):
+        """第 line 行（0 起）之后下一行的起始偏移"""
+        return int(self.line_starts[line + 1]) if line + 1 < self.total_lines else self.size
+
+    def read_lines(self, start, count):
+        """读取 [start, start+count) 行，O(1) 定位"""
+        start = max(0, min(start, self.total_lines))
+        end = min(self.total_lines, start + count)
+        if start >= end:
+            return "", start, start
+        data = self.mm[int(self.line_starts[start]):self.line_end(end - 1)]
+        return data.decode("utf-8", errors="replace"), start, end
+
+    def read_bytes(self, offset, limit):
+        """按字节读取，边界对齐到完整的 UTF-8 字符"""
+        start = max(0, min(offset, self.size))
+        end = min(self.size, start + limit)
+        # UTF-8 续字节为 10xxxxxx，向后移动到字符起点
+        while start < end and self.mm[start] & 0xC0 == 0x80:
+            start += 1
+        while end < self.size and end > start and self.mm[end] & 0xC0 == 0x80:
+            end -= 1
+        return self.mm[start:end].decode("utf-8", errors="replace"), start, end
+
+    def line_of(self, byte_offset):
+        """字节偏移所在的行号（0 起）"""
+        return int(np.searchsorted(self.line_starts, byte_offset, side="right")) - 1
+
+    def grep(self, pattern, start_line=0, max_matches=100, ignore_case=False):
+        """从第 start_line 行（0 起）开始正则匹配，返回 (行号（0 起）, 行内容) 列表与是否还有更多"""
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        regex = re.compile(pattern.encode("utf-8"), flags)
+        begin = int(self.line_starts[start_line]) if start_line < self.total_lines else self.size
+
+        matches = []
+        last_line = -1
+        for match in regex.finditer(self.mm, begin):
+            line = self.line_of(match.start())
+            if line == last_line:
+                continue
+            if len(matches) >= max_matches:
+                return matches, True
+            text = self.mm[int(self.line_starts[line]):self.line_end(line)]
+            matches.append((line, text.decode("utf-8", errors="replace").rstrip("\r\n")))
+            last_line = line
+        return matches, False
+
+    def close(self):
+        if self.size:
+            self.mm.close()
+        self._file.close()
+
+
+class MappedFileCache:
+    """按路径缓存行偏移索引（文件 mtime 或大小变化时重建）；映射本身每次读取时打开、读完即关闭，
+    不长期占用文件句柄，Windows 上也不妨碍随后替换或删除该文件"""
+
+    def __init__(self, max_files=16):
+        self.max_files = max_files
+        self._indexes = OrderedDict()  # 路径 -> (签名, 行偏移数组)
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        """映射文件并复用缓存的行索引，返回的 MappedFile 需由调用方关闭"""
+        path = os.path.realpath(path)
+        with self._lock:
+            cached = self._indexes.get(path)
+        mapped = MappedFile(path, cached)
+        with self._lock:
+            self._indexes[path] = (mapped.signature, mapped.line_starts)
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_files:
+                self._indexes.popitem(last=False)
+        return mapped
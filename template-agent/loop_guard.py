@@ -0,0 +1,98 @@
+"""
+工具调用循环检测 - 对每次调用做指纹，发现重复/循环调用时直接复用上次结果并提示模型，屡教不改时提前结束；
+有副作用的工具（写文件等）执行后清空已保存的结果，之后的调用重新执行
+"""
+import json
+import hashlib
+
+
+def fingerprint(tool_name, arguments):
+    """工具名 + 规范化参数的哈希"""
+    payload = json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(f"{tool_name}\n{payload}".encode("utf-8")).hexdigest()
+
+
+class LoopGuard:
+    """单轮对话内的调用记录
+
+    用法：执行工具前调用 check()，返回上次结果时不再执行；执行后调用 record() 保存结果；
+    每轮迭代结束检查 should_stop，为 True 时应禁用工具让模型直接回答
+    """
+
+    def __init__(self, max_repeats=2, exempt_tools=(), mutating_tools=()):
+        self.max_repeats = max_repeats  # 允许的重复次数，超过后提前结束
+        self.exempt_tools = set(exempt_tools)  # 允许相同参数反复调用的工具（如语音监听）
+        # 有副作用的工具：从不复用结果，执行后之前保存的结果都可能已过期（如写入后再读同一文件）
+        self.mutating_tools = set(mutating_tools)
+        self.reset()
+
+    def reset(self):
+        self._sequence = []  # 按调用顺序的 (工具名, 指纹)
+        self._results = {}  # 指纹 -> 上次写入历史的结果内容
+        self.calls = 0
+        self.repeats = 0
+        self.cycles = 0
+        self.stopped_at = None  # 提前结束时所在的迭代序号
+        self.stopped = False
+
+    def check(self, tool_name, arguments):
+        """登记一次调用；若与之前的调用相同，返回 (上次结果内容, 提示)，否则返回 (None, None)"""
+        fp = fingerprint(tool_name, arguments)
+        previous_call = self._sequence[-1][1] if self._sequence else None
+        self._sequence.append((tool_name, fp))
+        self.calls += 1
+        if tool_name in self.exempt_tools or tool_name in self.mutating_tools or fp not in self._results:
+            return None, None
+
+        if previous_call == fp:
+            self.repeats += 1
+            hint = f"你刚刚已用相同参数调用过 {tool_name}，下面是上次的结果。不要重复调用，请基于已有结果继续，或直接给出回答。"
+        else:
+            self.cycles += 1
+            hint = f"检测到工具调用在循环：{self._cycle_path(fp)}。下面是上次的结果，请换一种做法或直接给出回答。"
+        return self._results[fp], hint
+
+    def record(self, tool_name, arguments, content):
+        """保存本次调用写入历史的结果内容；有副作用的工具清空已保存的结果"""
+        if tool_name in self.mutating_tools:
+            self._results.clear()
+        elif tool_name not in self.exempt_tools:
+            self._results[fingerprint(tool_name, arguments)] = content
+
+    @property
+    def strikes(self):
+        return self.repeats + self.cycles
+
+    @property
+    def should_stop(self):
+        return self.strikes > self.max_repeats
+
+    def stop(self, iteration):
+        """记录在第 iteration 次迭代提前结束"""
+        if not self.stopped:
+            self.stopped = True
+            self.stopped_at = iteration
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "repeats": self.repeats,
+            "cycles": self.cycles,
+            "stopped": self.stopped,
+            "stopped_at": self.stopped_at
+        }
+
+    def _cycle_path(self, fp):
+        """从该调用上次出现的位置到现在的工具名序列，如 a → b → a"""
+        names = [name for name, _ in self._sequence]
+        last = max(i for i, (_, f) in enumerate(self._sequence[:-1]) if f == fp)
+        return " → ".join(names[last:])
+
+
+def repeated_content(previous, hint):
+    """把提示与上次结果拼成工具消息内容"""
+    try:
+        previous = json.loads(previous)
+    except (TypeError, ValueError):
+        pass
+    return json.dumps({"repeated_call": True, "hint": hint, "previous_result": previous}, ensure_ascii=False)
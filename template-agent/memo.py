@@ -0,0 +1,106 @@
+"""
+工具调用记忆化 - 会话内复用纯工具的结果；文件类工具按 (路径, mtime, 大小) 失效，搜索类工具按规范化参数 + TTL 失效
+"""
+import os
+import json
+import time
+from collections import OrderedDict
+
+
+class FilePolicy:
+    """结果只取决于参数与文件内容：文件 mtime 或大小变化即失效"""
+
+    def __init__(self, path_arg="file_path"):
+        self.path_arg = path_arg
+
+    def key(self, arguments):
+        return json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+
+    def validator(self, arguments):
+        """返回当前文件签名；文件不存在时返回 None（不缓存）"""
+        path = arguments.get(self.path_arg)
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+
+    def paths(self, arguments):
+        path = arguments.get(self.path_arg)
+        return [os.path.realpath(path)] if path else []
+
+
+class TTLPolicy:
+    """结果在一段时间内视为不变：按规范化后的参数缓存 ttl 秒"""
+
+    def __init__(self, ttl, normalize=None):
+        self.ttl = ttl
+        self.normalize = normalize
+
+    def key(self, arguments):
+        if self.normalize:
+            arguments = self.normalize(arguments)
+        return json.dumps(arguments, sort_keys=True, ensure_ascii=False)
+
+    def validator(self, arguments):
+        return True  # 只按过期时间失效
+
+    def paths(self, arguments):
+        return []
+
+
+class ToolMemo:
+    """单个会话的工具结果缓存；只缓存成功的结果"""
+
+    def __init__(self, policies, max_entries=128):
+        self.policies = policies
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (工具名, 参数键) -> (校验值, 过期时间, 结果, 涉及的文件)
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, tool_name, arguments, execute):
+        """命中时直接返回缓存结果，否则调用 execute(tool_name, arguments) 并记录；返回 (结果, 是否命中)"""
+        policy = self.policies.get(tool_name)
+        if policy is None:
+            return execute(tool_name, arguments), False
+
+        key = (tool_name, policy.key(arguments))
+        validator = policy.validator(arguments)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if validator is not None and entry[0] == validator and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], True
+            del self._entries[key]
+
+        self.misses += 1
+        result = execute(tool_name, arguments)
+        if validator is not None and isinstance(result, dict) and result.get("success", True) and "error" not in result:
+            ttl = getattr(policy, "ttl", None)
+            expires_at = time.time() + ttl if ttl else float("inf")
+            self._entries[key] = (validator, expires_at, result, policy.paths(arguments))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result, False
+
+    def invalidate_paths(self, paths):
+        """文件被写入后移除与之相关的缓存（防止 mtime 精度不足时读到旧内容）"""
+        targets = {os.path.realpath(p) for p in paths if p}
+        for key in [k for k, entry in self._entries.items() if targets.intersection(entry[3])]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,101 @@
+"""
+内存占用 - 用 tracemalloc 统计进程内存与主要分配位置，按对象图估算每个会话的对话历史、工具结果与缓存占用；
+对话历史超过上限时把最早的若干轮追加写入磁盘（JSONL），内存中只保留最近的对话
+"""
+import os
+import sys
+import json
+import tracemalloc
+
+
+def deep_sizeof(obj):
+    """递归估算对象及其引用的 dict / list / tuple / set / 实例属性占用的字节数（共享对象只计一次）"""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, int, float, bool)) or item is None:
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__") and not callable(item):
+            stack.append(vars(item))
+    return total
+
+
+def start_tracing(frames=1):
+    """开始 tracemalloc 统计（已开始时不重复启动）"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def traced_memory():
+    """tracemalloc 统计的当前与峰值字节数；未启动时返回 None"""
+    if not tracemalloc.is_tracing():
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    return {"traced_bytes": current, "traced_peak_bytes": peak}
+
+
+def top_allocations(limit=10):
+    """按分配位置（文件:行）列出当前占用最多的内存"""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return [
+        {
+            "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "bytes": stat.size,
+            "count": stat.count
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+def spill_history(history, path, max_messages=None, max_bytes=None):
+    """
+    对话历史超过上限时，从最早的一轮开始整轮移出并追加写入 path（JSONL），原地修改 history。
+    只在用户消息处切分，保证保留下来的工具调用与结果成对出现；最后一轮始终保留。
+
+    Returns:
+        移出的消息数
+    """
+    if not max_messages and not max_bytes:
+        return 0
+    sizes = [deep_sizeof(m) for m in history] if max_bytes else None
+    remaining_bytes = sum(sizes) if sizes else 0
+
+    cut = 0
+    for start in (i for i, m in enumerate(history) if i > 0 and m.get("role") == "user"):
+        over_messages = max_messages and len(history) - cut > max_messages
+        over_bytes = max_bytes and remaining_bytes > max_bytes
+        if not (over_messages or over_bytes):
+            break
+        if sizes:
+            remaining_bytes -= sum(sizes[cut:start])
+        cut = start
+    if not cut:
+        return 0
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for message in history[:cut]:
+            f.write(json.dumps(message, ensure_ascii=False) + "\n")
+    del history[:cut]
+    return cut
+
+
+def load_spilled(path):
+    """读取已写入磁盘的历史消息"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
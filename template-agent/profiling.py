@@ -0,0 +1,226 @@
+"""
+性能剖析 - 每轮对话由后台线程定时采样所有线程的调用栈（可选叠加 cProfile），
+写出每轮的折叠栈文件（flamegraph.pl / speedscope 可直接生成火焰图）与 cProfile 数据，
+结束时汇总全程自身耗时最高的函数，以及执行对话的线程耗时在 LLM、JSON、工具、音频间的分布
+"""
+import io
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+
+# 语音工具的耗时计入 audio 而不是 tool
+AUDIO_TOOLS = ("text_to_speech", "speech_to_text")
+
+# 按顶层模块名归类，从栈顶往下取第一个能归类的帧
+_MODULE_CATEGORIES = {
+    "json": "json",
+    "zhipuai": "llm", "httpx": "llm", "httpcore": "llm",
+    "tts_stream": "audio", "tts_cache": "audio", "stt_backends": "audio", "vad": "audio",
+    "pyttsx3": "audio", "pyaudio": "audio", "speech_recognition": "audio",
+    "tools": "tool", "meta_tools": "tool", "web_fetch": "tool", "file_reader": "tool", "file_index": "tool",
+    "csv_analysis": "tool", "code_analysis": "tool", "requests": "tool", "urllib3": "tool", "ddgs": "tool",
+}
+_LLM_FUNCTIONS = ("_call_llm", "_collect_stream")
+CATEGORIES = ("llm", "json", "tool", "audio", "other")
+
+# 栈中出现这些帧说明线程在空闲等待任务（线程池、TTS 队列、指标服务），不计入采样
+_IDLE_FRAMES = {("queue", "get"), ("selectors", "select"), ("socketserver", "serve_forever")}
+# 线程池工作线程在 C 实现的队列上等待时，栈顶就是 _worker
+_IDLE_LEAVES = {("concurrent.futures.thread", "_worker")}
+
+
+def _module(frame):
+    return frame.f_globals.get("__name__") or ""
+
+
+def _classify(frame):
+    """判断执行对话的线程当前在做什么"""
+    while frame is not None:
+        code = frame.f_code
+        module = _module(frame)
+        if code.co_name in _LLM_FUNCTIONS:
+            return "llm"
+        if module == "tool_executor" and code.co_name == "run":
+            return "audio" if frame.f_locals.get("tool_name") in AUDIO_TOOLS else "tool"
+        if module == "deadline" and code.co_name == "call_with_deadline":
+            # 在后台线程执行的调用：按被调函数所在模块归类
+            fn = frame.f_locals.get("fn")
+            category = _MODULE_CATEGORIES.get((getattr(fn, "__module__", None) or "").split(".")[0])
+            if category:
+                return category
+        category = _MODULE_CATEGORIES.get(module.split(".")[0])
+        if category:
+            return category
+        frame = frame.f_back
+    return "other"
+
+
+class _Sampler(threading.Thread):
+    """定时抓取所有线程的调用栈，累计折叠栈与对话线程的耗时分类"""
+
+    def __init__(self, interval, target_ident):
+        super().__init__(daemon=True, name="profiler")
+        self.interval = interval
+        self.target_ident = target_ident
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.ticks = 0
+        self._labels = {}  # code 对象 -> 函数标签
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.ticks += 1
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident == self.target_ident:
+                    self.categories[_classify(frame)] += 1
+                if (_module(frame), frame.f_code.co_name) in _IDLE_LEAVES:
+                    continue
+                labels = []
+                idle = False
+                while frame is not None:
+                    code = frame.f_code
+                    if (_module(frame), code.co_name) in _IDLE_FRAMES:
+                        idle = True
+                        break
+                    label = self._labels.get(code)
+                    if label is None:
+                        label = self._labels[code] = (
+                            f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                        )
+                    labels.append(label)
+                    frame = frame.f_back
+                if idle or not labels:
+                    continue
+                # 同类线程（tool_0、tool_1 ...）合并到同一个根节点
+                thread = re.sub(r"[-_]\d+.*$", "", names.get(ident, "thread"))
+                labels.append(thread)
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """按轮剖析；每轮写出 <序号>-<标签>.collapsed（及 cprofile 模式下的 .prof），summary() 汇总全程"""
+
+    def __init__(self, out_dir, mode="sample", interval=0.005, top=25):
+        """
+        Args:
+            out_dir: 输出目录，每次运行在其下新建一个以时间命名的子目录
+            mode: sample 只采样；cprofile 额外用 cProfile 精确统计执行对话的线程
+            interval: 采样间隔（秒）
+            top: 汇总中列出的函数个数
+        """
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"不支持的剖析模式: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.out_dir = os.path.join(out_dir, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.turns = 0
+        self.elapsed = 0.0
+        self._self_seconds = Counter()  # 函数标签 -> 采样估算的自身耗时（秒）
+        self._categories = Counter()  # 分类 -> 秒
+        self._stats = None  # 合并后的 cProfile 数据
+
+    @contextmanager
+    def turn(self, label="turn"):
+        """剖析一轮（with 语句）"""
+        self.turns += 1
+        name = f"{self.turns:03d}-{re.sub(r'[^0-9A-Za-z_.-]+', '_', label)}"
+        sampler = _Sampler(self.interval, threading.get_ident())
+        profile = cProfile.Profile() if self.mode == "cprofile" else None
+        started_at = time.perf_counter()
+        sampler.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            sampler.stop()
+            self._finish_turn(name, sampler, profile, time.perf_counter() - started_at)
+
+    def _finish_turn(self, name, sampler, profile, elapsed):
+        self.elapsed += elapsed
+        # 每次采样代表的实际时间（采样线程受 GIL 影响，间隔并不精确）
+        per_tick = elapsed / sampler.ticks if sampler.ticks else 0.0
+
+        path = os.path.join(self.out_dir, f"{name}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        for stack, count in sampler.stacks.items():
+            self._self_seconds[stack.rsplit(";", 1)[-1]] += count * per_tick
+        for category, count in sampler.categories.items():
+            self._categories[category] += count * per_tick
+
+        if profile is not None:
+            profile.dump_stats(os.path.join(self.out_dir, f"{name}.prof"))
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+        total = sum(sampler.categories.values()) or 1
+        breakdown = " ".join(
+            f"{c} {sampler.categories[c] * 100 / total:.0f}%" for c in CATEGORIES if sampler.categories[c]
+        )
+        print(f"[剖析] {name}: {elapsed:.2f} 秒，{breakdown or '无采样'} -> {path}")
+
+    def summary(self):
+        """生成全程汇总，写入 summary.txt 并返回文本"""
+        lines = [f"剖析汇总：{self.turns} 轮，共 {self.elapsed:.2f} 秒，输出目录 {self.out_dir}", ""]
+
+        total = sum(self._categories.values())
+        lines.append("耗时分布（执行对话的线程）：")
+        for category in CATEGORIES:
+            seconds = self._categories[category]
+            if seconds:
+                lines.append(f"  {category:<6} {seconds:>9.2f} 秒 {seconds * 100 / total:>6.1f}%")
+
+        total = sum(self._self_seconds.values())
+        lines += ["", f"自身耗时最高的函数（采样，所有活动线程，前 {self.top} 个）："]
+        for label, seconds in self._self_seconds.most_common(self.top):
+            lines.append(f"  {seconds:>9.3f} 秒 {seconds * 100 / total:>6.1f}%  {label}")
+
+        if self._stats is not None:
+            buffer = io.StringIO()
+            self._stats.stream = buffer
+            self._stats.sort_stats("tottime").print_stats(self.top)
+            lines += ["", "cProfile 自身耗时（tottime）最高的函数：", buffer.getvalue().strip()]
+
+        text = "\n".join(lines) + "\n"
+        with open(os.path.join(self.out_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        return text
+
+
+def add_profile_arguments(parser, default_dir, default_interval):
+    """为入口脚本添加 --profile 相关命令行参数"""
+    parser.add_argument("--profile", nargs="?", const="sample", choices=("sample", "cprofile"),
+                        help="剖析每一轮：sample 为采样（默认），cprofile 额外记录 cProfile")
+    parser.add_argument("--profile-dir", default=default_dir, help="剖析结果输出目录")
+    parser.add_argument("--profile-interval", type=float, default=default_interval, help="采样间隔（秒）")
+
+
+def profiler_from_args(args):
+    """根据命令行参数创建 Profiler，未开启时返回 None"""
+    if not args.profile:
+        return None
+    return Profiler(args.profile_dir, args.profile, args.profile_interval)
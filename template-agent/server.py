@@ -0,0 +1,489 @@
+"""
+多会话 HTTP 服务 - 在一个进程内用 asyncio 托管大量相互隔离的 Agent 会话，共享 LLM 客户端、工具执行器与各类缓存；
+回复以 SSE 流式推送，每个会话有排队与推送缓冲上限（背压），空闲会话定期移出内存（之后可从会话存储恢复）
+
+接口:
+    POST   /sessions                 创建会话；body 可选 {"session_id": "..."}，恢复已保存的会话
+    POST   /sessions/<id>/messages   发送消息，body {"message": "..."}；默认以 SSE 推送
+                                     delta（文本分片）与 done（完整回复）事件，
+                                     请求头 Accept: application/json 时等完整回复后返回 JSON
+    POST   /run                      无状态的单轮请求，body {"message": "..."}；从 Agent 池借用实例，
+                                     返回格式同上
+    DELETE /sessions/<id>            结束会话（从内存移出，已保存的记录保留）
+    GET    /sessions                 内存中的会话
+    GET    /health                   健康检查
+    GET    /metrics                  Prometheus 指标
+
+用法:
+    python server.py [--host 127.0.0.1] [--port 8000]
+"""
+import re
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_MAX_SESSIONS, SERVER_MAX_CONCURRENT_TURNS, SERVER_SESSION_IDLE_SECONDS,
+    SERVER_SESSION_QUEUE, SERVER_STREAM_BUFFER, SERVER_STREAM_STALL_SECONDS, SERVER_MAX_BODY_BYTES,
+    SERVER_EXCLUDED_TOOLS, SERVER_POOL_MIN_SIZE, SERVER_POOL_RESIZE_INTERVAL, SERVER_POOL_CHECKOUT_TIMEOUT,
+    TOOL_IO_WORKERS
+)
+from agent import Agent, SYSTEM_PROMPT, get_session_store, get_tool_executor
+from agent_pool import get_pool, PoolExhausted
+from session_store import SESSION_ID_PATTERN
+from deadline import CancelToken
+from tracing import tracer
+from metrics import registry
+
+
+SSE_HEARTBEAT_SECONDS = 15  # 等待期间发送注释行，防止代理断开空闲连接
+HEADER_TIMEOUT_SECONDS = 30
+_MESSAGES_PATH = re.compile(r"^/sessions/([^/]+)/messages$")
+_SESSION_PATH = re.compile(r"^/sessions/([^/]+)$")
+
+_REQUESTS = registry.counter("agent_server_requests_total", "HTTP 请求数", ["method", "status"])
+_REJECTED = registry.counter(
+    "agent_server_rejected_total", "因背压被拒绝的请求，reason 为 session_busy/capacity", ["reason"]
+)
+_EVICTED = registry.counter("agent_server_evicted_sessions_total", "移出内存的会话数，reason 为 idle/capacity/closed", ["reason"])
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class Session:
+    """一个会话：独立的 Agent 实例，同一时间只处理一轮"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.waiting = 0  # 排队等待处理的消息数
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+
+    @property
+    def busy(self):
+        return self.lock.locked() or self.waiting > 0
+
+    def info(self):
+        return {
+            "session_id": self.agent.session_id,
+            "turns": self.turns,
+            "busy": self.lock.locked(),
+            "waiting": self.waiting,
+            "idle_seconds": round(time.monotonic() - self.last_active, 1)
+        }
+
+
+class AgentServer:
+    def __init__(self, max_sessions=SERVER_MAX_SESSIONS, max_concurrent_turns=SERVER_MAX_CONCURRENT_TURNS,
+                 idle_seconds=SERVER_SESSION_IDLE_SECONDS, session_queue=SERVER_SESSION_QUEUE,
+                 stream_buffer=SERVER_STREAM_BUFFER, stall_seconds=SERVER_STREAM_STALL_SECONDS,
+                 excluded_tools=SERVER_EXCLUDED_TOOLS):
+        """
+        Args:
+            max_sessions: 内存中最多保留的会话数，超出时移出最久未用的空闲会话
+            max_concurrent_turns: 同时执行的对话轮数（执行线程数），其余排队
+            idle_seconds: 会话空闲多久后移出内存
+            session_queue: 单个会话正在处理时最多再排队的消息数，超出返回 429
+            stream_buffer: 单个流最多缓冲的未发送分片数，满时暂停读取 LLM 输出
+            stall_seconds: 缓冲满后等待客户端读取的最长时间，超时取消本轮
+            excluded_tools: 服务模式下不提供的工具（如依赖本机麦克风、扬声器的语音工具）
+        """
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.session_queue = session_queue
+        self.stream_buffer = stream_buffer
+        self.stall_seconds = stall_seconds
+        self.excluded_tools = set(excluded_tools or ())
+        self.sessions = OrderedDict()  # 会话 ID -> Session，按最近使用排序
+        self._turns = ThreadPoolExecutor(max_workers=max_concurrent_turns, thread_name_prefix="turn")
+        # 所有并发轮共享工具执行器：I/O 线程数不少于并发轮数，否则工具调用会在池中排队
+        get_tool_executor(io_workers=max(TOOL_IO_WORKERS, max_concurrent_turns))
+        # 会话长期占用实例，无状态请求临时借用；上限为二者之和，因此会话数未满时借出不会等待
+        self.pool = get_pool(
+            "server", self._new_agent,
+            min_size=SERVER_POOL_MIN_SIZE,
+            max_size=max_sessions + max_concurrent_turns,
+            resize_interval=SERVER_POOL_RESIZE_INTERVAL
+        )
+        self._server = None
+        self._evictor = None
+        registry.register_collector(self._collect_metrics)
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self._evictor = asyncio.create_task(self._evict_idle_loop())
+        return self._server
+
+    async def close(self):
+        if self._evictor:
+            self._evictor.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for session_id in list(self.sessions):
+            self._evict(session_id, "closed")
+        self._turns.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+
+    # ---------- 会话管理 ----------
+
+    async def _get_session(self, session_id, create=False):
+        """取得内存中的会话；不在内存但已保存时透明恢复；create 为 True 时不存在则新建"""
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+            raise HTTPError(400, "无效的会话 ID")
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        store = get_session_store()
+        if not create and not (store and store.exists(session_id)):
+            raise HTTPError(404, f"会话不存在: {session_id}")
+        return await self._create_session(session_id)
+
+    def _new_agent(self):
+        agent = Agent(system_prompt=SYSTEM_PROMPT)
+        if self.excluded_tools:
+            agent.tools = [t for t in agent.tools if t["function"]["name"] not in self.excluded_tools]
+        return agent
+
+    async def _create_session(self, session_id=None):
+        if len(self.sessions) >= self.max_sessions and not self._evict_lru():
+            _REJECTED.inc(reason="capacity")
+            raise HTTPError(503, "会话数已达上限，请稍后再试", {"Retry-After": "5"})
+        try:
+            # 池中没有空闲实例时会当场创建 Agent，放到线程中执行以免阻塞事件循环
+            agent = await asyncio.get_running_loop().run_in_executor(None, self.pool.checkout, 0)
+        except PoolExhausted:
+            _REJECTED.inc(reason="capacity")
+            raise HTTPError(503, "没有可用的 Agent，请稍后再试", {"Retry-After": "5"})
+        if session_id and session_id in self.sessions:
+            # 等待期间同一会话已被并发请求恢复
+            self.pool.checkin(agent)
+            return self.sessions[session_id]
+        if session_id:
+            # 已保存的会话在首次使用历史时从会话存储恢复
+            agent.resume_session(session_id)
+        session = self.sessions[agent.session_id] = Session(agent)
+        return session
+
+    def _evict(self, session_id, reason):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        store = get_session_store()
+        if store:
+            store.close(session_id)
+        self.pool.checkin(session.agent)
+        _EVICTED.inc(reason=reason)
+        tracer.debug("[服务] 会话 %s 已移出内存（%s）", session_id, reason)
+
+    def _evict_lru(self):
+        """容量已满时移出最久未用的空闲会话，返回是否腾出了位置"""
+        for session_id, session in self.sessions.items():
+            if not session.busy:
+                self._evict(session_id, "capacity")
+                return True
+        return False
+
+    async def _evict_idle_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, self.idle_seconds / 4)))
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if not session.busy and now - session.last_active > self.idle_seconds:
+                    self._evict(session_id, "idle")
+
+    # ---------- HTTP ----------
+
+    async def _handle(self, reader, writer):
+        method, status = "-", 500
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            status = await self._dispatch(method, path, headers, body, writer)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            status = 499
+        except Exception as e:
+            if isinstance(e, HTTPError):
+                status, message, headers = e.status, e.message, e.headers
+            else:
+                tracer.error("[服务] 处理请求出错: %s", e)
+                message, headers = str(e), None
+            try:
+                await self._send_json(writer, status, {"error": message}, headers)
+            except ConnectionError:
+                status = 499
+        finally:
+            _REQUESTS.inc(method=method, status=str(status))
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT_SECONDS)
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "请求头过大")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "无效的 Content-Length")
+        if length < 0:
+            raise HTTPError(400, "无效的 Content-Length")
+        if length > SERVER_MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method, path, headers, body, writer):
+        if method == "GET" and path == "/health":
+            return await self._send_json(writer, 200, {"status": "ok", "sessions": len(self.sessions)})
+        if method == "GET" and path == "/metrics":
+            return await self._send(writer, 200, registry.render().encode("utf-8"),
+                                    "text/plain; version=0.0.4; charset=utf-8")
+        if method == "GET" and path == "/sessions":
+            return await self._send_json(writer, 200, {"sessions": [s.info() for s in self.sessions.values()]})
+        if method == "POST" and path == "/sessions":
+            session_id = _parse_json(body).get("session_id")
+            session = await (self._get_session(session_id, create=True) if session_id else self._create_session())
+            return await self._send_json(writer, 201, {"session_id": session.agent.session_id})
+
+        if method == "POST" and path == "/run":
+            message = _parse_json(body).get("message")
+            if not isinstance(message, str) or not message.strip():
+                raise HTTPError(400, "缺少 message")
+            return await self._run_stateless(message, "application/json" not in headers.get("accept", ""), writer)
+
+        match = _MESSAGES_PATH.match(path)
+        if match and method == "POST":
+            message = _parse_json(body).get("message")
+            if not isinstance(message, str) or not message.strip():
+                raise HTTPError(400, "缺少 message")
+            session = await self._get_session(match.group(1))
+            stream = "application/json" not in headers.get("accept", "")
+            return await self._post_message(session, message, stream, writer)
+
+        match = _SESSION_PATH.match(path)
+        if match and method == "DELETE":
+            session_id = match.group(1)
+            if session_id not in self.sessions:
+                raise HTTPError(404, f"会话不存在: {session_id}")
+            if self.sessions[session_id].busy:
+                raise HTTPError(409, "会话正在处理消息")
+            self._evict(session_id, "closed")
+            return await self._send_json(writer, 200, {"session_id": session_id, "closed": True})
+
+        raise HTTPError(404, f"未知接口: {method} {path}")
+
+    async def _post_message(self, session, message, stream, writer):
+        # 背压：同一会话同时只处理一轮，排队超过上限直接拒绝
+        if session.lock.locked() and session.waiting >= self.session_queue:
+            _REJECTED.inc(reason="session_busy")
+            raise HTTPError(429, "该会话还有消息在处理，请稍后再试", {"Retry-After": "1"})
+        session.waiting += 1
+        try:
+            await session.lock.acquire()
+        finally:
+            session.waiting -= 1
+        try:
+            if stream:
+                await self._stream_turn(session, message, writer)
+            else:
+                response = await self._run_turn(session, message, None, CancelToken())
+                await self._send_json(writer, 200, self._result(session, response))
+            return 200
+        finally:
+            session.turns += 1
+            session.last_active = time.monotonic()
+            session.lock.release()
+
+    async def _run_stateless(self, message, stream, writer):
+        """从池中借一个 Agent 处理单轮请求，结束后归还（历史随之清空）"""
+        loop = asyncio.get_running_loop()
+        try:
+            agent = await loop.run_in_executor(None, self.pool.checkout, SERVER_POOL_CHECKOUT_TIMEOUT)
+        except PoolExhausted:
+            _REJECTED.inc(reason="capacity")
+            raise HTTPError(503, "没有可用的 Agent，请稍后再试", {"Retry-After": "1"})
+        session = Session(agent)
+        try:
+            if stream:
+                await self._stream_turn(session, message, writer)
+            else:
+                response = await self._run_turn(session, message, None, CancelToken())
+                await self._send_json(writer, 200, self._result(session, response))
+            return 200
+        finally:
+            store = get_session_store()
+            if store:
+                store.close(agent.session_id)
+            self.pool.checkin(agent)
+
+    def _run_turn(self, session, message, on_delta, token):
+        """在执行线程中运行一轮，返回 asyncio Future"""
+        agent = session.agent
+
+        def run():
+            agent.on_delta = on_delta
+            try:
+                return agent.run(message, cancel_token=token)
+            finally:
+                agent.on_delta = None
+
+        return asyncio.get_running_loop().run_in_executor(self._turns, run)
+
+    async def _stream_turn(self, session, message, writer):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        slots = threading.Semaphore(self.stream_buffer)  # 未发送分片的上限
+        token = CancelToken()
+
+        def on_delta(text):
+            # 在执行本轮的线程中调用：缓冲满时阻塞，LLM 流随之暂停读取；客户端长时间不读取则取消本轮
+            if token.cancelled:
+                return
+            if not slots.acquire(timeout=self.stall_seconds):
+                token.cancel("客户端读取过慢")
+                return
+            loop.call_soon_threadsafe(queue.put_nowait, ("delta", text))
+
+        future = self._run_turn(session, message, on_delta, token)
+        future.add_done_callback(lambda _: queue.put_nowait(("end", None)))
+
+        get = None
+        try:
+            await self._send_head(writer, 200, "text/event-stream; charset=utf-8", {"Cache-Control": "no-cache"})
+            while True:
+                if get is None:
+                    get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get}, timeout=SSE_HEARTBEAT_SECONDS)
+                if not done:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                kind, text = get.result()
+                get = None
+                if kind == "end":
+                    break
+                await _send_event(writer, "delta", {"text": text})
+                slots.release()
+            try:
+                response = future.result()
+            except Exception as e:
+                await _send_event(writer, "error", {"error": str(e)})
+            else:
+                await _send_event(writer, "done", self._result(session, response))
+        finally:
+            if get is not None:
+                get.cancel()
+            if not future.done():
+                # 客户端断开：取消本轮，并放行阻塞在缓冲上的执行线程，等本轮结束后再处理该会话的下一条消息
+                token.cancel("客户端已断开")
+                for _ in range(self.stream_buffer):
+                    slots.release()
+                await asyncio.wait({future})
+
+    def _result(self, session, response):
+        return {
+            "session_id": session.agent.session_id,
+            "response": response,
+            "status": session.agent._turn_status
+        }
+
+    async def _send_head(self, writer, status, content_type, headers=None, length=None):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def _send(self, writer, status, body, content_type, headers=None):
+        await self._send_head(writer, status, content_type, headers, len(body))
+        writer.write(body)
+        await writer.drain()
+        return status
+
+    async def _send_json(self, writer, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return await self._send(writer, status, body, "application/json; charset=utf-8", headers)
+
+    def _collect_metrics(self):
+        sessions = list(self.sessions.values())
+        return [
+            ("agent_server_sessions", "gauge", "内存中的会话数", [({}, len(sessions))]),
+            ("agent_server_busy_sessions", "gauge", "正在处理消息的会话数",
+             [({}, sum(1 for s in sessions if s.lock.locked()))]),
+            ("agent_server_waiting_messages", "gauge", "排队等待处理的消息数", [({}, sum(s.waiting for s in sessions))])
+        ]
+
+
+def _parse_json(body):
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "请求体不是有效的 JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "请求体应为 JSON 对象")
+    return data
+
+
+async def _send_event(writer, event, data):
+    writer.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+    await writer.drain()
+
+
+async def serve(host=SERVER_HOST, port=SERVER_PORT):
+    server = AgentServer()
+    await server.start(host, port)
+    print(f"Agent 服务已启动: http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话 Agent HTTP 服务")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("服务已停止")
+    finally:
+        get_tool_executor().shutdown()
+        store = get_session_store()
+        if store:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+会话存储 - 每条消息产生时即追加写入会话日志（JSONL，只追加），每隔若干条消息在轮次结束时写一次压缩快照；
+恢复会话时只读取快照与快照之后的日志尾部，不需要重放整个会话
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+SNAPSHOT_VERSION = 1
+# 会话 ID 直接用作文件名，只允许字母、数字、下划线与连字符（排除路径分隔符、盘符与 . 开头的名称）
+SESSION_ID_PATTERN = re.compile(r"[0-9A-Za-z_-]{1,64}")
+
+
+def _trim_partial_line(path, chunk_size=65536):
+    """去掉进程中断时留下的不完整末行，避免后续追加的记录与之拼在同一行"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            if pos == end and chunk.endswith(b"\n"):
+                return
+            cut = chunk.rfind(b"\n")
+            if cut >= 0:
+                f.truncate(start + cut + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+class SessionStore:
+    """按会话保存 <会话ID>.log.jsonl（逐条日志）与 <会话ID>.snapshot.json（快照及其对应的日志偏移）"""
+
+    def __init__(self, directory, snapshot_every=50, fsync=False, max_open=64):
+        """
+        Args:
+            directory: 存储目录
+            snapshot_every: 距上次快照追加了多少条日志后，在轮次结束时写新快照
+            fsync: 每条日志写入后是否 fsync（更耐断电，但更慢）
+            max_open: 同时保持打开的日志文件数，超出时关闭最久未用的
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.max_open = max_open
+        self._files = OrderedDict()  # 会话 ID -> 以追加方式打开的日志文件
+        self._pending = {}  # 会话 ID -> 上次快照后追加的日志条数
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, session_id, message):
+        """追加一条消息"""
+        self._write(session_id, {"op": "message", "message": message})
+
+    def record_spill(self, session_id, count):
+        """记录内存中最早的 count 条消息已被移出（恢复时同样移出）"""
+        self._write(session_id, {"op": "spill", "count": count})
+
+    def maybe_snapshot(self, session_id, messages, meta=None):
+        """距上次快照追加的日志足够多时写快照；只应在轮次结束（历史完整）时调用。返回是否写入"""
+        if self._pending.get(session_id, 0) < self.snapshot_every:
+            return False
+        self.snapshot(session_id, messages, meta)
+        return True
+
+    def snapshot(self, session_id, messages, meta=None):
+        """写入当前历史的快照（先写临时文件再替换）"""
+        with self._lock:
+            f = self._files.get(session_id)
+            if f is not None:
+                f.flush()
+            log_path = self._path(session_id, "log.jsonl")
+            offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+            self._pending[session_id] = 0
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "session_id": session_id,
+            "offset": offset,
+            "created": time.time(),
+            "meta": meta or {},
+            "messages": messages
+        }
+        path = self._path(session_id, "snapshot.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, session_id):
+        """
+        读取快照与之后的日志尾部。
+
+        Returns:
+            (消息列表, meta)；会话不存在时返回 (None, None)
+        """
+        snapshot_path = self._path(session_id, "snapshot.json")
+        log_path = self._path(session_id, "log.jsonl")
+        if not os.path.exists(snapshot_path) and not os.path.exists(log_path):
+            return None, None
+
+        messages, meta, offset = [], {}, 0
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            messages, meta, offset = data["messages"], data.get("meta", {}), data["offset"]
+
+        spilled = 0
+        tail = 0
+        if os.path.exists(log_path):
+            with open(log_path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # 进程中断时写了一半的最后一行
+                    tail += 1
+                    if record["op"] == "message":
+                        messages.append(record["message"])
+                    elif record["op"] == "spill":
+                        del messages[:record["count"]]
+                        spilled += record["count"]
+        if spilled:
+            meta["spilled_messages"] = meta.get("spilled_messages", 0) + spilled
+        with self._lock:
+            self._pending[session_id] = tail
+        return messages, meta
+
+    def exists(self, session_id):
+        return os.path.exists(self._path(session_id, "log.jsonl"))
+
+    def list_sessions(self):
+        """按最近修改时间倒序列出会话 ID"""
+        suffix = ".log.jsonl"
+        names = [n for n in os.listdir(self.directory) if n.endswith(suffix)]
+        names.sort(key=lambda n: os.path.getmtime(os.path.join(self.directory, n)), reverse=True)
+        return [n[:-len(suffix)] for n in names]
+
+    def close(self, session_id=None):
+        """关闭指定会话（默认全部）的日志文件"""
+        with self._lock:
+            ids = [session_id] if session_id else list(self._files)
+            for sid in ids:
+                f = self._files.pop(sid, None)
+                if f is not None:
+                    f.close()
+
+    def _write(self, session_id, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            f = self._open(session_id)
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+
+    def _open(self, session_id):
+        """取得会话的追加句柄（需持有锁）；先去掉上次中断时留下的不完整末行"""
+        f = self._files.get(session_id)
+        if f is not None:
+            self._files.move_to_end(session_id)
+            return f
+        path = self._path(session_id, "log.jsonl")
+        if os.path.exists(path):
+            _trim_partial_line(path)
+        f = self._files[session_id] = open(path, "a", encoding="utf-8")
+        while len(self._files) > self.max_open:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        return f
+
+    def _path(self, session_id, suffix):
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+            raise ValueError(f"无效的会话 ID: {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.{suffix}")
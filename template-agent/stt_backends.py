@@ -0,0 +1,140 @@
+"""
+语音识别后端 - 统一接口，支持在线（Google）与离线（Vosk / PocketSphinx）引擎
+"""
+import os
+import json
+import threading
+
+import speech_recognition as sr
+
+
+class STTBackend:
+    """语音识别后端基类
+
+    recognize() 返回识别文本；无法识别时抛出 sr.UnknownValueError，
+    服务不可用时抛出 sr.RequestError，与 speech_recognition 的约定一致。
+    """
+    name = "base"
+
+    def load(self, language="zh-CN"):
+        """加载 language 的模型（离线后端在此常驻内存），默认无操作"""
+
+    def recognize(self, audio, language="zh-CN"):
+        raise NotImplementedError
+
+
+class GoogleSTTBackend(STTBackend):
+    """Google Web Speech API（免费，需要网络）"""
+    name = "google"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio, language="zh-CN"):
+        return self.recognizer.recognize_google(audio, language=language)
+
+
+class VoskSTTBackend(STTBackend):
+    """Vosk 离线识别，模型只加载一次"""
+    name = "vosk"
+    sample_rate = 16000
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self, language="zh-CN"):
+        # Vosk 的语言由模型目录决定
+        if self.model is None:
+            from vosk import Model, SetLogLevel
+            SetLogLevel(-1)
+            if not self.model_path:
+                raise sr.RequestError("未配置 VOSK_MODEL_PATH")
+            self.model = Model(self.model_path)
+
+    def recognize(self, audio, language="zh-CN"):
+        from vosk import KaldiRecognizer
+
+        self.load()
+        # 识别器轻量，每句新建；模型本身常驻
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+
+        # 中文模型按字输出空格分隔的结果
+        if language.startswith("zh"):
+            text = text.replace(" ", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class PocketSphinxSTTBackend(STTBackend):
+    """PocketSphinx 离线识别，每种语言的解码器只初始化一次"""
+    name = "sphinx"
+    sample_rate = 16000
+
+    def __init__(self, model_dir=None):
+        # 目录结构与 speech_recognition 的 pocketsphinx-data 一致：<model_dir>/<语言>/acoustic-model 等；
+        # 未配置时使用 speech_recognition 自带的数据目录（只含 en-US）
+        self.model_dir = model_dir or os.path.join(os.path.dirname(os.path.abspath(sr.__file__)), "pocketsphinx-data")
+        self.decoders = {}
+        self._lock = threading.Lock()  # 解码器有状态，不能并发使用
+
+    def load(self, language="zh-CN"):
+        decoder = self.decoders.get(language)
+        if decoder is None:
+            language_dir = os.path.join(self.model_dir, language)
+            if not os.path.isdir(language_dir):
+                raise sr.RequestError(f"PocketSphinx 缺少 {language} 的模型，请放到 {language_dir}")
+            from pocketsphinx import Decoder
+
+            decoder = self.decoders[language] = Decoder(
+                hmm=os.path.join(language_dir, "acoustic-model"),
+                lm=os.path.join(language_dir, "language-model.lm.bin"),
+                dict=os.path.join(language_dir, "pronounciation-dictionary.dict"),
+                samprate=self.sample_rate
+            )
+        return decoder
+
+    def recognize(self, audio, language="zh-CN"):
+        raw = audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2)
+        with self._lock:
+            decoder = self.load(language)
+            decoder.start_utt()
+            decoder.process_raw(raw, full_utt=True)
+            decoder.end_utt()
+            hypothesis = decoder.hyp()
+
+        if hypothesis is None or not hypothesis.hypstr:
+            raise sr.UnknownValueError()
+        return hypothesis.hypstr
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def create_stt_backend(name, **options):
+    """按名称创建识别后端"""
+    if name == "google":
+        return GoogleSTTBackend()
+    elif name == "vosk":
+        return VoskSTTBackend(options.get("model_path"))
+    elif name == "sphinx":
+        return PocketSphinxSTTBackend(options.get("model_dir"))
+    else:
+        raise ValueError(f"未知语音识别后端: {name}")
+
+
+def get_stt_backend(name=None):
+    """获取常驻的识别后端实例（同名后端全进程只创建一次）"""
+    from config import STT_BACKEND, VOSK_MODEL_PATH, SPHINX_MODEL_DIR
+
+    name = name or STT_BACKEND
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = create_stt_backend(name, model_path=VOSK_MODEL_PATH, model_dir=SPHINX_MODEL_DIR)
+            _backends[name] = backend
+    return backend
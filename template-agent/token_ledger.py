@@ -0,0 +1,143 @@
+"""
+Token 账本 - 记录每次 LLM 调用的 prompt/completion token 数，按会话、Agent、需求汇总，
+支持会话级配额，合计持久化到 SQLite 供统计报表使用
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+_CJK = re.compile(r"[一-鿿]+")
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = sum(len(run) for run in _CJK.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+class QuotaExceeded(Exception):
+    """会话的 token 用量已达到配额"""
+
+
+class TokenLedger:
+    """线程安全的 token 账本；db_path 为 None 时只在内存中汇总"""
+
+    def __init__(self, db_path=None, max_sessions=10000):
+        """
+        Args:
+            max_sessions: 内存中缓存累计用量的会话数（启用 SQLite 时生效，淘汰的会话需要时从数据库重新汇总）
+        """
+        self.max_sessions = max_sessions
+        self._totals = OrderedDict()  # 会话 ID -> 已用 token 数，按最近使用排序
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_calls ("
+                "ts REAL, session_id TEXT, agent TEXT, requirement TEXT, model TEXT, "
+                "prompt_tokens INTEGER, completion_tokens INTEGER, estimated INTEGER)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_session ON llm_calls (session_id)")
+            self._db.commit()
+
+    def record(self, session_id, agent, prompt_tokens, completion_tokens, model=None, requirement=None,
+               estimated=False):
+        """记录一次调用，返回该会话累计用量"""
+        with self._lock:
+            total = self._totals.get(session_id)
+            if total is None:
+                total = self._load_total(session_id)
+            total += prompt_tokens + completion_tokens
+            self._remember(session_id, total)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), session_id, agent, requirement, model,
+                     prompt_tokens, completion_tokens, int(estimated))
+                )
+                self._db.commit()
+            return total
+
+    def session_total(self, session_id):
+        with self._lock:
+            total = self._totals.get(session_id)
+            if total is None:
+                total = self._load_total(session_id)
+            self._remember(session_id, total)
+            return total
+
+    def forget(self, session_id):
+        """会话结束或移出内存时丢弃缓存的累计用量（已写入 SQLite 的记录不受影响）"""
+        with self._lock:
+            self._totals.pop(session_id, None)
+
+    def remaining(self, session_id, quota):
+        """配额剩余量；quota 为 None 表示不限"""
+        if not quota:
+            return None
+        return max(0, quota - self.session_total(session_id))
+
+    def check(self, session_id, quota):
+        """已达到配额时抛出 QuotaExceeded"""
+        remaining = self.remaining(session_id, quota)
+        if remaining is not None and remaining <= 0:
+            raise QuotaExceeded(f"会话 token 用量已达配额 {quota}")
+
+    def report(self, group_by="agent"):
+        """按 session / agent / requirement 汇总（需启用 SQLite）"""
+        if group_by not in ("session_id", "agent", "requirement", "model"):
+            raise ValueError(f"不支持的汇总维度: {group_by}")
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {group_by}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(estimated) "
+                f"FROM llm_calls GROUP BY {group_by} ORDER BY SUM(prompt_tokens + completion_tokens) DESC"
+            ).fetchall()
+        return [
+            {group_by: key, "calls": calls, "prompt_tokens": prompt, "completion_tokens": completion,
+             "total_tokens": prompt + completion, "estimated_calls": estimated}
+            for key, calls, prompt, completion, estimated in rows
+        ]
+
+    def _remember(self, session_id, total):
+        """缓存累计用量（需持有锁）；只有能从 SQLite 重新汇总时才按上限淘汰，否则会丢失用量"""
+        self._totals[session_id] = total
+        self._totals.move_to_end(session_id)
+        if self._db is not None:
+            while len(self._totals) > self.max_sessions:
+                self._totals.popitem(last=False)
+
+    def _load_total(self, session_id):
+        """恢复已持久化会话的累计用量（需持有锁）"""
+        if self._db is None:
+            return 0
+        row = self._db.execute(
+            "SELECT SUM(prompt_tokens + completion_tokens) FROM llm_calls WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] or 0
+
+
+def main():
+    """命令行报表: python token_ledger.py <数据库路径> [session_id|agent|requirement|model]"""
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        return
+    ledger = TokenLedger(sys.argv[1])
+    group_by = sys.argv[2] if len(sys.argv) > 2 else "agent"
+    print(f"{group_by:<40} {'调用':>6} {'prompt':>10} {'completion':>10} {'合计':>10} {'估算':>6}")
+    for row in ledger.report(group_by):
+        key = str(row[group_by]).replace("\n", " ")[:40]
+        print(f"{key:<40} {row['calls']:>6} {row['prompt_tokens']:>10} {row['completion_tokens']:>10} "
+              f"{row['total_tokens']:>10} {row['estimated_calls']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+工具执行器 - I/O 型工具在线程池执行，CPU 密集或依赖原生库（音频）的工具在可复用的子进程池执行；
+每个工具有独立超时，结果有大小上限，并统计利用率与超时次数
+"""
+import json
+import time
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from tracing import tracer
+
+
+_QUEUE_POLL_SECONDS = 0.05  # 排队期间检查调用是否已开始执行的间隔
+
+
+def _run_timed(execute, tool_name, arguments):
+    """在工作线程/进程中执行并计时，返回 (执行耗时, 结果)；出错时耗时记在异常的 busy_seconds 上"""
+    started_at = time.perf_counter()
+    try:
+        result = execute(tool_name, arguments)
+    except Exception as e:
+        e.busy_seconds = time.perf_counter() - started_at
+        raise
+    return time.perf_counter() - started_at, result
+
+
+class _PoolStats:
+    """单个池的计数（需持有执行器的锁）"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.started_at = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+
+    def snapshot(self):
+        uptime = max(1e-9, time.monotonic() - self.started_at)
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "in_flight": self.in_flight,
+            "utilization": round(min(1.0, self.busy_seconds / (self.workers * uptime)), 4)
+        }
+
+
+class ToolExecutor:
+    """按工具类型分派到线程池或进程池执行"""
+
+    def __init__(self, execute, io_workers=8, process_workers=2, process_tools=(),
+                 timeouts=None, default_timeout=60, max_result_chars=200000):
+        """
+        Args:
+            execute: 执行单个工具的函数 execute(tool_name, arguments)，需为模块级函数（进程池要求可序列化）
+            process_tools: 在子进程中执行的工具名
+            timeouts: {工具名: 超时秒数}，未列出的使用 default_timeout
+            max_result_chars: 结果序列化后的最大字符数，超出时截断
+        """
+        self.execute = execute
+        self.process_tools = set(process_tools)
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_result_chars = max_result_chars
+        self.process_workers = process_workers
+        self._threads = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="tool")
+        self._processes = None
+        self._lock = threading.Lock()
+        self._stats = {"thread": _PoolStats(io_workers), "process": _PoolStats(process_workers)}
+        self._terminated = weakref.WeakSet()  # 因某个调用超时而被主动终止的进程池
+
+    def run(self, tool_name, arguments, deadline=None):
+        """执行工具并返回结果；工具超时返回错误结果，整轮截止时间到期则抛出 DeadlineExceeded"""
+        kind = "process" if tool_name in self.process_tools else "thread"
+        timeout = self.timeouts.get(tool_name, self.default_timeout)
+        if deadline is not None:
+            deadline.check()
+
+        try:
+            future, pool = self._submit(kind, tool_name, arguments)
+        except BrokenProcessPool as e:
+            return self._crashed(tool_name, e.pool)
+
+        # 工具超时从开始执行时计时（进程池的调用在送入工作进程队列时即视为开始），
+        # 在池中排队的时间只受整轮截止时间约束
+        expires_at = None
+        while True:
+            if expires_at is None and future.running():
+                expires_at = time.monotonic() + timeout
+            step = _QUEUE_POLL_SECONDS if expires_at is None else expires_at - time.monotonic()
+            if deadline is not None:
+                step = min(step, deadline.timeout(0.1))
+            done, _ = wait([future], timeout=max(0.0, step))
+            if done:
+                break
+            if deadline is not None and deadline.expired:
+                self._abandon(kind, future, pool)
+                deadline.check()
+            if expires_at is not None and time.monotonic() >= expires_at:
+                with self._lock:
+                    self._stats[kind].timeouts += 1
+                self._abandon(kind, future, pool)
+                tracer.warning("[执行器] 工具 %s 超时（%s 秒）", tool_name, timeout)
+                return {"success": False, "error": f"工具 {tool_name} 执行超时（{timeout} 秒）", "timeout": True}
+
+        try:
+            _, result = future.result()
+        except (BrokenProcessPool, CancelledError) as e:
+            if pool in self._terminated:
+                # 同一进程池中另一个调用超时，整个池被终止重建，不是本工具崩溃
+                return {"success": False, "error": f"工具 {tool_name} 因其他工具超时被中断，请重试"}
+            if isinstance(e, BrokenProcessPool):
+                return self._crashed(tool_name, pool)
+            return {"success": False, "error": f"工具 {tool_name} 已取消"}
+        except Exception as e:
+            return {"success": False, "error": f"工具执行出错: {str(e)}"}
+        return self._cap(result)
+
+    def stats(self):
+        with self._lock:
+            return {kind: stats.snapshot() for kind, stats in self._stats.items()}
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False)
+        with self._lock:
+            if self._processes is not None:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+
+    def _submit(self, kind, tool_name, arguments):
+        with self._lock:
+            if kind == "process":
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+                pool = self._processes
+            else:
+                pool = self._threads
+            stats = self._stats[kind]
+            stats.submitted += 1
+            stats.in_flight += 1
+        try:
+            future = pool.submit(_run_timed, self.execute, tool_name, arguments)
+        except BrokenProcessPool as e:
+            with self._lock:
+                stats.in_flight -= 1
+            e.pool = pool
+            raise
+
+        def on_done(f):
+            # 利用率只计工作线程/进程实际执行的时间，不含排队
+            error = None if f.cancelled() else f.exception()
+            with self._lock:
+                stats.in_flight -= 1
+                if f.cancelled():
+                    stats.failed += 1
+                elif error is not None:
+                    stats.busy_seconds += getattr(error, "busy_seconds", 0.0)
+                    stats.failed += 1
+                else:
+                    stats.busy_seconds += f.result()[0]
+                    stats.completed += 1
+
+        future.add_done_callback(on_done)
+        return future, pool
+
+    def _abandon(self, kind, future, pool):
+        """放弃超时的调用：线程无法终止，只能任其在后台结束；子进程则连同进程池一起重建"""
+        if not future.cancel() and kind == "process":
+            self._reset_processes(pool, terminated=True)
+
+    def _reset_processes(self, pool=None, terminated=False):
+        """终止进程池的所有工作进程，下次使用时重建；pool 已被替换时不做处理。
+        terminated 表示因超时主动终止，池中其他正在执行的调用据此不计为崩溃"""
+        with self._lock:
+            if pool is None:
+                pool = self._processes
+            if pool is None or pool is not self._processes:
+                return False
+            self._processes = None
+            if terminated:
+                self._terminated.add(pool)
+        terminate = getattr(pool, "terminate_workers", None)
+        if terminate is not None:
+            terminate()
+        else:
+            for process in list((getattr(pool, "_processes", None) or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def _crashed(self, tool_name, pool):
+        # 同一次崩溃只由第一个发现的调用计数并重建进程池
+        if self._reset_processes(pool):
+            with self._lock:
+                self._stats["process"].crashes += 1
+            tracer.error("[执行器] 执行 %s 的工作进程异常退出，已重建进程池", tool_name)
+        return {"success": False, "error": f"工具 {tool_name} 的工作进程异常退出"}
+
+    def _cap(self, result):
+        """结果过大时截断，避免撑爆内存与上下文"""
+        text = json.dumps(result, ensure_ascii=False, default=str)
+        if len(text) <= self.max_result_chars:
+            return result
+        return {
+            "success": result.get("success", True) if isinstance(result, dict) else True,
+            "truncated": True,
+            "original_chars": len(text),
+            "content": text[:self.max_result_chars]
+        }
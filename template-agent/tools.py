@@ -1,9 +1,85 @@
 """
 标准工具定义 - 遵循 GLM-4 Tool Calling 协议
 """
+import os
+import re
+import time
+import shutil
+import hashlib
+import tempfile
+import unicodedata
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from ddgs import DDGS
 import pyttsx3
 import speech_recognition as sr
+from config import (
+    VAD_ENABLED, VAD_HANGOVER_MS, VAD_FRAME_MS, VAD_MAX_PHRASE_SECONDS,
+    TTS_VOICE, TTS_CACHE_ENABLED, TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR, TTS_CACHE_MAX_TEXT_CHARS,
+    SEARCH_CACHE_TTL, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_DB,
+    SEARCH_MAX_CONCURRENCY, MULTI_SEARCH_SNIPPET_CHARS, MULTI_SEARCH_MAX_WORKERS,
+    FETCH_CACHE_DIR, FETCH_CACHE_FRESH_SECONDS, FETCH_PER_HOST_LIMIT, FETCH_MAX_WORKERS,
+    FETCH_TIMEOUT, FETCH_MAX_DOWNLOAD_BYTES,
+    READ_FILE_MAX_BYTES, READ_FILE_DEFAULT_LINES, READ_FILE_MAX_LINES, READ_FILE_MAX_MATCHES, FILE_INDEX_CACHE_MAX,
+    SEARCH_FILES_ROOT, SEARCH_FILES_EXTENSIONS, SEARCH_FILES_MAX_BYTES, SEARCH_INDEX_DIR,
+    CODE_ANALYSIS_CACHE_DIR, CODE_ANALYSIS_WORKERS, LONG_FUNCTION_LINES, COMPLEXITY_THRESHOLD,
+    CSV_CACHE_DIR, CSV_OPEN_TABLES_MAX, TOOL_MEMO_SEARCH_TTL
+)
+from memo import FilePolicy, TTLPolicy
+from tracing import tracer
+from vad import listen_with_vad
+from stt_backends import get_stt_backend
+from tts_cache import TTSCache, read_wav
+from cache import TTLCache
+from web_fetch import WebFetcher
+from file_reader import MappedFileCache
+from file_index import FileIndex
+from code_analysis import CodeAnalyzer, summarize
+from csv_analysis import CSVStore
+
+# 合成音频缓存：重复短语（问候、提示语等）直接播放已渲染好的 PCM
+_tts_cache = TTSCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_DIR) if TTS_CACHE_ENABLED else None
+_tts_cache_usable = _tts_cache is not None  # 引擎输出非 WAV 或未安装 pyaudio 时置为 False，之后直接朗读
+_pyaudio = None
+
+# 搜索客户端复用 + 结果缓存（多轮调研中经常重复或微调查询）
+_ddgs = None
+_search_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL, SEARCH_CACHE_DB)
+_search_slots = threading.BoundedSemaphore(SEARCH_MAX_CONCURRENCY)  # 同时发往搜索后端的请求上限
+
+# 网页抓取器：连接池 + 按主机限流 + 磁盘缓存，全进程共享
+_fetcher = WebFetcher(
+    cache_dir=FETCH_CACHE_DIR,
+    fresh_seconds=FETCH_CACHE_FRESH_SECONDS,
+    per_host_limit=FETCH_PER_HOST_LIMIT,
+    max_workers=FETCH_MAX_WORKERS,
+    timeout=FETCH_TIMEOUT,
+    max_download_bytes=FETCH_MAX_DOWNLOAD_BYTES
+)
+
+# 大文件的内存映射与行偏移索引缓存
+_mapped_files = MappedFileCache(FILE_INDEX_CACHE_MAX)
+
+# 各根目录的倒排索引（首次检索时建立，之后增量更新）
+_file_indexes = {}
+_file_indexes_lock = threading.Lock()
+
+# 代码分析器：进程池在首次需要时创建并复用
+_code_analyzer = CodeAnalyzer(
+    cache_dir=CODE_ANALYSIS_CACHE_DIR,
+    max_workers=CODE_ANALYSIS_WORKERS,
+    long_function_lines=LONG_FUNCTION_LINES,
+    complex_threshold=COMPLEXITY_THRESHOLD
+)
+
+# CSV 列式缓存：按文件内容哈希保存解析结果
+_csv_store = CSVStore(CSV_CACHE_DIR, CSV_OPEN_TABLES_MAX)
+
+# 多查询结果合并参数
+_RRF_K = 60
+_TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "spm"}
 
 def get_tool_definitions():
     """返回符合 GLM-4 Tool Calling 格式的工具定义"""
@@ -30,17 +106,226 @@ def get_tool_definitions():
                 }
             }
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "multi_search",
+                "description": "一次并发搜索多个相关查询，合并去重后返回排序好的结果。需要从多个角度调研同一主题时优先使用",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "queries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "搜索查询关键词列表（建议 2-5 个）"
+                        },
+                        "num_results": {
+                            "type": "integer",
+                            "description": "每个查询返回的结果数量",
+                            "default": 5
+                        },
+                        "max_total": {
+                            "type": "integer",
+                            "description": "合并后最多返回的结果数量",
+                            "default": 15
+                        }
+                    },
+                    "required": ["queries"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "fetch_url",
+                "description": "抓取网页并提取正文文本，用于阅读搜索结果中的具体页面",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "url": {
+                            "type": "string",
+                            "description": "网页地址（http/https）"
+                        },
+                        "max_chars": {
+                            "type": "integer",
+                            "description": "返回正文的最大字符数",
+                            "default": 8000
+                        }
+                    },
+                    "required": ["url"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "fetch_urls",
+                "description": "并发抓取多个网页并提取正文，一次阅读多个搜索结果时使用",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "urls": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "网页地址列表"
+                        },
+                        "max_chars": {
+                            "type": "integer",
+                            "description": "每个网页返回正文的最大字符数",
+                            "default": 4000
+                        }
+                    },
+                    "required": ["urls"]
+                }
+            }
+        },
         {
             "type": "function",
             "function": {
                 "name": "read_file",
-                "description": "读取本地文件内容",
+                "description": "读取本地文件内容。大文件请用 offset/limit 分段读取，或用 head/tail/grep 只看需要的部分",
                 "parameters": {
                     "type": "object",
                     "properties": {
                         "file_path": {
                             "type": "string",
                             "description": "文件路径"
+                        },
+                        "offset": {
+                            "type": "integer",
+                            "description": "起始位置：按行时为行号（从 1 开始，与 grep 返回的行号一致），按字节时为字节偏移（从 0 开始）"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "读取数量：按行时为行数，按字节时为字节数；grep 时为最多返回的匹配行数。单次读取有上限，超出部分需分段读取"
+                        },
+                        "unit": {
+                            "type": "string",
+                            "enum": ["line", "byte"],
+                            "description": "offset/limit 的单位，默认 line",
+                            "default": "line"
+                        },
+                        "head": {
+                            "type": "integer",
+                            "description": "只读取开头 N 行（unit 为 byte 时为 N 字节）"
+                        },
+                        "tail": {
+                            "type": "integer",
+                            "description": "只读取末尾 N 行（unit 为 byte 时为 N 字节）"
+                        },
+                        "grep": {
+                            "type": "string",
+                            "description": "正则表达式，只返回匹配的行（带行号）"
+                        }
+                    },
+                    "required": ["file_path"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "search_files",
+                "description": "在目录下的文件中检索关键词或正则表达式，返回按相关度排序的文件及命中行。查找代码/文档内容时先用它定位，再用 read_file 读取需要的部分",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "关键词（空格分隔）或正则表达式"
+                        },
+                        "regex": {
+                            "type": "boolean",
+                            "description": "是否把 query 当作正则表达式",
+                            "default": False
+                        },
+                        "path": {
+                            "type": "string",
+                            "description": "检索的根目录，默认为配置的 SEARCH_FILES_ROOT"
+                        },
+                        "max_results": {
+                            "type": "integer",
+                            "description": "最多返回的文件数",
+                            "default": 10
+                        }
+                    },
+                    "required": ["query"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "analyze_code",
+                "description": "分析 Python 代码文件或目录，返回结构化的代码质量事实：函数列表、圈复杂度、过长函数、未使用的导入、缺少错误处理的调用等。代码审查时优先使用，无需逐个读取源码",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "path": {
+                            "type": "string",
+                            "description": "Python 文件或目录路径"
+                        },
+                        "max_issues": {
+                            "type": "integer",
+                            "description": "最多返回的问题条数",
+                            "default": 50
+                        },
+                        "include_functions": {
+                            "type": "boolean",
+                            "description": "是否附带每个文件的函数概览",
+                            "default": False
+                        }
+                    },
+                    "required": ["path"]
+                }
+            }
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "csv_stats",
+                "description": "对 CSV 文件做统计分析（无需读取整个文件）：describe 查看各列统计、group_by 分组聚合、top_k 取最大/最小值或最常见取值、columns 查看列信息。同一文件的后续分析直接复用解析缓存",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "file_path": {
+                            "type": "string",
+                            "description": "CSV 文件路径"
+                        },
+                        "operation": {
+                            "type": "string",
+                            "enum": ["columns", "describe", "group_by", "top_k"],
+                            "description": "分析操作，默认 describe",
+                            "default": "describe"
+                        },
+                        "columns": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "describe 时只统计这些列，默认全部"
+                        },
+                        "column": {
+                            "type": "string",
+                            "description": "group_by 时被聚合的数值列；top_k 时排序的列"
+                        },
+                        "by": {
+                            "type": "string",
+                            "description": "group_by 的分组列"
+                        },
+                        "agg": {
+                            "type": "string",
+                            "enum": ["count", "sum", "mean", "min", "max"],
+                            "description": "group_by 的聚合方式，默认 mean",
+                            "default": "mean"
+                        },
+                        "k": {
+                            "type": "integer",
+                            "description": "top_k 返回数量 / group_by 返回的最大组数",
+                            "default": 10
+                        },
+                        "ascending": {
+                            "type": "boolean",
+                            "description": "top_k 是否取最小值，group_by 是否升序",
+                            "default": False
                         }
                     },
                     "required": ["file_path"]
@@ -51,7 +336,7 @@ def get_tool_definitions():
             "type": "function",
             "function": {
                 "name": "write_file",
-                "description": "写入内容到文件",
+                "description": "写入内容到文件。逐步撰写报告时用 append 模式只追加新增部分；需要同时写多个文件时用 files 一次完成",
                 "parameters": {
                     "type": "object",
                     "properties": {
@@ -62,9 +347,28 @@ def get_tool_definitions():
                         "content": {
                             "type": "string",
                             "description": "要写入的内容"
+                        },
+                        "mode": {
+                            "type": "string",
+                            "enum": ["overwrite", "append"],
+                            "description": "overwrite 覆盖整个文件，append 追加到文件末尾，默认 overwrite",
+                            "default": "overwrite"
+                        },
+                        "files": {
+                            "type": "array",
+                            "description": "批量写入：每项包含 file_path、content 和可选的 mode；提供时忽略上面的单文件参数",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "file_path": {"type": "string"},
+                                    "content": {"type": "string"},
+                                    "mode": {"type": "string", "enum": ["overwrite", "append"]}
+                                },
+                                "required": ["file_path", "content"]
+                            }
                         }
                     },
-                    "required": ["file_path", "content"]
+                    "required": []
                 }
             }
         },
@@ -125,15 +429,63 @@ def execute_tool(tool_name, arguments):
     """执行工具调用"""
     if tool_name == "web_search":
         return web_search(arguments.get("query"), arguments.get("num_results", 5))
+    elif tool_name == "multi_search":
+        return multi_search(
+            arguments.get("queries"),
+            arguments.get("num_results", 5),
+            arguments.get("max_total", 15)
+        )
+    elif tool_name == "fetch_url":
+        return fetch_url(arguments.get("url"), arguments.get("max_chars", 8000))
+    elif tool_name == "fetch_urls":
+        return fetch_urls(arguments.get("urls"), arguments.get("max_chars", 4000))
     elif tool_name == "read_file":
-        return read_file(arguments.get("file_path"))
+        return read_file(
+            arguments.get("file_path"),
+            offset=arguments.get("offset"),
+            limit=arguments.get("limit"),
+            unit=arguments.get("unit", "line"),
+            head=arguments.get("head"),
+            tail=arguments.get("tail"),
+            grep=arguments.get("grep")
+        )
+    elif tool_name == "search_files":
+        return search_files(
+            arguments.get("query"),
+            arguments.get("regex", False),
+            arguments.get("path"),
+            arguments.get("max_results", 10)
+        )
+    elif tool_name == "analyze_code":
+        return analyze_code(
+            arguments.get("path"),
+            arguments.get("max_issues", 50),
+            arguments.get("include_functions", False)
+        )
+    elif tool_name == "csv_stats":
+        return csv_stats(
+            arguments.get("file_path"),
+            arguments.get("operation", "describe"),
+            columns=arguments.get("columns"),
+            column=arguments.get("column"),
+            by=arguments.get("by"),
+            agg=arguments.get("agg", "mean"),
+            k=arguments.get("k", 10),
+            ascending=arguments.get("ascending", False)
+        )
     elif tool_name == "write_file":
-        return write_file(arguments.get("file_path"), arguments.get("content"))
+        return write_file(
+            arguments.get("file_path"),
+            arguments.get("content"),
+            arguments.get("mode", "overwrite"),
+            arguments.get("files")
+        )
     elif tool_name == "text_to_speech":
         return text_to_speech(
             arguments.get("text"),
             arguments.get("rate", 150),
-            arguments.get("volume", 1.0)
+            arguments.get("volume", 1.0),
+            arguments.get("voice")
         )
     elif tool_name == "speech_to_text":
         return speech_to_text(
@@ -144,14 +496,63 @@ def execute_tool(tool_name, arguments):
         return {"error": f"未知工具: {tool_name}"}
 
 
+def get_memo_policies():
+    """可在会话内复用结果的工具及其失效方式（未列出的工具有副作用，每次都执行）"""
+    fetch_policy = TTLPolicy(TOOL_MEMO_SEARCH_TTL)
+    return {
+        "read_file": FilePolicy("file_path"),
+        "csv_stats": FilePolicy("file_path"),
+        "web_search": TTLPolicy(TOOL_MEMO_SEARCH_TTL, lambda args: {
+            "query": normalize_query(args.get("query") or ""),
+            "num_results": args.get("num_results", 5)
+        }),
+        "multi_search": TTLPolicy(TOOL_MEMO_SEARCH_TTL, _multi_search_memo_key),
+        "fetch_url": fetch_policy,
+        "fetch_urls": fetch_policy
+    }
+
+
+def _multi_search_memo_key(args):
+    """multi_search 的复用键：查询按原顺序规范化（与 multi_search 一样接受单个字符串）"""
+    queries = args.get("queries")
+    if isinstance(queries, str):
+        queries = [queries]
+    return {
+        "queries": [normalize_query(q) for q in queries or [] if isinstance(q, str)],
+        "num_results": args.get("num_results", 5),
+        "max_total": args.get("max_total", 15)
+    }
+
+
+def _get_search_client():
+    """复用 DuckDuckGo 客户端，避免每次搜索都重建连接"""
+    global _ddgs
+    if _ddgs is None:
+        _ddgs = DDGS()
+    return _ddgs
+
+
+def normalize_query(query):
+    """规范化查询：统一全半角与大小写、合并空白（标点与词序有意义，保持不变）"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
 def web_search(query, num_results=5):
-    """真实网络搜索 - 使用 DuckDuckGo"""
+    """真实网络搜索 - 使用 DuckDuckGo，相同（或仅大小写、全半角、空白不同）的查询命中缓存"""
+    global _ddgs
+    if not isinstance(query, str) or not query.strip():
+        return {"success": False, "error": "query 必须是非空字符串"}
+    cache_key = f"{normalize_query(query)}|{num_results}"
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        tracer.debug("命中搜索缓存: %s", query)
+        return {**cached, "query": query, "cached": True}
+    
     try:
-        ddgs = DDGS()
-        results = list(ddgs.text(query, max_results=num_results))
+        with _search_slots:
+            results = list(_get_search_client().text(query, max_results=num_results))
         
-        # 调试：打印原始结果
-        print(f"[DEBUG] 搜索到 {len(results)} 条结果")
+        tracer.debug("搜索到 %d 条结果", len(results))
         
         if not results:
             return {
@@ -167,59 +568,393 @@ def web_search(query, num_results=5):
                 "url": r.get("href", "")
             })
         
-        return {
+        result = {
             "success": True,
             "query": query,
             "count": len(formatted_results),
             "results": formatted_results
         }
+        _search_cache.set(cache_key, result)
+        return {**result, "cached": False}
     except Exception as e:
-        print(f"[ERROR] 搜索失败: {str(e)}")
+        # 客户端可能处于异常状态（如被限流），下次重新创建
+        _ddgs = None
+        tracer.error("搜索失败: %s", e)
         return {"success": False, "error": f"搜索出错: {str(e)}"}
 
 
-def read_file(file_path):
-    """读取文件"""
+def normalize_url(url):
+    """规范化 URL 用于去重：忽略协议大小写、www 前缀、片段、跟踪参数与末尾斜杠"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    params = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/")
+    return urlunsplit(("", host, path, urlencode(params), "")).lstrip("/")
+
+
+def multi_search(queries, num_results=5, max_total=15):
+    """多查询并发搜索 - 合并结果，按 URL 去重，按倒数排名融合（RRF）排序"""
+    if isinstance(queries, str):
+        queries = [queries]
+    queries = [q.strip() for q in queries or [] if isinstance(q, str) and q.strip()]
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        return {"success": False, "error": "queries 不能为空"}
+    
+    # 并发执行；实际发往后端的请求数由 _search_slots 限制
+    with ThreadPoolExecutor(max_workers=min(len(queries), MULTI_SEARCH_MAX_WORKERS)) as pool:
+        outcomes = list(pool.map(lambda q: web_search(q, num_results), queries))
+    
+    merged = {}
+    failed = []
+    cached_queries = 0
+    for query, outcome in zip(queries, outcomes):
+        if not outcome.get("success"):
+            failed.append({"query": query, "error": outcome.get("error")})
+            continue
+        cached_queries += bool(outcome.get("cached"))
+        for rank, r in enumerate(outcome["results"], 1):
+            key = normalize_url(r["url"]) if r["url"] else f"{query}#{rank}"
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {**r, "score": 0.0, "matched_queries": []}
+            elif query in entry["matched_queries"]:
+                # 同一查询内重复出现的 URL 只按最靠前的排名计分
+                continue
+            elif len(r["snippet"]) > len(entry["snippet"]):
+                entry["snippet"] = r["snippet"]
+            entry["score"] += 1.0 / (_RRF_K + rank)
+            entry["matched_queries"].append(query)
+    
+    if not merged:
+        return {
+            "success": False,
+            "error": "所有查询均未找到结果，请尝试其他关键词",
+            "failed": failed
+        }
+    
+    ranked = sorted(merged.values(), key=lambda e: e["score"], reverse=True)[:max_total]
+    for entry in ranked:
+        entry["score"] = round(entry["score"], 4)
+        if len(entry["snippet"]) > MULTI_SEARCH_SNIPPET_CHARS:
+            entry["snippet"] = entry["snippet"][:MULTI_SEARCH_SNIPPET_CHARS] + "..."
+    
+    return {
+        "success": True,
+        "queries": queries,
+        "count": len(ranked),
+        "total_unique": len(merged),
+        "cached_queries": cached_queries,
+        "failed": failed,
+        "results": ranked
+    }
+
+
+def get_search_cache_stats():
+    """返回搜索缓存命中率统计"""
+    return _search_cache.stats()
+
+
+def fetch_url(url, max_chars=8000):
+    """抓取网页正文"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return {"success": True, "content": content}
+        return _fetcher.fetch(url, max_chars)
+    except Exception as e:
+        return {"success": False, "url": url, "error": f"抓取出错: {str(e)}"}
+
+
+def fetch_urls(urls, max_chars=4000):
+    """并发抓取多个网页正文"""
+    try:
+        pages = _fetcher.fetch_many(urls, max_chars)
+    except Exception as e:
+        return {"success": False, "error": f"抓取出错: {str(e)}"}
+    if not pages:
+        return {"success": False, "error": "urls 不能为空"}
+    return {
+        "success": any(p.get("success") for p in pages),
+        "count": sum(1 for p in pages if p.get("success")),
+        "pages": pages
+    }
+
+
+def read_file(file_path, offset=None, limit=None, unit="line", head=None, tail=None, grep=None):
+    """读取文件 - 小文件整体读取；大文件或指定范围时通过 mmap 按需读取。按行时行号从 1 开始（与 grep、search_files 一致）"""
+    try:
+        ranged = any(v is not None for v in (offset, limit, head, tail, grep))
+        if not ranged and os.path.getsize(file_path) <= READ_FILE_MAX_BYTES:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            return {"success": True, "content": content}
+        
+        with _mapped_files.open(file_path) as mapped:
+            base = {"success": True, "file_path": file_path, "size": mapped.size, "total_lines": mapped.total_lines}
+            
+            # head/tail 与 offset/limit 使用同一单位；单次读取量不超过上限，截断时在 note 中说明
+            from_end = head is None and tail is not None
+            if not grep:
+                limit = head if head is not None else tail if from_end else limit
+            
+            if unit == "byte" and not grep:
+                length = READ_FILE_MAX_BYTES if limit is None else min(limit, READ_FILE_MAX_BYTES)
+                start = 0 if head is not None else max(0, mapped.size - length) if from_end else offset or 0
+                content, start, end = mapped.read_bytes(start, length)
+                result = {**base, "content": content, "start_byte": start, "end_byte": end, "has_more": end < mapped.size}
+                if limit is not None and limit > READ_FILE_MAX_BYTES and (start > 0 if from_end else result["has_more"]):
+                    result["note"] = f"单次最多读取 {READ_FILE_MAX_BYTES} 字节，已截断；请用 offset 继续读取"
+                return result
+            
+            first_line = max(1, offset or 1) - 1  # 转为 0 起的行索引
+            if grep:
+                max_matches = READ_FILE_MAX_MATCHES if limit is None else min(limit, READ_FILE_MAX_LINES)
+                matches, has_more = mapped.grep(grep, start_line=first_line, max_matches=max_matches)
+                result = {
+                    **base,
+                    "pattern": grep,
+                    "count": len(matches),
+                    "has_more": has_more,
+                    "content": "\n".join(f"{line + 1}: {text}" for line, text in matches)
+                }
+                if limit is not None and limit > READ_FILE_MAX_LINES and result["has_more"]:
+                    result["note"] = f"单次最多返回 {READ_FILE_MAX_LINES} 个匹配行，已截断；请用 offset 从后面的行继续查找"
+                return result
+            
+            count = READ_FILE_DEFAULT_LINES if limit is None else min(limit, READ_FILE_MAX_LINES)
+            if head is not None:
+                first_line = 0
+            elif from_end:
+                first_line = max(0, mapped.total_lines - count)
+            content, start, end = mapped.read_lines(first_line, count)
+            # start_line / end_line 为返回内容的首行与末行（从 1 开始，含末行）
+            result = {**base, "content": content, "start_line": start + 1, "end_line": end, "has_more": end < mapped.total_lines}
+            if not ranged:
+                result["note"] = f"文件较大，仅返回前 {end} 行；请用 offset/limit、tail 或 grep 读取其余部分"
+            elif limit is not None and limit > READ_FILE_MAX_LINES and (start > 0 if from_end else result["has_more"]):
+                result["note"] = f"单次最多读取 {READ_FILE_MAX_LINES} 行，已截断；请用 offset/limit 继续读取"
+            return result
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def write_file(file_path, content):
-    """写入文件"""
+def _get_file_index(root):
+    """获取（必要时创建）某个根目录的倒排索引"""
+    root = os.path.abspath(root)
+    with _file_indexes_lock:
+        index = _file_indexes.get(root)
+        if index is None:
+            state_path = None
+            if SEARCH_INDEX_DIR:
+                digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+                state_path = os.path.join(SEARCH_INDEX_DIR, f"{digest}.pkl")
+            index = _file_indexes[root] = FileIndex(
+                root,
+                extensions=SEARCH_FILES_EXTENSIONS,
+                max_file_bytes=SEARCH_FILES_MAX_BYTES,
+                state_path=state_path
+            )
+    return index
+
+
+def search_files(query, regex=False, path=None, max_results=10):
+    """基于倒排索引检索文件内容"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        return {"success": True, "message": f"成功写入文件: {file_path}"}
+        if not query:
+            return {"success": False, "error": "query 不能为空"}
+        root = path or SEARCH_FILES_ROOT
+        if not os.path.isdir(root):
+            return {"success": False, "error": f"目录不存在: {root}"}
+        
+        start = time.perf_counter()
+        index = _get_file_index(root)
+        changes = index.refresh()
+        if regex:
+            results = index.search_regex(query, max_results=max_results)
+        else:
+            results = index.search(query, max_results=max_results)
+        
+        return {
+            "success": True,
+            "query": query,
+            "root": index.root,
+            "count": len(results),
+            "results": results,
+            "indexed_files": index.stats()["files"],
+            "index_changes": changes,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+    except re.error as e:
+        return {"success": False, "error": f"正则表达式错误: {str(e)}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def text_to_speech(text, rate=150, volume=1.0):
-    """文字转语音（TTS）- 离线实现"""
+def analyze_code(path, max_issues=50, include_functions=False):
+    """代码质量分析：多进程解析 AST，未改动的文件直接使用缓存结果"""
     try:
-        engine = pyttsx3.init()
+        if not path or not os.path.exists(path):
+            return {"success": False, "error": f"路径不存在: {path}"}
         
-        # 设置语速
-        engine.setProperty('rate', rate)
+        start = time.perf_counter()
+        results, cache_stats = _code_analyzer.analyze(path)
+        summary = summarize(results, max_issues, include_functions)
+        return {
+            "success": True,
+            "path": path,
+            **summary,
+            "cache": cache_stats,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+    except Exception as e:
+        return {"success": False, "error": f"代码分析失败: {str(e)}"}
+
+
+def csv_stats(file_path, operation="describe", columns=None, column=None, by=None, agg="mean", k=10, ascending=False):
+    """CSV 统计分析"""
+    try:
+        start = time.perf_counter()
+        table, cached = _csv_store.load(file_path)
+        base = {"success": True, "file_path": file_path, "rows": table.rows, "cached": cached}
         
-        # 设置音量
-        engine.setProperty('volume', volume)
+        for name in [column, by] + list(columns or []):
+            if name and name not in table.columns:
+                return {"success": False, "error": f"列不存在: {name}，可用列: {table.columns}"}
         
-        # 播放语音
-        print(f"[TTS] 正在播放: {text[:50]}{'...' if len(text) > 50 else ''}")
-        engine.say(text)
-        engine.runAndWait()
+        if operation == "columns":
+            result = {"columns": [{"name": c, "type": table.column_type(c)} for c in table.columns]}
+        elif operation == "describe":
+            result = {"stats": {
+                c: table.describe_numeric(c) if table.column_type(c) == "numeric" else table.describe_text(c)
+                for c in (columns or table.columns)
+            }}
+        elif operation == "group_by":
+            if not by:
+                return {"success": False, "error": "group_by 需要指定 by 分组列"}
+            if column and table.column_type(column) != "numeric":
+                return {"success": False, "error": f"聚合列必须是数值列: {column}"}
+            groups = table.group_by(by, column, agg if column else "count")
+            sort_key = agg if column else "count"
+            groups.sort(key=lambda g: (g[sort_key] is None, g[sort_key]), reverse=not ascending)
+            result = {"by": by, "column": column, "agg": sort_key, "group_count": len(groups), "groups": groups[:k]}
+        elif operation == "top_k":
+            if not column:
+                return {"success": False, "error": "top_k 需要指定 column"}
+            result = {"column": column, "top": table.top_k(column, k, ascending)}
+        else:
+            return {"success": False, "error": f"未知操作: {operation}"}
+        
+        return {**base, **result, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        return {"success": False, "error": f"CSV 分析失败: {str(e)}"}
+
+
+def write_file(file_path=None, content=None, mode="overwrite", files=None):
+    """写入文件 - 覆盖写入通过临时文件 + 重命名原子提交，支持追加和批量写入"""
+    if files is None:
+        files = [{"file_path": file_path, "content": content, "mode": mode}]
+    
+    # 先校验全部参数，避免批量写入进行到一半才发现错误
+    if not isinstance(files, list) or not files:
+        return {"success": False, "error": "files 必须是非空列表"}
+    for item in files:
+        if not isinstance(item, dict):
+            return {"success": False, "error": "files 中的每一项都必须是包含 file_path 和 content 的对象"}
+        if not item.get("file_path") or item.get("content") is None:
+            return {"success": False, "error": "每个文件都需要 file_path 和 content"}
+        if item.get("mode", "overwrite") not in ("overwrite", "append"):
+            return {"success": False, "error": f"不支持的写入模式: {item.get('mode')}"}
+    
+    staged = {}  # 下标 -> 临时文件路径
+    try:
+        # 第一阶段：覆盖写入的内容全部写到临时文件
+        for index, item in enumerate(files):
+            if item.get("mode", "overwrite") == "overwrite":
+                staged[index] = _stage_file(item["file_path"], item["content"])
+        
+        # 第二阶段：按列表顺序提交（覆盖写入重命名，追加写入直接追加），同一文件的多次写入按给定顺序生效
+        written = []
+        for index, item in enumerate(files):
+            if index in staged:
+                os.replace(staged.pop(index), item["file_path"])
+            else:
+                _append_file(item["file_path"], item["content"])
+            written.append({"file_path": item["file_path"], "mode": item.get("mode", "overwrite"), "chars": len(item["content"])})
+    except Exception as e:
+        for tmp_path in staged.values():
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return {"success": False, "error": str(e)}
+    
+    if len(written) == 1:
+        action = "追加" if written[0]["mode"] == "append" else "写入"
+        return {"success": True, "message": f"成功{action}文件: {written[0]['file_path']}"}
+    return {"success": True, "message": f"成功写入 {len(written)} 个文件", "files": written}
+
+
+def _stage_file(file_path, content):
+    """把内容写入同目录下的临时文件并落盘，返回临时文件路径"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def _append_file(file_path, content):
+    """追加写入并落盘"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    with open(file_path, 'a', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def text_to_speech(text, rate=150, volume=1.0, voice=None):
+    """文字转语音（TTS）- 离线实现，短语音频命中缓存时直接播放"""
+    try:
+        voice = voice or TTS_VOICE
+        tracer.info("[TTS] 正在播放: %s%s", text[:50], "..." if len(text) > 50 else "")
+        
+        cached = False
+        audio = None
+        if _tts_cache_usable and len(text) <= TTS_CACHE_MAX_TEXT_CHARS and _get_pyaudio() is not None:
+            key = TTSCache.make_key(text, rate, volume, voice)
+            audio = _tts_cache.get(key)
+            cached = audio is not None
+            if audio is None:
+                audio = _render_speech(text, rate, volume, voice)
+                if audio is not None:
+                    _tts_cache.put(key, *audio)
+        
+        if audio is not None:
+            _play_pcm(*audio)
+        else:
+            # 长文本或渲染失败：直接朗读
+            engine = _init_tts_engine(rate, volume, voice)
+            engine.say(text)
+            engine.runAndWait()
         
         return {
             "success": True,
             "message": f"已成功播放语音",
             "text": text,
             "rate": rate,
-            "volume": volume
+            "volume": volume,
+            "cached": cached
         }
     except Exception as e:
         return {
@@ -228,6 +963,77 @@ def text_to_speech(text, rate=150, volume=1.0):
         }
 
 
+def get_tts_cache_stats():
+    """返回语音缓存命中率统计"""
+    if _tts_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_tts_cache.stats()}
+
+
+def _init_tts_engine(rate, volume, voice):
+    """初始化 TTS 引擎并设置语速、音量、音色"""
+    engine = pyttsx3.init()
+    engine.setProperty('rate', rate)
+    engine.setProperty('volume', volume)
+    if voice:
+        engine.setProperty('voice', voice)
+    return engine
+
+
+def _render_speech(text, rate, volume, voice):
+    """把文本合成为 WAV 并读回 PCM；失败时返回 None，引擎输出非 WAV 格式（如 macOS 的 AIFF）时关闭缓存"""
+    global _tts_cache_usable
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        engine = _init_tts_engine(rate, volume, voice)
+        engine.save_to_file(text, path)
+        engine.runAndWait()
+        return read_wav(path)
+    except (wave.Error, EOFError) as e:
+        _tts_cache_usable = False
+        tracer.warning("[TTS] 引擎输出的不是 WAV，关闭语音缓存: %s", e)
+        return None
+    except Exception as e:
+        tracer.warning("[TTS] 渲染音频失败，改为直接播放: %s", e)
+        return None
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _get_pyaudio():
+    """首次调用时导入 pyaudio 并创建播放实例；未安装时关闭语音缓存并返回 None"""
+    global _pyaudio, _tts_cache_usable
+    if _pyaudio is None:
+        try:
+            import pyaudio
+        except ImportError:
+            _tts_cache_usable = False
+            tracer.warning("[TTS] 未安装 pyaudio，无法播放缓存的音频，改为直接朗读")
+            return None
+        _pyaudio = pyaudio.PyAudio()
+    return _pyaudio
+
+
+def _play_pcm(params, frames):
+    """通过 PyAudio 播放内存中的 PCM"""
+    audio = _get_pyaudio()
+    
+    channels, sample_width, frame_rate = params
+    stream = audio.open(
+        format=audio.get_format_from_width(sample_width),
+        channels=channels,
+        rate=frame_rate,
+        output=True
+    )
+    try:
+        stream.write(frames)
+    finally:
+        stream.stop_stream()
+        stream.close()
+
+
 def speech_to_text(timeout=5, language="zh-CN"):
     """语音转文字（STT）"""
     try:
@@ -236,23 +1042,38 @@ def speech_to_text(timeout=5, language="zh-CN"):
         with sr.Microphone() as source:
             print(f"[STT] 请说话... (超时时间: {timeout}秒)")
             
-            # 调整环境噪音
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            
-            # 监听语音
-            audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=10)
+            if VAD_ENABLED:
+                # VAD 端点检测：说完后在拖尾时间内结束，并裁掉首尾静音
+                pcm = listen_with_vad(
+                    source,
+                    timeout=timeout,
+                    hangover_ms=VAD_HANGOVER_MS,
+                    frame_ms=VAD_FRAME_MS,
+                    max_phrase_seconds=VAD_MAX_PHRASE_SECONDS
+                )
+                if not pcm:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                audio = sr.AudioData(pcm, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            else:
+                # 调整环境噪音
+                recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                
+                # 监听语音
+                audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=VAD_MAX_PHRASE_SECONDS)
         
-        print("[STT] 正在识别...")
+        # 识别后端由配置决定（google 需要网络，vosk / sphinx 可离线）
+        backend = get_stt_backend()
+        tracer.debug("[STT] 正在识别... (%s)", backend.name)
         
-        # 使用 Google 语音识别（免费，需要网络）
-        text = recognizer.recognize_google(audio, language=language)
+        text = backend.recognize(audio, language=language)
         
-        print(f"[STT] 识别结果: {text}")
+        tracer.info("[STT] 识别结果: %s", text)
         
         return {
             "success": True,
             "text": text,
-            "language": language
+            "language": language,
+            "backend": backend.name
         }
         
     except sr.WaitTimeoutError:
@@ -0,0 +1,199 @@
+"""
+结构化追踪 - 以 span 记录一轮对话、每次迭代、LLM 调用与工具调用的耗时和属性，导出为 JSONL；
+日志按级别过滤且惰性格式化，未启用的级别不产生任何字符串拼接开销
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import random
+import threading
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class lazy_json:
+    """延迟序列化：只有日志真正输出时才调用 json.dumps"""
+
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj, indent=None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.obj, ensure_ascii=False, indent=self.indent, default=str)
+
+
+class Span:
+    """一段计时区间；结束时写入导出文件"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attrs", "events",
+                 "start", "_t0", "status")
+
+    def __init__(self, tracer, name, trace_id, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.events = []
+        self.status = "ok"
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._t0) * 1000
+        if exc_type is not None and self.status == "ok":
+            self.status = "error"
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._pop(self)
+        self.tracer._export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration_ms, 3),
+            "status": self.status,
+            "pid": os.getpid(),
+            "attrs": self.attrs,
+            "events": self.events
+        })
+        return False
+
+
+class _NullSpan:
+    """未采样或级别未启用时的空 span，子 span 同样不记录"""
+
+    __slots__ = ("tracer", "status")
+    trace_id = span_id = None
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.status = "ok"
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer._pop(self)
+        return False
+
+
+class Tracer:
+    """span 与分级日志；同一线程内的 span 自动嵌套"""
+
+    def __init__(self, path=None, level="info", sample_rate=1.0, console=True, flush_every=50):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._buffer = []
+        self.configure(path, level, sample_rate, console, flush_every)
+        atexit.register(self.flush)
+
+    def configure(self, path=None, level="info", sample_rate=1.0, console=True, flush_every=50):
+        """
+        Args:
+            path: JSONL 导出路径，None 表示不导出
+            level: 最低输出级别（debug / info / warning / error），同时决定记录哪些 span
+            sample_rate: 按一次完整调用链采样的比例，0~1
+            console: 是否把日志打印到终端
+        """
+        self.flush()
+        self.path = path
+        self.level = LEVELS[level.lower()] if isinstance(level, str) else level
+        self.sample_rate = sample_rate
+        self.console = console
+        self.flush_every = flush_every
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def span(self, name, level="info", **attrs):
+        """开始一个 span（用作 with 语句）；根 span 决定整条调用链是否采样"""
+        parent = self.current()
+        if isinstance(parent, _NullSpan) or not self.enabled(level):
+            return _NullSpan(self)
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return _NullSpan(self)
+            return Span(self, name, uuid.uuid4().hex, None, attrs)
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def current(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    def log(self, level, message, *args):
+        """分级日志：级别未启用时直接返回，不做格式化"""
+        if LEVELS[level] < self.level:
+            return
+        text = message % args if args else message
+        if self.console:
+            print(text)
+        span = self.current()
+        if isinstance(span, Span):
+            span.events.append({"t": round(time.time(), 6), "level": level, "message": text.strip()})
+
+    def debug(self, message, *args):
+        self.log("debug", message, *args)
+
+    def info(self, message, *args):
+        self.log("info", message, *args)
+
+    def warning(self, message, *args):
+        self.log("warning", message, *args)
+
+    def error(self, message, *args):
+        self.log("error", message, *args)
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records or not self.path:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def _push(self, span):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _export(self, record):
+        if not self.path:
+            return
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.flush_every
+        # 根 span 结束或缓冲已满时写盘
+        if full or record["parent_id"] is None:
+            self.flush()
+
+
+# 进程内共享的追踪器，由入口脚本根据配置调用 tracer.configure()
+tracer = Tracer()
@@ -0,0 +1,122 @@
+"""
+语音合成缓存 - 按 (文本, 语速, 音量, 音色) 缓存合成好的 PCM，内存 LRU + 磁盘两级
+"""
+import os
+import hashlib
+import threading
+import wave
+from collections import OrderedDict
+
+
+class TTSCache:
+    """按字节数限制大小的 LRU 缓存，淘汰的条目仍保留在磁盘层"""
+
+    def __init__(self, max_bytes, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()  # key -> (params, frames)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(text, rate, volume, voice):
+        """生成缓存键"""
+        raw = f"{text}\x00{rate}\x00{float(volume):.3f}\x00{voice or ''}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """查找缓存，返回 (params, frames)；params 为 (声道数, 采样宽度, 采样率)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._load_from_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry
+
+    def put(self, key, params, frames):
+        """写入缓存（内存 + 磁盘）"""
+        entry = (tuple(params), frames)
+        with self._lock:
+            self._store(key, entry)
+        self._save_to_disk(key, entry)
+
+    def stats(self):
+        """命中率统计"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def _store(self, key, entry):
+        """放入内存层并按字节上限淘汰最久未用的条目（需持有锁）"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        if len(entry[1]) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += len(entry[1])
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted[1])
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            return read_wav(self._path(key))
+        except (OSError, wave.Error, EOFError):
+            return None
+
+    def _save_to_disk(self, key, entry):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            write_wav(tmp_path, *entry)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def read_wav(path):
+    """读取 WAV 文件，返回 ((声道数, 采样宽度, 采样率), PCM 字节)"""
+    with wave.open(path, "rb") as wf:
+        params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate())
+        frames = wf.readframes(wf.getnframes())
+    return params, frames
+
+
+def write_wav(path, params, frames):
+    """写出 WAV 文件"""
+    channels, sample_width, frame_rate = params
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(frame_rate)
+        wf.writeframes(frames)
@@ -0,0 +1,139 @@
+"""
+流式语音合成 - 将 LLM 流式输出按句切分，逐句送入 TTS 引擎
+"""
+import re
+import time
+import queue
+import threading
+
+
+# 句末标点（中英文），允许后面紧跟引号/括号等收尾符号
+# 英文句点仅在其后出现空白时才视为句末，避免把 3.14、v1.2 切开
+_SENTENCE_BOUNDARY = re.compile(r'(?:[。！？!?；;…\n]+|\.(?=\s))["”’」』)）\]]*')
+
+# 超长无句末标点时，退而在这些符号处切分
+_SOFT_BREAKS = "，,、：:"
+
+
+class SentenceSplitter:
+    """增量句子切分器：喂入文本片段，吐出完整句子"""
+
+    def __init__(self, min_chars=4, max_chars=120):
+        self.min_chars = min_chars  # 过短的片段（如列表序号 "1."）并入下一句
+        self.max_chars = max_chars  # 缓冲超过此长度时在软断点处强制切分
+        self._buffer = ""
+
+    def feed(self, delta):
+        """追加一段流式文本，返回已完整的句子列表"""
+        if not delta:
+            return []
+
+        self._buffer += delta
+        sentences = []
+
+        pos = 0
+        while True:
+            match = _SENTENCE_BOUNDARY.search(self._buffer, pos)
+            if not match:
+                break
+            sentence = self._buffer[:match.end()].strip()
+            if len(sentence) < self.min_chars:
+                pos = match.end()
+                continue
+            sentences.append(sentence)
+            self._buffer = self._buffer[match.end():]
+            pos = 0
+
+        if len(self._buffer) > self.max_chars:
+            cut = max(self._buffer.rfind(ch) for ch in _SOFT_BREAKS)
+            if cut > 0:
+                sentences.append(self._buffer[:cut + 1].strip())
+                self._buffer = self._buffer[cut + 1:]
+
+        return sentences
+
+    def flush(self):
+        """流结束时取出剩余文本"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+class StreamingSpeaker:
+    """边生成边朗读：后台线程按顺序播放已切分出的句子"""
+
+    def __init__(self, speak, min_chars=4, max_chars=120):
+        """
+        Args:
+            speak: 朗读单句的函数，接收文本，返回 {"success": bool, ...}
+        """
+        self.speak = speak
+        self.splitter = SentenceSplitter(min_chars=min_chars, max_chars=max_chars)
+        self._queue = queue.Queue()
+        self._started_at = time.time()
+        self._first_audio_at = None
+        self._spoken = []
+        self._errors = []
+        self._cancelled = False
+        self._worker = threading.Thread(target=self._run, daemon=True, name="tts")
+        self._worker.start()
+
+    def feed(self, delta):
+        """接收 LLM 的增量文本"""
+        for sentence in self.splitter.feed(delta):
+            self._queue.put(sentence)
+
+    def finish(self):
+        """冲刷剩余文本并等待全部朗读完成"""
+        for sentence in self.splitter.flush():
+            self._queue.put(sentence)
+        self._queue.put(None)
+        self._worker.join()
+
+        first_audio_latency = None
+        if self._first_audio_at is not None:
+            first_audio_latency = round(self._first_audio_at - self._started_at, 3)
+
+        if self._errors:
+            return {
+                "success": False,
+                "error": self._errors[0],
+                "sentences": len(self._spoken),
+                "first_audio_latency": first_audio_latency
+            }
+        return {
+            "success": True,
+            "text": "".join(self._spoken),
+            "sentences": len(self._spoken),
+            "first_audio_latency": first_audio_latency
+        }
+
+    def cancel(self):
+        """丢弃尚未朗读的句子，等待当前句播放结束"""
+        self._cancelled = True
+        self.splitter.flush()
+        return self.finish()
+
+    def _run(self):
+        """后台朗读线程"""
+        # Windows 下 SAPI 需要在每个线程初始化 COM
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pass
+
+        while True:
+            sentence = self._queue.get()
+            if sentence is None:
+                break
+            if self._errors or self._cancelled:
+                # 已出错或已取消则丢弃后续句子，但仍需消费队列直到结束标记
+                continue
+            if self._first_audio_at is None:
+                self._first_audio_at = time.time()
+            result = self.speak(sentence)
+            if result.get("success"):
+                self._spoken.append(sentence)
+            else:
+                self._errors.append(result.get("error", "语音播放失败"))
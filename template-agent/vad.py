@@ -0,0 +1,142 @@
+"""
+语音端点检测（VAD）- 基于短时能量与过零率的帧级检测
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """帧级语音活动检测器，输入 16 位单声道 PCM"""
+
+    def __init__(self, sample_rate, sample_width=2, frame_ms=30,
+                 energy_ratio=3.0, min_energy=300.0, zcr_max=0.35):
+        if sample_width != 2:
+            raise ValueError("仅支持 16 位 PCM")
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.frame_ms = frame_ms
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.frame_bytes = self.frame_samples * sample_width
+        self.energy_ratio = energy_ratio  # 能量需高于噪声底的倍数
+        self.min_energy = min_energy      # 绝对能量下限（RMS）
+        self.zcr_max = zcr_max            # 过零率上限，高于此值且能量不高时视为噪声
+        self.noise_floor = 0.0
+
+    @property
+    def threshold(self):
+        """当前能量判决门限"""
+        return max(self.min_energy, self.noise_floor * self.energy_ratio)
+
+    def _frames(self, pcm):
+        """把 PCM 字节切成 (帧数, 帧长) 的浮点矩阵，丢弃不足一帧的尾部"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = len(samples) // self.frame_samples
+        return samples[:count * self.frame_samples].reshape(count, self.frame_samples).astype(np.float32)
+
+    def calibrate(self, pcm):
+        """用一段环境噪声估计噪声底"""
+        frames = self._frames(pcm)
+        if len(frames):
+            self.noise_floor = float(np.median(np.sqrt(np.mean(frames ** 2, axis=1))))
+
+    def classify(self, pcm):
+        """逐帧判断是否为语音，返回布尔数组"""
+        frames = self._frames(pcm)
+        if not len(frames):
+            return np.zeros(0, dtype=bool)
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+        threshold = self.threshold
+        # 能量显著高于门限时直接判为语音；接近门限时要求过零率不过高（排除嘶嘶噪声）
+        return (rms > threshold * 2) | ((rms > threshold) & (zcr < self.zcr_max))
+
+    def trim(self, pcm, pad_ms=100):
+        """裁掉首尾静音，保留少量边缘避免截断辅音"""
+        speech = self.classify(pcm)
+        indices = np.flatnonzero(speech)
+        if not len(indices):
+            return b""
+        pad = int(pad_ms / self.frame_ms)
+        start = max(0, indices[0] - pad) * self.frame_bytes
+        end = min(len(speech), indices[-1] + 1 + pad) * self.frame_bytes
+        return pcm[start:end]
+
+
+class Endpointer:
+    """流式端点检测：持续喂入音频块，在语音结束后的拖尾时间内给出结束信号"""
+
+    def __init__(self, vad, hangover_ms=500, pre_roll_ms=150, max_phrase_seconds=10):
+        self.vad = vad
+        self.hangover_frames = max(1, int(hangover_ms / vad.frame_ms))
+        self.max_frames = int(max_phrase_seconds * 1000 / vad.frame_ms)
+        self._pending = b""
+        self._pre_roll = deque(maxlen=max(1, int(pre_roll_ms / vad.frame_ms)))
+        self._utterance = []
+        self._silence_run = 0
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk):
+        """喂入任意长度的 PCM，返回是否已检测到语音结束"""
+        if self.done:
+            return True
+
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self.vad.frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return False
+
+        flags = self.vad.classify(data[:usable])
+        for i, is_speech in enumerate(flags):
+            frame = data[i * self.vad.frame_bytes:(i + 1) * self.vad.frame_bytes]
+            if not self.started:
+                if is_speech:
+                    self.started = True
+                    self._utterance.extend(self._pre_roll)
+                    self._utterance.append(frame)
+                else:
+                    self._pre_roll.append(frame)
+                continue
+
+            self._utterance.append(frame)
+            self._silence_run = 0 if is_speech else self._silence_run + 1
+            if self._silence_run >= self.hangover_frames or len(self._utterance) >= self.max_frames:
+                self.done = True
+                return True
+        return False
+
+    def utterance(self, tail_ms=100):
+        """返回检测到的语音段，去掉拖尾静音只保留少量尾音"""
+        keep_tail = int(tail_ms / self.vad.frame_ms)
+        drop = max(0, self._silence_run - keep_tail)
+        frames = self._utterance[:len(self._utterance) - drop] if drop else self._utterance
+        return b"".join(frames)
+
+
+def listen_with_vad(source, timeout=5, hangover_ms=500, frame_ms=30,
+                    max_phrase_seconds=10, calibration_ms=300):
+    """从 speech_recognition 的 Microphone 读取音频并用 VAD 判定端点
+
+    Returns:
+        裁剪后的 PCM 字节；超时未检测到语音时返回 None
+    """
+    vad = VoiceActivityDetector(source.SAMPLE_RATE, source.SAMPLE_WIDTH, frame_ms=frame_ms)
+
+    # 先采集一小段环境噪声估计噪声底
+    calibration_bytes = int(source.SAMPLE_RATE * calibration_ms / 1000) * source.SAMPLE_WIDTH
+    noise = b""
+    while len(noise) < calibration_bytes:
+        noise += source.stream.read(source.CHUNK)
+    vad.calibrate(noise)
+
+    endpointer = Endpointer(vad, hangover_ms=hangover_ms, max_phrase_seconds=max_phrase_seconds)
+    started_at = time.time()
+    while not endpointer.feed(source.stream.read(source.CHUNK)):
+        if not endpointer.started and time.time() - started_at > timeout:
+            return None
+
+    # 预录部分与拖尾可能含静音，按帧再裁一次首尾，减少送去识别的音频
+    return vad.trim(endpointer.utterance())
@@ -0,0 +1,252 @@
+"""
+网页抓取 - 连接池复用、按主机限流的并发抓取，带 ETag/Last-Modified 重新验证的磁盘缓存
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# 不包含正文的标签，其内部文本整体跳过
+_SKIP_TAGS = {"script", "style", "noscript", "svg", "nav", "header", "footer", "aside", "form", "iframe", "template"}
+# 块级标签：遇到时断开文本段落
+_BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "td", "th",
+               "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "table", "dd", "dt"}
+# 正文容器：若其中文本足够多则只取这部分
+_MAIN_TAGS = {"article", "main"}
+_MIN_MAIN_CHARS = 200
+
+
+class _TextExtractor(HTMLParser):
+    """从 HTML 中提取标题与正文段落"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.blocks = []       # 全部文本段落
+        self.main_blocks = []  # article/main 内的文本段落
+        self._current = []
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _MAIN_TAGS:
+            self._main_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        if tag in _BLOCK_TAGS:
+            self._flush()
+        if tag in _MAIN_TAGS and self._main_depth:
+            self._main_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._current.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        self._current = []
+        if text:
+            self.blocks.append(text)
+            if self._main_depth:
+                self.main_blocks.append(text)
+
+    def text(self):
+        self._flush()
+        main = "\n".join(self.main_blocks)
+        return main if len(main) >= _MIN_MAIN_CHARS else "\n".join(self.blocks)
+
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def _decode(raw, encoding=None):
+    """解码响应体：优先使用声明的字符集，其次 <meta charset>，再依次尝试 UTF-8、GB18030"""
+    if not encoding:
+        match = _META_CHARSET.search(raw[:4096])
+        if match:
+            encoding = match.group(1).decode("ascii")
+    candidates = [encoding] if encoding else []
+    for candidate in candidates + ["utf-8", "gb18030"]:
+        try:
+            return raw.decode(candidate)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return raw.decode("utf-8", errors="replace")
+
+
+def extract_text(html):
+    """提取网页标题和正文文本"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join(parser.title.split()), parser.text()
+
+
+class WebFetcher:
+    """带连接池、按主机并发限制和磁盘缓存的抓取器"""
+
+    def __init__(self, cache_dir=None, fresh_seconds=600, per_host_limit=2, max_workers=8,
+                 timeout=15, max_download_bytes=2 * 1024 * 1024, user_agent="Mozilla/5.0 (compatible; MetaAgent/1.0)"):
+        self.cache_dir = cache_dir
+        self.fresh_seconds = fresh_seconds
+        self.per_host_limit = per_host_limit
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_download_bytes = max_download_bytes
+
+        # keep-alive 连接池，按主机复用 TCP/TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, url, max_chars=8000):
+        """抓取单个 URL，返回提取后的正文（截断到 max_chars）"""
+        parts = urlsplit(url or "")
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            return {"success": False, "url": url, "error": "仅支持 http/https URL"}
+
+        try:
+            page, cache_status = self._get(url, parts.netloc.lower())
+        except requests.RequestException as e:
+            return {"success": False, "url": url, "error": f"抓取失败: {str(e)}"}
+
+        if page["status"] >= 400:
+            return {"success": False, "url": url, "error": f"HTTP {page['status']}"}
+
+        content_type = page.get("content_type", "")
+        body = page["body"]
+        if "html" in content_type or body.lstrip()[:1] == "<":
+            title, text = extract_text(body)
+        elif content_type.startswith("text/") or "json" in content_type or "xml" in content_type:
+            title, text = "", body
+        else:
+            return {"success": False, "url": url, "error": f"不支持的内容类型: {content_type}"}
+
+        return {
+            "success": True,
+            "url": page["url"],
+            "title": title,
+            "content": text[:max_chars],
+            "length": len(text),
+            "truncated": len(text) > max_chars,
+            "cache": cache_status
+        }
+
+    def fetch_many(self, urls, max_chars=8000):
+        """并发抓取多个 URL，结果顺序与输入一致"""
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = list(dict.fromkeys(u for u in urls or [] if u))
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return list(pool.map(lambda u: self.fetch(u, max_chars), urls))
+
+    def _slot(self, host):
+        """获取主机级并发信号量"""
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def _get(self, url, host):
+        """带缓存的 GET：新鲜缓存直接返回，过期缓存用条件请求重新验证"""
+        cached = self._load(url)
+        if cached and time.time() - cached["fetched_at"] < self.fresh_seconds:
+            return cached, "hit"
+
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        with self._slot(host):
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304 and cached:
+                    cached["fetched_at"] = time.time()
+                    self._save(url, cached)
+                    return cached, "revalidated"
+
+                raw = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    raw += chunk
+                    if len(raw) >= self.max_download_bytes:
+                        del raw[self.max_download_bytes:]
+                        break
+
+                encoding = response.encoding
+                if encoding and encoding.lower() == "iso-8859-1":
+                    # requests 对未声明字符集的 text/* 默认 ISO-8859-1，改为按内容判断
+                    encoding = None
+
+                page = {
+                    "url": response.url,
+                    "status": response.status_code,
+                    "content_type": response.headers.get("Content-Type", "").lower(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time(),
+                    "body": _decode(bytes(raw), encoding)
+                }
+
+        if page["status"] < 400:
+            self._save(url, page)
+        return page, "miss"
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, url, page):
+        if not self.cache_dir:
+            return
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(page, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
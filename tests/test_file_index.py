@@ -0,0 +1,93 @@
+"""
+file_index 测试 - 验证增量更新（新增、修改、删除、变为二进制、超出大小上限）与正则检索的候选筛选、行号
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "template-agent"))
+from file_index import FileIndex
+
+
+def _write(path, data, mtime=None):
+    """写入文件；指定 mtime 以免同一时刻内的修改被 mtime/大小检查跳过"""
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode, **({} if isinstance(data, bytes) else {"encoding": "utf-8"})) as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _files(results):
+    return {r["file"] for r in results}
+
+
+@pytest.fixture
+def index(tmp_path):
+    _write(tmp_path / "a.py", "def alpha():\n    return 'apple'\n", 1000)
+    _write(tmp_path / "b.txt", "banana split\n倒排索引测试\n", 1000)
+    index = FileIndex(str(tmp_path), max_file_bytes=200, refresh_interval=0)
+    assert index.refresh(force=True) == {"added": 2, "updated": 0, "removed": 0}
+    return index
+
+
+def test_add_and_search(index, tmp_path):
+    assert _files(index.search("apple")) == {"a.py"}
+    assert _files(index.search("倒排")) == {"b.txt"}
+
+    _write(tmp_path / "c.md", "cherry apple\n", 1000)
+    assert index.refresh(force=True)["added"] == 1
+    assert _files(index.search("apple")) == {"a.py", "c.md"}
+
+
+def test_unchanged_files_are_skipped(index):
+    assert index.refresh(force=True) == {"added": 0, "updated": 0, "removed": 0}
+
+
+def test_modify(index, tmp_path):
+    _write(tmp_path / "a.py", "def alpha():\n    return 'apricot'\n", 2000)
+    assert index.refresh(force=True)["updated"] == 1
+    assert index.search("apple") == []
+    assert _files(index.search("apricot")) == {"a.py"}
+
+
+def test_delete(index, tmp_path):
+    os.remove(tmp_path / "b.txt")
+    assert index.refresh(force=True)["removed"] == 1
+    assert index.search("banana") == []
+    assert index.stats()["files"] == 1
+
+
+def test_become_binary(index, tmp_path):
+    _write(tmp_path / "b.txt", b"banana\0\x01\x02", 2000)
+    assert index.refresh(force=True)["updated"] == 1
+    assert index.search("banana") == []
+    assert index.search_regex("banana") == []
+    assert index.stats()["files"] == 1
+    # 未改动的二进制文件不再重新读取
+    assert index.refresh(force=True) == {"added": 0, "updated": 0, "removed": 0}
+
+
+def test_grow_past_limit(index, tmp_path):
+    _write(tmp_path / "b.txt", "banana " * 100, 2000)
+    assert index.refresh(force=True)["removed"] == 1
+    assert index.search("banana") == []
+    assert index.stats()["files"] == 1
+
+
+def test_regex_line_numbers_match_newlines(index, tmp_path):
+    # \x0c 等字符不作为换行，行号与 read_file 的行偏移一致
+    _write(tmp_path / "d.txt", "first\x0cline\nsecond line\nneedle here\n", 1000)
+    index.refresh(force=True)
+    result = index.search_regex(r"needle \w+")
+    assert result == [{"file": "d.txt", "score": 1, "matches": [{"line": 3, "text": "needle here"}]}]
+    assert index.search("needle")[0]["matches"] == [{"line": 3, "text": "needle here"}]
+
+
+def test_regex_prefilter(index, tmp_path):
+    # 文件内容与索引不一致时可以看出只匹配了候选文件：未刷新的新内容不会被找到
+    _write(tmp_path / "a.py", "def alpha():\n    return 'apple'\n# banana split\n", 1000)
+    assert _files(index.search_regex(r"\bbanana split\b")) == {"b.txt"}
+    # 没有必然出现的字面词时逐个匹配所有文件
+    assert _files(index.search_regex(r"ban+ana|nothing")) == {"a.py", "b.txt"}
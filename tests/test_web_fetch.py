@@ -0,0 +1,107 @@
+"""
+web_fetch 测试 - 在本地 HTTP 服务上验证缓存重新验证、错误状态与中文编码
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "template-agent"))
+from web_fetch import WebFetcher
+
+
+ETAG = '"v1"'
+PAGES = {
+    "/page": ("text/html; charset=utf-8", "<html><title>测试页</title><body><p>正文内容</p></body></html>".encode("utf-8")),
+    "/gbk": ("text/html", '<html><meta charset="gbk"><title>中文</title><p>国标编码的正文</p></html>'.encode("gbk")),
+    "/gbk-undeclared": ("text/plain", "没有声明字符集的国标编码文本".encode("gbk")),
+    "/data": ("application/json", b'{"ok": true}'),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        content_type, body = PAGES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """在随机端口启动本地 HTTP 服务，返回基础 URL"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    _Handler.requests_seen = []
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_and_cache_hit(server, tmp_path):
+    fetcher = WebFetcher(cache_dir=str(tmp_path), fresh_seconds=600)
+    first = fetcher.fetch(server + "/page")
+    assert first["success"] and first["cache"] == "miss"
+    assert first["title"] == "测试页" and "正文内容" in first["content"]
+
+    second = fetcher.fetch(server + "/page")
+    assert second["cache"] == "hit" and second["content"] == first["content"]
+    assert len(_Handler.requests_seen) == 1
+
+
+def test_stale_cache_is_revalidated_with_etag(server, tmp_path):
+    fetcher = WebFetcher(cache_dir=str(tmp_path), fresh_seconds=0)
+    fetcher.fetch(server + "/page")
+    again = fetcher.fetch(server + "/page")
+    assert again["success"] and again["cache"] == "revalidated"
+    assert "正文内容" in again["content"]
+    assert _Handler.requests_seen[-1] == ("/page", ETAG)
+
+
+def test_not_found(server, tmp_path):
+    fetcher = WebFetcher(cache_dir=str(tmp_path))
+    result = fetcher.fetch(server + "/missing")
+    assert not result["success"] and result["error"] == "HTTP 404"
+    assert not os.listdir(tmp_path)  # 错误响应不缓存
+
+
+def test_gbk_pages(server):
+    fetcher = WebFetcher()
+    declared = fetcher.fetch(server + "/gbk")
+    assert declared["title"] == "中文" and "国标编码的正文" in declared["content"]
+    undeclared = fetcher.fetch(server + "/gbk-undeclared")
+    assert undeclared["content"] == "没有声明字符集的国标编码文本"
+
+
+def test_invalid_url():
+    result = WebFetcher().fetch("ftp://example.com/file")
+    assert not result["success"]
+
+
+def test_fetch_many_keeps_order_and_accepts_single_url(server):
+    fetcher = WebFetcher()
+    pages = fetcher.fetch_many([server + "/data", server + "/page", server + "/data"])
+    assert [p["url"] for p in pages] == [server + "/data", server + "/page"]
+    assert pages[0]["content"] == '{"ok": true}'
+
+    single = fetcher.fetch_many(server + "/page")
+    assert len(single) == 1 and single[0]["success"]